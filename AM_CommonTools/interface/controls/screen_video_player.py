@@ -97,6 +97,9 @@ class ScreenVideoPlayer(ScreenElement):
     def pause(self):
         self.video_player.pause()
 
+    def toggle_play_reverse(self):
+        self.video_player.set_play_reverse(not self.video_player.play_reverse)
+
     def set_player_frame(self, frame, notify_listeners):
         self.video_player.set_position_frame(frame, notify_listeners)
 
@@ -24,10 +24,15 @@ from AccessMath.annotation.drawing_info import DrawingInfo
 from AccessMath.annotation.video_object import VideoObject
 from AccessMath.annotation.video_object_location import VideoObjectLocation
 from AccessMath.annotation.lecture_annotation import LectureAnnotation
+from AccessMath.annotation.lecture_annotation_auto_saver import LectureAnnotationAutoSaver
+from AccessMath.annotation.lecture_annotation_journal import LectureAnnotationJournal
+from AccessMath.annotation.video_object_frame_cache import VideoObjectFrameCache
 
 
 class GTContentAnnotator(Screen):
     EditGroupingTime = 5.0
+    # keep object key-frames on array-based stores (recommended for long lectures)
+    ColumnarLocations = False
 
     def __init__(self, size, video_metadadata, db_name, lecture_title, output_prefix, forced_resolution=None):
         Screen.__init__(self, "Ground Truth Annotation Interface", size)
@@ -156,6 +161,8 @@ class GTContentAnnotator(Screen):
         self.redo_button = None
         self.undo_button = None
         self.auto_save_timer = None
+        # auto-saves are written on a background thread
+        self.auto_saver = LectureAnnotationAutoSaver()
 
         self.create_base_controllers()
         self.create_video_controls()
@@ -179,6 +186,10 @@ class GTContentAnnotator(Screen):
         self.undo_stack = []
         self.redo_stack = []
 
+        # locations of the objects during playback, and objects currently drawn on the canvas
+        self.object_frame_cache = VideoObjectFrameCache()
+        self.canvas_drawn_objects = set()
+
         canvas_bbox = (self.canvas.position[0], self.canvas.position[1], self.canvas.width, self.canvas.height)
         player_bbox = (self.player.position[0], self.player.position[1], self.player.width, self.player.height)
         render_bbox = (self.player.render_location[0], self.player.render_location[1],
@@ -189,7 +200,7 @@ class GTContentAnnotator(Screen):
         # Load/Create annotation file
         if os.path.exists(self.output_filename):
             print("Saved file exists. Loading ...")
-            self.lecture = LectureAnnotation.Load(self.output_filename, True)
+            self.lecture = LectureAnnotation.Load(self.output_filename, True, GTContentAnnotator.ColumnarLocations)
 
             if not drawing_info == self.lecture.drawing_info:
                 print("Original Drawing parameters")
@@ -224,12 +235,19 @@ class GTContentAnnotator(Screen):
                 print("Original video length will be overridden on saving")
                 self.lecture.total_frames = self.player.video_player.total_frames
 
-            self.load_saved_data_into_GUI()
-
         else:
             total_frames = self.player.video_player.total_frames
             self.lecture = LectureAnnotation(db_name, lecture_title, self.output_filename, self.video_files,
                                              total_frames, drawing_info)
+            self.lecture.columnar_locations = GTContentAnnotator.ColumnarLocations
+
+        # recover the edits that were not saved (e.g. after a crash), then keep journaling new edits
+        self.journal = LectureAnnotationJournal.FromAnnotationFile(self.output_filename)
+        if self.journal.replay(self.lecture, self.output_filename) > 0:
+            self.changes_saved = False
+        self.journal.start(self.output_filename)
+
+        self.load_saved_data_into_GUI()
 
         self.lecture.set_frame_resolution(self.player.video_player.width, self.player.video_player.height)
 
@@ -793,14 +811,8 @@ class GTContentAnnotator(Screen):
 
     def auto_save_timer_tick(self, timer):
         if not self.changes_saved:
-            # auto-save .... to back up file
-            xml_data = self.lecture.generate_data_xml()
-
-            out_file = open(self.output_filename + ".bak", "w")
-            out_file.write(xml_data)
-            out_file.close()
-
-            print("Auto-Backed up to: " + self.output_filename + ".bak")
+            # auto-save .... to back up file (only the snapshot is taken on this thread)
+            self.auto_saver.request_save(self.lecture, self.output_filename + ".bak")
 
     def load_saved_data_into_GUI(self):
         # load video objects
@@ -823,6 +835,11 @@ class GTContentAnnotator(Screen):
             self.canvas.elements[video_object.id].visible = False
 
 
+    def add_undo_operation(self, operation):
+        self.undo_stack.append(operation)
+        # every edit is also appended to the journal
+        self.journal.record(operation)
+
     def btn_undo_click(self, button):
         if len(self.undo_stack) == 0:
             print("No operations to undo")
@@ -878,6 +895,7 @@ class GTContentAnnotator(Screen):
 
         # removing ...
         if success:
+            self.journal.record_inverse(to_undo)
             self.redo_stack.append(to_undo)
             del self.undo_stack[-1]
 
@@ -930,6 +948,7 @@ class GTContentAnnotator(Screen):
             success = self.segment_keyframe_del(to_redo["frame_index"], False)
 
         if success:
+            self.journal.record(to_redo)
             self.undo_stack.append(to_redo)
             # removing last operation
             del self.redo_stack[-1]
@@ -1038,53 +1057,60 @@ class GTContentAnnotator(Screen):
         else:
             translation, scale = self.compute_canvas_zoom_translation_scale()
 
-        # update canvas objects ....
-        for object_name in self.lecture.video_objects:
-            shape = self.lecture[object_name].shape_type
+        # update cached key-frames of objects that changed (these are always re-drawn)
+        changed_objects = self.object_frame_cache.refresh(self.lecture.video_objects)
 
-            if object_name == self.object_selector.selected_option_value:
-                # selected object .... force an out of range location
-                loc = self.lecture[object_name].get_location_at(self.last_video_frame, True)
-            else:
-                # any other object, no out of range location given
-                loc = self.lecture[object_name].get_location_at(self.last_video_frame, False)
-
-            # check ....
-            if loc is None:
-                # out of range ...
-                if shape == VideoObject.ShapeAlignedRectangle:
-                    self.canvas.update_rectangle_element(object_name, 0, 0, 0, 0, False, 1)
-                elif shape in [VideoObject.ShapeQuadrilateral, VideoObject.ShapePolygon]:
-                    self.canvas.update_polygon_element(object_name, None, False, 1)
-                else:
-                    raise Exception("Unknown Video Object Shape")
+        # only objects on their annotated range (plus the selected object) are drawn
+        selected_name = self.object_selector.selected_option_value
+        to_draw = self.object_frame_cache.active_objects(self.last_video_frame)
+        if selected_name in self.lecture.video_objects and selected_name not in to_draw:
+            to_draw.append(selected_name)
+        to_draw = set(to_draw)
+
+        # hide objects that were drawn before (or that changed) and are now out of range
+        for object_name in (self.canvas_drawn_objects | set(changed_objects)) - to_draw:
+            if object_name not in self.lecture.video_objects:
+                # removed or renamed
+                continue
+
+            shape = self.lecture[object_name].shape_type
+            if shape == VideoObject.ShapeAlignedRectangle:
+                self.canvas.update_rectangle_element(object_name, 0, 0, 0, 0, False, 1)
+            elif shape in [VideoObject.ShapeQuadrilateral, VideoObject.ShapePolygon]:
+                self.canvas.update_polygon_element(object_name, None, False, 1)
             else:
-                # check if out of range (only applies to selected object) ....
-                selected_out = (self.last_video_frame < self.lecture[object_name].first_frame() or
-                                self.lecture[object_name].last_frame() < self.last_video_frame)
+                raise Exception("Unknown Video Object Shape")
 
-                # selected object will be drawn using dashed lines if out of range ....
-                n_dashes = 1 if not selected_out else 100
+        for object_name in to_draw:
+            shape = self.lecture[object_name].shape_type
 
-                if self.player.video_player.zoom_factor == 0:
-                    # Default, no zoom
-                    loc_points = loc.polygon_points
-                else:
-                    # scaled view ...
-                    loc_points = (loc.polygon_points * scale) + translation
+            # interpolated in a buffer owned by the cache (the canvas keeps a copy)
+            loc_points, loc_visible = self.object_frame_cache.location_at(object_name, self.last_video_frame)
 
-                # in range or selected object ... just draw normally ....
-                if shape == VideoObject.ShapeAlignedRectangle:
-                    x, y = loc_points[0]
-                    w, h = loc_points[2] - loc_points[0]
+            # check if out of range (only applies to selected object) ....
+            selected_out = not self.object_frame_cache.in_range(object_name, self.last_video_frame)
 
-                    self.canvas.update_rectangle_element(object_name, x, y, w, h, loc.visible, n_dashes)
-                elif shape in [VideoObject.ShapeQuadrilateral, VideoObject.ShapePolygon]:
+            # selected object will be drawn using dashed lines if out of range ....
+            n_dashes = 1 if not selected_out else 100
 
-                    self.canvas.update_polygon_element(object_name, loc_points, loc.visible, n_dashes)
-                else:
-                    raise Exception("Unknown Video Object Shape")
+            if self.player.video_player.zoom_factor != 0:
+                # scaled view ...
+                loc_points *= scale
+                loc_points += translation
+
+            # in range or selected object ... just draw normally ....
+            if shape == VideoObject.ShapeAlignedRectangle:
+                x, y = loc_points[0]
+                w, h = loc_points[2] - loc_points[0]
+
+                self.canvas.update_rectangle_element(object_name, x, y, w, h, loc_visible, n_dashes)
+            elif shape in [VideoObject.ShapeQuadrilateral, VideoObject.ShapePolygon]:
 
+                self.canvas.update_polygon_element(object_name, loc_points, loc_visible, n_dashes)
+            else:
+                raise Exception("Unknown Video Object Shape")
+
+        self.canvas_drawn_objects = to_draw
 
     def video_frame_change(self, next_frame, next_abs_time):
         # update the scroll bar
@@ -1118,6 +1144,8 @@ class GTContentAnnotator(Screen):
     def close_click(self, button):
         if self.changes_saved:
             self.return_screen = None
+            self.auto_saver.stop()
+            self.journal.close(True)
             print("APPLICATION FINISHED")
         else:
             self.text_operation = 3
@@ -1126,11 +1154,9 @@ class GTContentAnnotator(Screen):
             self.prepare_confirm_input_mode(4, None, "Exit without saving?")
 
     def save_data_click(self, button):
-        xml_data = self.lecture.generate_data_xml()
-
-        out_file = open(self.output_filename, "w")
-        out_file.write(xml_data)
-        out_file.close()
+        self.lecture.save(self.output_filename)
+        # all journaled edits are now in the saved file
+        self.journal.clear(self.output_filename)
 
         print("Saved to: " + self.output_filename)
         self.changes_saved = True
@@ -1138,15 +1164,27 @@ class GTContentAnnotator(Screen):
         self.undo_stack.clear()
         self.redo_stack.clear()
 
+    def update_speed_label(self):
+        speed = self.player.video_player.play_speed * 100.0
+        if self.player.video_player.play_reverse:
+            speed = -speed
+
+        self.label_player_speed.set_text("Speed: " + str(speed) + "%")
+
     def btn_dec_speed_click(self, button):
         self.player.decrease_speed()
 
-        self.label_player_speed.set_text("Speed: " + str(self.player.video_player.play_speed * 100.0) + "%")
+        self.update_speed_label()
 
     def btn_inc_speed_click(self, button):
         self.player.increase_speed()
 
-        self.label_player_speed.set_text("Speed: " + str(self.player.video_player.play_speed * 100.0) + "%")
+        self.update_speed_label()
+
+    def reverse_play_toggle(self):
+        self.player.toggle_play_reverse()
+
+        self.update_speed_label()
 
     def btn_change_frame(self, button):
         new_abs_frame = self.player.video_player.last_frame_idx + button.tag
@@ -1205,7 +1243,7 @@ class GTContentAnnotator(Screen):
         # check if the object was the last object edited
         if keyframe_added:
             # new key-frame
-            self.undo_stack.append({
+            self.add_undo_operation({
                 "operation": "keyframe_added",
                 "object_id": object_name,
                 "old_location": prev_location,
@@ -1221,9 +1259,10 @@ class GTContentAnnotator(Screen):
                 time.time() - self.undo_stack[-1]["time"] < GTContentAnnotator.EditGroupingTime):
                 # same object was modified last within n seconds, combine
                 self.undo_stack[-1]["new_location"] = object_location
+                self.journal.record(self.undo_stack[-1])
             else:
                 # first modification to this object will be added to the top of the stack
-                self.undo_stack.append({
+                self.add_undo_operation({
                     "operation": "keyframe_edited",
                     "object_id": object_name,
                     "old_location": prev_location,
@@ -1360,7 +1399,7 @@ class GTContentAnnotator(Screen):
             # valid... add!
             if self.add_object(id_name, new_name, self.last_video_frame, self.last_video_time, self.new_object_shape, default_position):
                 location = VideoObjectLocation(True, self.last_video_frame, self.last_video_time, default_position)
-                self.undo_stack.append({
+                self.add_undo_operation({
                     "operation": "object_added",
                     "id": id_name,
                     "name": new_name,
@@ -1383,7 +1422,7 @@ class GTContentAnnotator(Screen):
 
             old_display = self.object_selector.option_display[selected_name]
             if self.rename_object(selected_name, id_name, new_name):
-                self.undo_stack.append({
+                self.add_undo_operation({
                     "operation": "object_renamed",
                     "old_id": selected_name,
                     "old_display": old_display,
@@ -1400,7 +1439,7 @@ class GTContentAnnotator(Screen):
             removed_object = self.lecture[selected_name]
             removed_display = self.object_selector.option_display[selected_name]
             if self.remove_object(selected_name):
-                self.undo_stack.append({
+                self.add_undo_operation({
                     "operation": "object_removed",
                     "id": selected_name,
                     "display": removed_display,
@@ -1409,6 +1448,9 @@ class GTContentAnnotator(Screen):
 
         if self.text_operation == 4:
             self.return_screen = None
+            self.auto_saver.stop()
+            # changes were discarded by the user
+            self.journal.close(True)
             print("APPLICATION FINISHED / CHANGES LOST")
 
         if self.text_operation == 5:
@@ -1420,6 +1462,9 @@ class GTContentAnnotator(Screen):
             else:
                 current_object_loc.label = new_name
 
+            self.journal.record_label(selected_name, current_object_loc.frame, current_object_loc.label)
+            self.changes_saved = False
+
         self.container_object_options.visible = True
         self.container_video_controls.visible = True
         self.panning_ver_scroll.visible = self.panning_hor_scroll.visible
@@ -1492,12 +1537,13 @@ class GTContentAnnotator(Screen):
 
                 #change ...
                 current_loc.visible = is_visible
+                current_object.keyframes_changed()
                 self.canvas.elements[selected_name].visible = is_visible
 
                 self.changes_saved = False
 
                 # add to undo stack
-                self.undo_stack.append({
+                self.add_undo_operation({
                     "operation": "keyframe_edited",
                     "object_id": selected_name,
                     "old_location": old_location,
@@ -1551,7 +1597,7 @@ class GTContentAnnotator(Screen):
                 self.canvas.update_polygon_element(selected_name, canvas_polygon, base_loc.visible)
 
             self.changes_saved = False
-            self.undo_stack.append({
+            self.add_undo_operation({
                 "operation": "keyframe_added",
                 "object_id": selected_name,
                 "old_location": None,
@@ -1626,7 +1672,7 @@ class GTContentAnnotator(Screen):
                 self.canvas.update_polygon_element(selected_name, canvas_polygon, base_loc.visible)
 
             self.changes_saved = False
-            self.undo_stack.append({
+            self.add_undo_operation({
                 "operation": "keyframe_added",
                 "object_id": selected_name,
                 "old_location": prev_loc,
@@ -1647,10 +1693,10 @@ class GTContentAnnotator(Screen):
                 and len(current_object.locations) > 1):
                 # a key-frame is selected, and is not the only one
                 to_delete = current_object.locations[loc_idx]
-                del current_object.locations[loc_idx]
+                current_object.del_location_at(current_frame)
 
                 self.changes_saved = False
-                self.undo_stack.append({
+                self.add_undo_operation({
                     "operation": "keyframe_deleted",
                     "object_id": selected_name,
                     "old_location": VideoObjectLocation.fromLocation(to_delete),
@@ -1920,7 +1966,7 @@ class GTContentAnnotator(Screen):
             self.lecture.video_segments = sorted(self.lecture.video_segments)
 
             if add_undo:
-                self.undo_stack.append({
+                self.add_undo_operation({
                     "operation": "vid_seg_split",
                     "split_point": split_point,
                 })
@@ -1932,7 +1978,7 @@ class GTContentAnnotator(Screen):
             self.lecture.video_segments.remove(split_point)
 
             if add_undo:
-                self.undo_stack.append({
+                self.add_undo_operation({
                     "operation": "vid_seg_merge",
                     "split_point": split_point,
                 })
@@ -1957,7 +2003,7 @@ class GTContentAnnotator(Screen):
             self.lecture.video_segment_keyframes = sorted(self.lecture.video_segment_keyframes)
 
             if add_undo:
-                self.undo_stack.append({
+                self.add_undo_operation({
                     "operation": "vid_seg_keyframe_add",
                     "frame_index": frame_index,
                 })
@@ -1971,7 +2017,7 @@ class GTContentAnnotator(Screen):
             self.lecture.video_segment_keyframes.remove(frame_index)
 
             if add_undo:
-                self.undo_stack.append({
+                self.add_undo_operation({
                     "operation": "vid_seg_keyframe_del",
                     "frame_index": frame_index,
                 })
@@ -2179,6 +2225,10 @@ class GTContentAnnotator(Screen):
             # V
             # (speed * 2.0)
             self.btn_inc_speed_click(self.btn_inc_speed)
+        elif key == 114:
+            # R
+            # play forward/backwards
+            self.reverse_play_toggle()
         elif key == 101:
             # e
             # SET -> object status
@@ -2251,7 +2301,7 @@ class GTContentAnnotator(Screen):
         new_object.locations[0].visible = first_loc.visible
 
         tempo_location = VideoObjectLocation.fromLocation(new_object.locations[0])
-        self.undo_stack.append({
+        self.add_undo_operation({
             "operation": "object_added",
             "id": tempo_object.id,
             "name": tempo_object.name,
@@ -2263,7 +2313,7 @@ class GTContentAnnotator(Screen):
         for tempo_loc in tempo_object.locations[1:]:
             new_object.set_location_at(tempo_loc.frame, tempo_loc.abs_time, tempo_loc.visible, tempo_loc.polygon_points)
 
-            self.undo_stack.append({
+            self.add_undo_operation({
                 "operation": "keyframe_added",
                 "object_id": selected_name,
                 "old_location": None,
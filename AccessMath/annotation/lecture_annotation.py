@@ -1,15 +1,25 @@
 
+import io
+import os
+import json
+import time
 from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
 
 import numpy as np
 from shapely.geometry.point import Point
 
 from AccessMath.annotation.video_object import VideoObject
 from AccessMath.annotation.video_object_location import VideoObjectLocation
+from AccessMath.annotation.video_object_location_store import VideoObjectLocationStore
+from AccessMath.annotation.video_object_index import VideoObjectIndex
 from AccessMath.annotation.drawing_info import DrawingInfo
 
 class LectureAnnotation:
     XMLNamespace = ''
+    SaveBufferSize = 1024 * 1024
+    SnapshotExtension = ".npz"
+    SnapshotVersion = 2
 
     def __init__(self, db_name, lecture_title, output_file, video_files, total_frames, drawing_info):
         self.db_name = db_name
@@ -26,6 +36,26 @@ class LectureAnnotation:
         self.video_segments = []
         self.video_segment_keyframes = []
 
+        # use columnar key-frame storage for the video objects
+        self.columnar_locations = False
+
+        # spatial index over the key-frames of the video objects (updated on demand)
+        self.object_index = VideoObjectIndex()
+
+    def snapshot(self):
+        # copy of the current state of the annotation that can be serialized while this one is being edited
+        copy = LectureAnnotation(self.db_name, self.title, self.output_file, list(self.video_files),
+                                 self.total_frames, self.drawing_info)
+        copy.frame_width = self.frame_width
+        copy.frame_height = self.frame_height
+        copy.video_segments = list(self.video_segments)
+        copy.video_segment_keyframes = list(self.video_segment_keyframes)
+        copy.columnar_locations = True
+        for object_id in self.video_objects:
+            copy.video_objects[object_id] = self.video_objects[object_id].snapshot()
+
+        return copy
+
     def set_frame_resolution(self, width, height):
         self.frame_width = width
         self.frame_height = height
@@ -37,8 +67,11 @@ class LectureAnnotation:
         if not isinstance(point, Point):
             point = Point(point)
 
+        # only the objects that might contain the point at this frame are tested
+        self.object_index.refresh(self.video_objects)
+
         intersections = []
-        for name in self.video_objects:
+        for name in self.object_index.candidates(point.x, point.y, frame_idx):
             video_object = self.video_objects[name]
 
             # get estimated video object location for this frame
@@ -103,7 +136,7 @@ class LectureAnnotation:
         if name in self.video_objects:
             return False
 
-        self.video_objects[id] = VideoObject(id, name, shape_type)
+        self.video_objects[id] = VideoObject(id, name, shape_type, self.columnar_locations)
         self.video_objects[id].set_location_at(frame, abs_time, True, polygon_points)
 
         return True
@@ -150,40 +183,36 @@ class LectureAnnotation:
 
         return VideoObjectLocation(loc.visible, loc.frame, loc.abs_time, proj_points)
 
-    def generate_metadata_header_xml(self):
-        xml_string = "  <Database>" + self.db_name + "</Database>\n"
-        xml_string += "  <Lecture>" + self.title + "</Lecture>\n"
-        xml_string += "  <Filename>" + self.output_file + "</Filename>\n"
-        xml_string += "  <VideoFiles>\n"
+    def write_metadata_header_xml(self, out):
+        out.write("  <Database>" + escape(self.db_name) + "</Database>\n")
+        out.write("  <Lecture>" + escape(self.title) + "</Lecture>\n")
+        out.write("  <Filename>" + escape(self.output_file) + "</Filename>\n")
+        out.write("  <VideoFiles>\n")
         for filename in self.video_files:
-            xml_string += "     <VideoFile>" + filename + "</VideoFile>\n"
-        xml_string += "  </VideoFiles>\n"
+            out.write("     <VideoFile>" + escape(filename) + "</VideoFile>\n")
+        out.write("  </VideoFiles>\n")
 
-        return xml_string
-
-    def generate_video_segments_xml(self):
+    def write_video_segments_xml(self, out):
         tempo_segments = [0] + self.video_segments + [self.total_frames]
-        xml_string = "  <VideoSegments>\n"
+        out.write("  <VideoSegments>\n")
         for idx in range(len(self.video_segments) + 1):
-            xml_string += "    <VideoSegment>\n"
-            xml_string += "        <Start>" + str(tempo_segments[idx]) + "</Start>\n"
-            xml_string += "        <End>" + str(tempo_segments[idx + 1]) + "</End>\n"
-            xml_string += "    </VideoSegment>\n"
-        xml_string += "  </VideoSegments>\n"
-
-        return xml_string
-
-    def generate_keyframes_xml(self, include_objects, keyframe_times=None):
-        xml_string = "  <VideoKeyFrames>\n"
+            out.write("    <VideoSegment>\n" +
+                      "        <Start>" + str(tempo_segments[idx]) + "</Start>\n" +
+                      "        <End>" + str(tempo_segments[idx + 1]) + "</End>\n" +
+                      "    </VideoSegment>\n")
+        out.write("  </VideoSegments>\n")
+
+    def write_keyframes_xml(self, out, include_objects, keyframe_times=None):
+        out.write("  <VideoKeyFrames>\n")
         for idx, frame_idx in enumerate(self.video_segment_keyframes):
-            xml_string += "    <VideoKeyFrame>\n"
-            xml_string += "       <Index>" + str(frame_idx) + "</Index>\n"
+            out.write("    <VideoKeyFrame>\n")
+            out.write("       <Index>" + str(frame_idx) + "</Index>\n")
 
             if keyframe_times is not None:
-                xml_string += "       <AbsTime>" + str(keyframe_times[idx]) + "</AbsTime>\n"
+                out.write("       <AbsTime>" + str(keyframe_times[idx]) + "</AbsTime>\n")
 
             if include_objects:
-                xml_string += "       <VideoObjects>\n"
+                out.write("       <VideoObjects>\n")
 
                 # for each object ....
                 for object_name in self.video_objects:
@@ -195,67 +224,87 @@ class LectureAnnotation:
                     if loc is not None and loc.visible:
                         proj_loc = self.project_object_location(loc)
 
-                        object_xml = "          <VideoObject>\n"
-                        object_xml += "              <Name>" + object_name + "</Name>\n"
-                        object_xml += "              <Shape>" + str(shape) + "</Shape>\n"
-                        object_xml += "              <Polygon>\n"
+                        object_xml = ["          <VideoObject>\n",
+                                      "              <Name>", escape(object_name), "</Name>\n",
+                                      "              <Shape>", str(shape), "</Shape>\n",
+                                      "              <Polygon>\n"]
                         for x, y in proj_loc.polygon_points:
-                            object_xml += "                 <Point>\n"
-                            object_xml += "                    <X>" + str(x) + "</X>\n"
-                            object_xml += "                    <Y>" + str(y) + "</Y>\n"
-                            object_xml += "                 </Point>\n"
+                            object_xml += ["                 <Point>\n",
+                                           "                    <X>", str(x), "</X>\n",
+                                           "                    <Y>", str(y), "</Y>\n",
+                                           "                 </Point>\n"]
 
-                        object_xml += "              </Polygon>\n"
-                        object_xml += "          </VideoObject>\n"
+                        object_xml += ["              </Polygon>\n",
+                                       "          </VideoObject>\n"]
 
-                        xml_string += object_xml
+                        out.write("".join(object_xml))
 
-                xml_string += "       </VideoObjects>\n"
+                out.write("       </VideoObjects>\n")
 
-            xml_string += "    </VideoKeyFrame>\n"
+            out.write("    </VideoKeyFrame>\n")
 
-        xml_string += "  </VideoKeyFrames>\n"
+        out.write("  </VideoKeyFrames>\n")
 
-        return xml_string
-
-    def generate_data_xml(self):
-        xml_string = "<Annotations>\n"
+    def write_data_xml(self, out):
+        out.write("<Annotations>\n")
 
         # general meta-data
-        xml_string += self.generate_metadata_header_xml()
+        self.write_metadata_header_xml(out)
 
         # add ViewPort coordinates info ...
-        xml_string += self.drawing_info.generate_xml()
+        out.write(self.drawing_info.generate_xml())
 
-        xml_string += "  <VideoObjects>\n"
+        out.write("  <VideoObjects>\n")
         for name in sorted(list(self.video_objects.keys())):
-            xml_string += self.video_objects[name].toXML()
-        xml_string += "  </VideoObjects>\n"
+            self.video_objects[name].write_XML(out)
+        out.write("  </VideoObjects>\n")
 
-        xml_string += self.generate_video_segments_xml()
+        self.write_video_segments_xml(out)
 
         # save key-frames without object info (full object info already saved)
-        xml_string += self.generate_keyframes_xml(False)
-
-        xml_string += "</Annotations>\n"
+        self.write_keyframes_xml(out, False)
 
-        return xml_string
+        out.write("</Annotations>\n")
 
-    def generate_export_xml(self, keyframe_times):
-        xml_string = "<Annotations>\n"
+    def write_export_xml(self, out, keyframe_times):
+        out.write("<Annotations>\n")
 
         # general meta-data
-        xml_string += self.generate_metadata_header_xml()
+        self.write_metadata_header_xml(out)
 
         # segments
-        xml_string += self.generate_video_segments_xml()
+        self.write_video_segments_xml(out)
 
         # key frames with object data ...
-        xml_string += self.generate_keyframes_xml(True, keyframe_times)
+        self.write_keyframes_xml(out, True, keyframe_times)
 
-        xml_string += "</Annotations>\n"
+        out.write("</Annotations>\n")
 
-        return xml_string
+    # in-memory versions of the XML writers (e.g. for auto-saving)
+    def generate_metadata_header_xml(self):
+        out = io.StringIO()
+        self.write_metadata_header_xml(out)
+        return out.getvalue()
+
+    def generate_video_segments_xml(self):
+        out = io.StringIO()
+        self.write_video_segments_xml(out)
+        return out.getvalue()
+
+    def generate_keyframes_xml(self, include_objects, keyframe_times=None):
+        out = io.StringIO()
+        self.write_keyframes_xml(out, include_objects, keyframe_times)
+        return out.getvalue()
+
+    def generate_data_xml(self):
+        out = io.StringIO()
+        self.write_data_xml(out)
+        return out.getvalue()
+
+    def generate_export_xml(self, keyframe_times):
+        out = io.StringIO()
+        self.write_export_xml(out, keyframe_times)
+        return out.getvalue()
 
     def update_timeline(self, new_frame_count, old_frame_count=None, new_time=None, old_time=None):
         if old_frame_count is None:
@@ -285,15 +334,172 @@ class LectureAnnotation:
 
         return frame_scale_factor, time_scale_factor
 
-    def save(self, output_path=None):
-        xml_data = self.generate_data_xml()
-
+    def save(self, output_path=None, write_snapshot=True):
         if output_path is None:
             output_path = self.output_file
 
-        out_file = open(output_path, "w")
-        out_file.write(xml_data)
-        out_file.close()
+        # objects are written to the (buffered) file as they are serialized, on a temporary file first
+        # (an error while serializing never leaves a truncated annotation file)
+        tempo_path = output_path + ".tmp"
+        with open(tempo_path, "w", encoding="utf-8", buffering=LectureAnnotation.SaveBufferSize) as out_file:
+            self.write_data_xml(out_file)
+        os.replace(tempo_path, output_path)
+
+        if write_snapshot:
+            # (records the size and modification time of the XML file it was saved with)
+            self.save_snapshot(LectureAnnotation.SnapshotFilename(output_path), output_path)
+
+    def save_snapshot(self, filename, source_filename=None):
+        # binary version of the annotation: meta-data as JSON plus the key-frames of all objects
+        # concatenated on flat arrays (objects are stored in the same order used by the XML file)
+        object_names = sorted(list(self.video_objects.keys()))
+
+        objects_info = []
+        all_frames, all_times, all_visible, all_label_ids, all_points = [], [], [], [], []
+        for name in object_names:
+            video_object = self.video_objects[name]
+            frames, times, visible, label_ids, label_names, points = video_object.get_keyframe_arrays()
+
+            objects_info.append({"id": video_object.id, "name": video_object.name, "shape": video_object.shape_type,
+                                 "keyframes": int(frames.shape[0]),
+                                 "points": int(points.shape[1]) if points.shape[0] > 0 else 0,
+                                 "labels": list(label_names)})
+
+            all_frames.append(frames)
+            all_times.append(times)
+            all_visible.append(visible)
+            all_label_ids.append(label_ids)
+            all_points.append(points.reshape(-1, 2))
+
+        metadata = {
+            "version": LectureAnnotation.SnapshotVersion,
+            "database": self.db_name,
+            "lecture": self.title,
+            "filename": self.output_file,
+            "video_files": list(self.video_files),
+            "total_frames": int(self.total_frames),
+            "drawing_info": [[float(val) for val in self.drawing_info.canvas_bbox],
+                             [float(val) for val in self.drawing_info.player_control_bbox],
+                             [float(val) for val in self.drawing_info.player_render_bbox]],
+            "video_segments": [int(val) for val in self.video_segments],
+            "video_segment_keyframes": [int(val) for val in self.video_segment_keyframes],
+            "objects": objects_info,
+        }
+        if source_filename is not None:
+            # the snapshot is only used while the XML file is the same one (see SnapshotIsCurrent)
+            metadata["source_size"], metadata["source_mtime"] = LectureAnnotation.SourceInfo(source_filename)
+
+        arrays = {
+            "metadata": np.array(json.dumps(metadata)),
+            "frames": np.concatenate(all_frames) if len(all_frames) > 0 else np.zeros(0, dtype=np.int64),
+            "times": np.concatenate(all_times) if len(all_times) > 0 else np.zeros(0, dtype=np.float64),
+            "visible": np.concatenate(all_visible) if len(all_visible) > 0 else np.zeros(0, dtype=np.bool_),
+            "label_ids": np.concatenate(all_label_ids) if len(all_label_ids) > 0 else np.zeros(0, dtype=np.int32),
+            "points": np.concatenate(all_points) if len(all_points) > 0 else np.zeros((0, 2), dtype=np.float64),
+        }
+
+        # written to a temporary file first, an interrupted save never leaves a broken snapshot
+        tempo_filename = filename + ".tmp"
+        with open(tempo_filename, "wb") as out_file:
+            np.savez(out_file, **arrays)
+        os.replace(tempo_filename, filename)
+
+    @staticmethod
+    def SnapshotFilename(filename):
+        return filename + LectureAnnotation.SnapshotExtension
+
+    @staticmethod
+    def SourceInfo(filename):
+        return os.path.getsize(filename), os.path.getmtime(filename)
+
+    @staticmethod
+    def SnapshotIsCurrent(filename):
+        # True if the binary snapshot of the given XML file exists and was saved with the current XML file (same
+        # size and modification time, a newer snapshot is not enough as the XML file can be restored with its
+        # original time). If there is no XML file, the snapshot is used.
+        snapshot_filename = LectureAnnotation.SnapshotFilename(filename)
+        if not os.path.exists(snapshot_filename):
+            return False
+
+        if not os.path.exists(filename):
+            return True
+
+        try:
+            with np.load(snapshot_filename, allow_pickle=False) as data:
+                metadata = json.loads(str(data["metadata"]))
+        except Exception as e:
+            print("Invalid snapshot <" + snapshot_filename + ">: " + str(e))
+            return False
+
+        if metadata.get("version") != LectureAnnotation.SnapshotVersion or "source_size" not in metadata:
+            return False
+
+        source_size, source_mtime = LectureAnnotation.SourceInfo(filename)
+        return metadata["source_size"] == source_size and metadata["source_mtime"] == source_mtime
+
+    @staticmethod
+    def LoadSnapshot(filename, verbose=True, columnar=False):
+        with np.load(filename, allow_pickle=False) as data:
+            metadata = json.loads(str(data["metadata"]))
+            if metadata["version"] != LectureAnnotation.SnapshotVersion:
+                raise Exception("LectureAnnotation: Unsupported snapshot version " + str(metadata["version"]))
+
+            all_frames = data["frames"]
+            all_times = data["times"]
+            all_visible = data["visible"]
+            all_label_ids = data["label_ids"]
+            all_points = data["points"]
+
+        if verbose:
+            print("Loading data (binary snapshot):")
+            LectureAnnotation.Show_XML_Metadata(metadata["database"], metadata["lecture"], metadata["filename"],
+                                                metadata["video_files"])
+
+        canvas_bbox, player_bbox, render_bbox = metadata["drawing_info"]
+        drawing_info = DrawingInfo(canvas_bbox, player_bbox, render_bbox)
+
+        annotation = LectureAnnotation(metadata["database"], metadata["lecture"], metadata["filename"],
+                                       metadata["video_files"], metadata["total_frames"], drawing_info)
+        annotation.video_segments = metadata["video_segments"]
+        annotation.video_segment_keyframes = metadata["video_segment_keyframes"]
+        annotation.columnar_locations = columnar
+
+        msg_object = " -> Loading object: {0:s} ({1:d} Key-frames)"
+        row_offset = 0
+        point_offset = 0
+        for object_info in metadata["objects"]:
+            n_keyframes = object_info["keyframes"]
+            n_points = object_info["points"]
+
+            frames = all_frames[row_offset:row_offset + n_keyframes]
+            times = all_times[row_offset:row_offset + n_keyframes]
+            visible = all_visible[row_offset:row_offset + n_keyframes]
+            label_ids = all_label_ids[row_offset:row_offset + n_keyframes]
+            points = all_points[point_offset:point_offset + n_keyframes * n_points].reshape(n_keyframes, n_points, 2)
+            label_names = object_info["labels"]
+
+            row_offset += n_keyframes
+            point_offset += n_keyframes * n_points
+
+            video_object = VideoObject(object_info["id"], object_info["name"], object_info["shape"], columnar)
+            if columnar:
+                video_object.locations = VideoObjectLocationStore.from_arrays(frames, times, visible, label_ids,
+                                                                              label_names, points)
+            else:
+                for idx in range(n_keyframes):
+                    label = None if label_ids[idx] < 0 else label_names[label_ids[idx]]
+                    video_object.locations.append(VideoObjectLocation(bool(visible[idx]), int(frames[idx]),
+                                                                      float(times[idx]), points[idx].copy(), label))
+
+            if verbose:
+                print(msg_object.format(video_object.name, len(video_object.locations)))
+
+            annotation.video_objects[video_object.id] = video_object
+
+        if verbose:
+            print(" -> A total of {0:d} video objects where loaded!".format(len(annotation.video_objects)))
+
+        return annotation
 
     @staticmethod
     def Show_XML_Metadata(database_name, lecture_title, output_file, video_parts):
@@ -305,7 +511,14 @@ class LectureAnnotation:
             print("\t" + file_video)
 
     @staticmethod
-    def Load(filename, verbose=True):
+    def Load(filename, verbose=True, columnar=False, streaming=True, use_snapshot=True):
+        if use_snapshot and LectureAnnotation.SnapshotIsCurrent(filename):
+            # the binary snapshot saved with the XML file is much faster to load
+            return LectureAnnotation.LoadSnapshot(LectureAnnotation.SnapshotFilename(filename), verbose, columnar)
+
+        if streaming:
+            return LectureAnnotation.LoadStreaming(filename, verbose, columnar)
+
         tree = ET.parse(filename)
         root = tree.getroot()
 
@@ -347,6 +560,7 @@ class LectureAnnotation:
                                        drawing_info)
 
         annotation.video_segments = tempo_split_points
+        annotation.columnar_locations = columnar
 
         # load video objects
         xml_video_objects_root = root.find(namespace + 'VideoObjects')
@@ -354,7 +568,7 @@ class LectureAnnotation:
         msg_object = " -> Loading object: {0:s} ({1:d} Key-frames)"
         for xml_video_object in xml_video_objects:
             # load logical object ...
-            video_object = VideoObject.fromXML(xml_video_object)
+            video_object = VideoObject.fromXML(xml_video_object, columnar)
 
             if verbose:
                 print(msg_object.format(video_object.name, len(video_object.locations)))
@@ -377,3 +591,139 @@ class LectureAnnotation:
         annotation.video_segment_keyframes = tempo_keyframes
 
         return annotation
+
+    @staticmethod
+    def LoadStreaming(filename, verbose=True, columnar=False):
+        # Incremental version of Load based on iterparse. Each video object is built as soon as its
+        # key-frames are read, and processed elements are removed from the tree to keep memory bounded
+        namespace = LectureAnnotation.XMLNamespace
+
+        start_time = time.time()
+
+        database_name = None
+        lecture_title = None
+        output_file = None
+        video_files = []
+        drawing_info = None
+        video_objects = {}
+        tempo_split_points = []
+        tempo_ends_points = []
+        tempo_keyframes = []
+        total_keyframes = 0
+
+        current_object_info = {}
+        current_object = None
+
+        msg_object = " -> Loading object: {0:s} ({1:d} Key-frames)"
+
+        path = []
+        elements = []
+        for event, element in ET.iterparse(filename, events=("start", "end")):
+            if event == "start":
+                path.append(element.tag)
+                elements.append(element)
+
+                if path[1:] == [namespace + "VideoObjects", namespace + "VideoObject"]:
+                    # a new video object
+                    current_object_info = {}
+                    current_object = None
+                elif path[1:] == [namespace + "VideoObjects", namespace + "VideoObject",
+                                  namespace + "VideoObjectLocations"]:
+                    # general properties of the object have been read, create it
+                    if "Shape" not in current_object_info:
+                        print("Warning: Legacy Video Object Annotation found")
+                        shape_type = VideoObject.ShapeAlignedRectangle
+                    else:
+                        shape_type = int(current_object_info["Shape"])
+
+                    if not shape_type in [VideoObject.ShapeAlignedRectangle, VideoObject.ShapeQuadrilateral,
+                                          VideoObject.ShapePolygon]:
+                        raise Exception("VideoObject: Invalid Shape Type found!")
+
+                    current_object = VideoObject(current_object_info["Id"], current_object_info["Name"], shape_type,
+                                                 columnar)
+
+                continue
+
+            # end of an element ...
+            level = path[1:]
+            parent = elements[-2] if len(elements) >= 2 else None
+            processed = False
+
+            if len(level) == 1:
+                if level[0] == namespace + "Database":
+                    database_name = element.text
+                elif level[0] == namespace + "Lecture":
+                    lecture_title = element.text
+                elif level[0] == namespace + "Filename":
+                    output_file = element.text
+                elif level[0] == namespace + "VideoFiles":
+                    video_files = [file_video.text for file_video in element.findall(namespace + 'VideoFile')]
+                    processed = True
+
+                    if verbose:
+                        # Show meta-data just for validation purposes
+                        print("Loading data:")
+                        LectureAnnotation.Show_XML_Metadata(database_name, lecture_title, output_file, video_files)
+                elif level[0] == namespace + "DrawingInfo":
+                    drawing_info = DrawingInfo.from_XML(parent, namespace)
+                    processed = True
+
+            elif level[:2] == [namespace + "VideoObjects", namespace + "VideoObject"]:
+                if len(level) == 3 and current_object is None:
+                    # general properties of the object (Id, Name, Shape)
+                    current_object_info[level[2][len(namespace):]] = element.text
+                elif len(level) == 4 and level[3] == namespace + "VideoObjectLocation":
+                    location_values = VideoObjectLocation.values_from_XML(element, namespace)
+                    current_object.append_location(*location_values)
+                    total_keyframes += 1
+                    processed = True
+                elif len(level) == 2:
+                    if verbose:
+                        print(msg_object.format(current_object.name, len(current_object.locations)))
+
+                    video_objects[current_object.id] = current_object
+                    current_object = None
+                    processed = True
+
+            elif level == [namespace + "VideoSegments", namespace + "VideoSegment"]:
+                tempo_split_points.append(int(element.find(namespace + 'Start').text))
+                tempo_ends_points.append(int(element.find(namespace + 'End').text))
+                processed = True
+
+            elif level == [namespace + "VideoKeyFrames", namespace + "VideoKeyFrame"]:
+                tempo_keyframes.append(int(element.find(namespace + "Index").text))
+                processed = True
+
+            if processed:
+                # discard the processed sub-tree
+                element.clear()
+                if parent is not None:
+                    parent.remove(element)
+
+            path.pop()
+            elements.pop()
+
+        if verbose:
+            print(" -> A total of {0:d} video objects where loaded!".format(len(video_objects)))
+
+        total_frames = max(tempo_ends_points)
+        tempo_split_points = sorted(tempo_split_points)
+        if 0 in tempo_split_points:
+            tempo_split_points.remove(0)
+
+        annotation = LectureAnnotation(database_name, lecture_title, output_file, video_files, total_frames,
+                                       drawing_info)
+
+        annotation.video_segments = tempo_split_points
+        annotation.columnar_locations = columnar
+        annotation.video_objects = video_objects
+        annotation.video_segment_keyframes = sorted(tempo_keyframes)
+
+        if verbose:
+            elapsed = max(time.time() - start_time, 1e-6)
+            file_mb = os.path.getsize(filename) / (1024.0 * 1024.0)
+            msg_throughput = " -> Parsed {0:.2f} MB in {1:.3f} s ({2:.2f} MB/s, {3:.0f} Key-frames/s)"
+            print(msg_throughput.format(file_mb, elapsed, file_mb / elapsed, total_keyframes / elapsed))
+
+        return annotation
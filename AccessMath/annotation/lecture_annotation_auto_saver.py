@@ -0,0 +1,95 @@
+
+import os
+import threading
+
+from AM_CommonTools.util.time_helper import TimeHelper
+
+
+class LectureAnnotationAutoSaver:
+    # Writes snapshots of a LectureAnnotation to disk on a background thread. Only the most
+    # recent request is kept: requests made while a previous one is still waiting (or being
+    # written) replace it. Files are written to a temporary file first and then renamed, so
+    # an interrupted save never leaves a partial back-up behind.
+    TempSuffix = ".tmp"
+
+    def __init__(self, verbose=True):
+        self.verbose = verbose
+
+        self.__condition = threading.Condition()
+        # (snapshot, filename) waiting to be written
+        self.__pending = None
+        self.__writing = False
+        self.__finished = False
+
+        self.last_error = None
+
+        self.__thread = threading.Thread(target=self.__run, name="LectureAnnotationAutoSaver", daemon=True)
+        self.__thread.start()
+
+    def request_save(self, lecture, filename):
+        # the snapshot is the only work done on the caller's thread
+        snapshot = lecture.snapshot()
+
+        with self.__condition:
+            if self.__finished:
+                raise Exception("LectureAnnotationAutoSaver: Saver has already been stopped")
+
+            self.__pending = (snapshot, filename)
+            self.__condition.notify_all()
+
+    def is_busy(self):
+        with self.__condition:
+            return self.__writing or self.__pending is not None
+
+    def wait(self, timeout=None):
+        # waits until all pending requests have been written (returns False on timeout)
+        with self.__condition:
+            return self.__condition.wait_for(lambda: not self.__writing and self.__pending is None, timeout)
+
+    def stop(self, wait=True):
+        # pending requests are still written before the thread finishes
+        with self.__condition:
+            self.__finished = True
+            self.__condition.notify_all()
+
+        if wait:
+            self.__thread.join()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__finished or self.__pending is not None)
+                if self.__pending is None:
+                    # finished and nothing left to write
+                    return
+
+                snapshot, filename = self.__pending
+                self.__pending = None
+                self.__writing = True
+
+            try:
+                self.__write(snapshot, filename)
+            except Exception as e:
+                self.last_error = e
+                print("Auto-Back up failed: " + str(e))
+            finally:
+                with self.__condition:
+                    self.__writing = False
+                    self.__condition.notify_all()
+
+    def __write(self, snapshot, filename):
+        timer = TimeHelper()
+        timer.startTimer()
+
+        tempo_filename = filename + LectureAnnotationAutoSaver.TempSuffix
+        try:
+            snapshot.save(tempo_filename, False)
+            os.replace(tempo_filename, filename)
+        finally:
+            if os.path.exists(tempo_filename):
+                os.remove(tempo_filename)
+
+        timer.endTimer()
+
+        if self.verbose:
+            print("Auto-Backed up to: " + filename + " (" + timer.totalElapsedStamp() + ")")
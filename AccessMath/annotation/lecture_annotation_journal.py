@@ -0,0 +1,248 @@
+
+import os
+import json
+
+from .video_object import VideoObject
+
+
+class LectureAnnotationJournal:
+    # Append-only log (one JSON record per line) of the edits applied to a LectureAnnotation
+    # since its XML file was last saved. Each edit costs a single append, the XML file is only
+    # re-written on explicit saves (when the journal is cleared). After a crash, replaying the
+    # journal over the last saved XML recovers the edits that were not saved.
+    #
+    # Records use the operations of the annotator's undo stack, always in the "forward"
+    # direction (e.g. undoing "object_added" is recorded as "object_removed"). Key-frames
+    # added or edited are recorded as "keyframe_set".
+    Extension = ".journal"
+    StaleExtension = ".stale"
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.out_file = None
+
+    @staticmethod
+    def FromAnnotationFile(annotation_filename):
+        return LectureAnnotationJournal(annotation_filename + LectureAnnotationJournal.Extension)
+
+    @staticmethod
+    def base_file_info(base_filename):
+        # identifies the version of the XML file that the journal applies to
+        if base_filename is None or not os.path.exists(base_filename):
+            return None, None
+
+        return os.path.getmtime(base_filename), os.path.getsize(base_filename)
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    def start(self, base_filename):
+        # opens the journal for appending (a new journal is started if it does not exist)
+        if self.out_file is not None:
+            self.out_file.close()
+
+        is_new = not self.exists() or os.path.getsize(self.filename) == 0
+
+        self.out_file = open(self.filename, "a", encoding="utf-8")
+        if is_new:
+            self.__write_header(base_filename)
+
+    def clear(self, base_filename):
+        # the edits are now part of the XML file, start over
+        if self.out_file is not None:
+            self.out_file.close()
+
+        self.out_file = open(self.filename, "w", encoding="utf-8")
+        self.__write_header(base_filename)
+
+    def close(self, remove=False):
+        if self.out_file is not None:
+            self.out_file.close()
+            self.out_file = None
+
+        if remove and self.exists():
+            os.remove(self.filename)
+
+    def __write_header(self, base_filename):
+        base_mtime, base_size = LectureAnnotationJournal.base_file_info(base_filename)
+        self.__append({"operation": "header", "base_mtime": base_mtime, "base_size": base_size})
+
+    def __append(self, record):
+        if self.out_file is None:
+            raise Exception("LectureAnnotationJournal: Journal has not been started")
+
+        self.out_file.write(json.dumps(record) + "\n")
+        # flushed on every edit, a crash of the application loses at most the last edit
+        self.out_file.flush()
+
+    # ===================================================
+    #   Recording operations
+    # ===================================================
+    @staticmethod
+    def location_to_record(location):
+        return {
+            "visible": bool(location.visible),
+            "frame": int(location.frame),
+            "abs_time": float(location.abs_time),
+            "points": [[float(x), float(y)] for x, y in location.polygon_points],
+            "label": location.label,
+        }
+
+    def record(self, operation):
+        # records an operation of the undo stack (as done or re-done)
+        name = operation["operation"]
+
+        if name == "object_added":
+            record = {"operation": name, "id": operation["id"], "name": operation["name"],
+                      "shape": operation["shape"],
+                      "location": LectureAnnotationJournal.location_to_record(operation["location"])}
+        elif name == "object_renamed":
+            record = {"operation": name, "old_id": operation["old_id"], "new_id": operation["new_id"],
+                      "new_display": operation["new_display"]}
+        elif name == "object_removed":
+            record = {"operation": name, "id": operation["id"]}
+        elif name == "keyframe_added" or name == "keyframe_edited":
+            record = {"operation": "keyframe_set", "object_id": operation["object_id"],
+                      "location": LectureAnnotationJournal.location_to_record(operation["new_location"])}
+        elif name == "keyframe_deleted":
+            record = {"operation": name, "object_id": operation["object_id"],
+                      "frame": int(operation["old_location"].frame)}
+        elif name == "vid_seg_split" or name == "vid_seg_merge":
+            record = {"operation": name, "split_point": int(operation["split_point"])}
+        elif name == "vid_seg_keyframe_add" or name == "vid_seg_keyframe_del":
+            record = {"operation": name, "frame_index": int(operation["frame_index"])}
+        else:
+            raise Exception("LectureAnnotationJournal: Unknown operation <" + str(name) + ">")
+
+        self.__append(record)
+
+    def record_inverse(self, operation):
+        # records the effect of undoing an operation of the undo stack
+        name = operation["operation"]
+
+        if name == "object_added":
+            record = {"operation": "object_removed", "id": operation["id"]}
+        elif name == "object_renamed":
+            record = {"operation": name, "old_id": operation["new_id"], "new_id": operation["old_id"],
+                      "new_display": operation["old_display"]}
+        elif name == "object_removed":
+            # the object is added back with all of its key-frames
+            video_object = operation["object_ref"]
+            record = {"operation": "object_restored", "id": operation["id"], "name": operation["display"],
+                      "shape": video_object.shape_type,
+                      "locations": [LectureAnnotationJournal.location_to_record(loc) for loc in video_object.locations]}
+        elif name == "keyframe_added":
+            record = {"operation": "keyframe_deleted", "object_id": operation["object_id"],
+                      "frame": int(operation["new_location"].frame)}
+        elif name == "keyframe_edited" or name == "keyframe_deleted":
+            record = {"operation": "keyframe_set", "object_id": operation["object_id"],
+                      "location": LectureAnnotationJournal.location_to_record(operation["old_location"])}
+        elif name == "vid_seg_split":
+            record = {"operation": "vid_seg_merge", "split_point": int(operation["split_point"])}
+        elif name == "vid_seg_merge":
+            record = {"operation": "vid_seg_split", "split_point": int(operation["split_point"])}
+        elif name == "vid_seg_keyframe_add":
+            record = {"operation": "vid_seg_keyframe_del", "frame_index": int(operation["frame_index"])}
+        elif name == "vid_seg_keyframe_del":
+            record = {"operation": "vid_seg_keyframe_add", "frame_index": int(operation["frame_index"])}
+        else:
+            raise Exception("LectureAnnotationJournal: Unknown operation <" + str(name) + ">")
+
+        self.__append(record)
+
+    def record_label(self, object_id, frame, label):
+        # label changes are not part of the undo stack
+        self.__append({"operation": "keyframe_label", "object_id": object_id, "frame": int(frame), "label": label})
+
+    # ===================================================
+    #   Recovery
+    # ===================================================
+    def read_records(self):
+        records = []
+        with open(self.filename, "r", encoding="utf-8") as in_file:
+            lines = in_file.readlines()
+
+        for idx, line in enumerate(lines):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                if idx == len(lines) - 1:
+                    # last edit was only partially written
+                    print("Warning: Incomplete last record on journal <" + self.filename + "> was ignored")
+                else:
+                    raise Exception("LectureAnnotationJournal: Invalid record on line " + str(idx + 1))
+
+        return records
+
+    def replay(self, lecture, base_filename, verbose=True):
+        # applies the journaled edits to the lecture loaded from base_filename, returns the number of edits
+        if not self.exists():
+            return 0
+
+        records = self.read_records()
+        if len(records) == 0 or records[0]["operation"] != "header":
+            raise Exception("LectureAnnotationJournal: Journal <" + self.filename + "> has no header")
+
+        header = records[0]
+        base_mtime, base_size = LectureAnnotationJournal.base_file_info(base_filename)
+        if header["base_mtime"] != base_mtime or header["base_size"] != base_size:
+            # the XML file was saved after the journal was started, the edits do not apply to it
+            stale_filename = self.filename + LectureAnnotationJournal.StaleExtension
+            os.replace(self.filename, stale_filename)
+            print("Warning: Journal does not match the annotation file, it was moved to: " + stale_filename)
+            return 0
+
+        for record in records[1:]:
+            LectureAnnotationJournal.apply_record(lecture, record)
+
+        if verbose and len(records) > 1:
+            print("Recovered {0:d} unsaved edit(s) from: {1:s}".format(len(records) - 1, self.filename))
+
+        return len(records) - 1
+
+    @staticmethod
+    def apply_record(lecture, record):
+        name = record["operation"]
+
+        if name == "object_added":
+            loc = record["location"]
+            lecture.add_object(record["id"], record["name"], record["shape"], loc["frame"], loc["abs_time"],
+                               loc["points"])
+            first_loc = lecture[record["id"]].locations[0]
+            first_loc.visible = loc["visible"]
+            first_loc.label = loc["label"]
+        elif name == "object_restored":
+            video_object = VideoObject(record["id"], record["name"], record["shape"], lecture.columnar_locations)
+            for loc in record["locations"]:
+                video_object.append_location(loc["visible"], loc["frame"], loc["abs_time"], loc["points"],
+                                             loc["label"])
+            lecture.video_objects[record["id"]] = video_object
+        elif name == "object_renamed":
+            lecture.rename_object(record["old_id"], record["new_id"], record["new_display"])
+        elif name == "object_removed":
+            lecture.remove_object(record["id"])
+        elif name == "keyframe_set":
+            loc = record["location"]
+            lecture[record["object_id"]].set_location_at(loc["frame"], loc["abs_time"], loc["visible"],
+                                                         loc["points"])
+        elif name == "keyframe_deleted":
+            lecture[record["object_id"]].del_location_at(record["frame"])
+        elif name == "keyframe_label":
+            video_object = lecture[record["object_id"]]
+            loc_idx = video_object.find_location_idx(record["frame"])
+            if loc_idx < len(video_object.locations) and video_object.locations[loc_idx].frame == record["frame"]:
+                video_object.locations[loc_idx].label = record["label"]
+        elif name == "vid_seg_split":
+            if record["split_point"] not in lecture.video_segments:
+                lecture.video_segments = sorted(lecture.video_segments + [record["split_point"]])
+        elif name == "vid_seg_merge":
+            if record["split_point"] in lecture.video_segments:
+                lecture.video_segments.remove(record["split_point"])
+        elif name == "vid_seg_keyframe_add":
+            if record["frame_index"] not in lecture.video_segment_keyframes:
+                lecture.video_segment_keyframes = sorted(lecture.video_segment_keyframes + [record["frame_index"]])
+        elif name == "vid_seg_keyframe_del":
+            if record["frame_index"] in lecture.video_segment_keyframes:
+                lecture.video_segment_keyframes.remove(record["frame_index"])
+        else:
+            raise Exception("LectureAnnotationJournal: Unknown operation <" + str(name) + ">")
@@ -1,7 +1,13 @@
 
-from scipy import interpolate
+import io
+import os
+from xml.sax.saxutils import escape
+
+import numpy as np
 
 from .video_object_location import VideoObjectLocation
+from .video_object_location_store import VideoObjectLocationStore
+from .video_object_trajectory import VideoObjectTrajectory
 
 
 class VideoObject:
@@ -12,14 +18,37 @@ class VideoObject:
     ShapeQuadrilateral = 1
     ShapePolygon = 2
 
-    def __init__(self, id, name, shape_type):
+    def __init__(self, id, name, shape_type, columnar=False):
         self.id = id
         self.name = name
-        self.locations = []
+        # key-frames are kept either on a list of VideoObjectLocation or on a columnar store
+        self.locations = VideoObjectLocationStore() if columnar else []
         self.shape_type = shape_type
+        # incremented on every change to the key-frames (used to keep indices up to date)
+        self.keyframes_version = 0
+
+    def keyframes_changed(self):
+        # must be called after modifying the values of a key-frame directly
+        self.keyframes_version += 1
+
+    def is_columnar(self):
+        return isinstance(self.locations, VideoObjectLocationStore)
+
+    def set_columnar(self, columnar):
+        if columnar and not self.is_columnar():
+            self.locations = VideoObjectLocationStore.from_locations(self.locations)
+        elif not columnar and self.is_columnar():
+            self.locations = [VideoObjectLocation.fromLocation(loc) for loc in self.locations]
+
+    def snapshot(self):
+        # independent copy of the object using columnar storage (cheap to create, e.g. for background saving)
+        copy = VideoObject(self.id, self.name, self.shape_type, True)
+        copy.locations = VideoObjectLocationStore.from_arrays(*self.get_keyframe_arrays())
+
+        return copy
 
     def make_polygon_split_copy(self):
-        new_poly_object = VideoObject(self.id, self.name, VideoObject.ShapePolygon)
+        new_poly_object = VideoObject(self.id, self.name, VideoObject.ShapePolygon, self.is_columnar())
         for loc in self.locations:
             split_polygon = loc.get_split_polygon()
 
@@ -41,11 +70,20 @@ class VideoObject:
         return self.locations[0].n_points()
 
     def update_timeline(self, frame_scale_factor, time_scale_factor):
+        self.keyframes_version += 1
+
+        if self.is_columnar():
+            self.locations.scale_timeline(frame_scale_factor, time_scale_factor)
+            return
+
         for loc in self.locations:
             loc.frame = int(round(loc.frame * frame_scale_factor))
             loc.abs_time *= time_scale_factor
 
     def find_location_idx(self, frame):
+        if self.is_columnar():
+            return self.locations.find_idx(frame)
+
         loc_min = 0
         loc_max = len(self.locations) - 1
         while loc_min <= loc_max:
@@ -64,6 +102,7 @@ class VideoObject:
         return loc_min
 
     def set_location_at(self, frame, abs_time, visible, polygon_points):
+        self.keyframes_version += 1
         loc_idx = self.find_location_idx(frame)
 
         if (loc_idx >= len(self.locations)) or (self.locations[loc_idx].frame != frame):
@@ -74,19 +113,34 @@ class VideoObject:
                 prev_label = None
 
             # does not exist, create
-            location = VideoObjectLocation(visible, frame, abs_time, polygon_points, prev_label)
-            # insert at desired idx ...
-            self.locations.insert(loc_idx, location)
+            if self.is_columnar():
+                # insert at desired idx (without creating a location object) ...
+                self.locations.insert_values(loc_idx, visible, frame, abs_time, polygon_points, prev_label)
+            else:
+                location = VideoObjectLocation(visible, frame, abs_time, polygon_points, prev_label)
+                # insert at desired idx ...
+                self.locations.insert(loc_idx, location)
 
             # Key-frame was added
             return True
         else:
             # udpate existing ...
-            self.locations[loc_idx].update(visible, polygon_points)
+            if self.is_columnar():
+                self.locations.update_values(loc_idx, visible, polygon_points)
+            else:
+                self.locations[loc_idx].update(visible, polygon_points)
 
             # an existing Key-frame was updated
             return False
 
+    def append_location(self, visible, frame, abs_time, polygon_points, label=None):
+        # add a key-frame at the end (key-frames are assumed to be added in order)
+        self.keyframes_version += 1
+        if self.is_columnar():
+            self.locations.insert_values(len(self.locations), visible, frame, abs_time, polygon_points, label)
+        else:
+            self.locations.append(VideoObjectLocation(visible, frame, abs_time, polygon_points, label))
+
     def del_location_at(self, frame):
         loc_idx = self.find_location_idx(frame)
 
@@ -96,6 +150,7 @@ class VideoObject:
         else:
             # exists
             del self.locations[loc_idx]
+            self.keyframes_version += 1
             return True
 
     def get_location_at(self, frame, out_range, interpolate=True):
@@ -130,88 +185,123 @@ class VideoObject:
                     return self.locations[loc_idx - 1]
 
     def all_unique_labels(self):
+        if self.is_columnar():
+            all_location_labels = self.locations.labels()
+        else:
+            all_location_labels = [loc.label for loc in self.locations]
+
         all_labels = {}
-        for loc in self.locations:
-            if loc.label in all_labels:
-                all_labels[loc.label] += 1
+        for label in all_location_labels:
+            if label in all_labels:
+                all_labels[label] += 1
             else:
-                all_labels[loc.label] = 1
+                all_labels[label] = 1
 
         return all_labels
 
+    def write_XML(self, out):
+        # writes the object and its key-frames directly to the given text stream
+        out.write("  <VideoObject>\n" +
+                  "    <Id>" + escape(self.id) + "</Id>\n" +
+                  "    <Name>" + escape(self.name) + "</Name>\n" +
+                  "    <Shape>" + str(self.shape_type) + "</Shape>\n" +
+                  "    <VideoObjectLocations>\n")
+        if self.is_columnar():
+            # write straight from the columns (no location views are created)
+            store = self.locations
+            frames = store.frames.tolist()
+            visible = store.visible.tolist()
+            times = store.times
+            points = store.points
+            labels = store.labels()
+            for idx in range(len(store)):
+                VideoObjectLocation.write_values_XML(out, "        ", visible[idx], frames[idx], times[idx],
+                                                     points[idx], labels[idx])
+        else:
+            for location in self.locations:
+                location.write_XML(out, "        ")
+        out.write("    </VideoObjectLocations>\n" +
+                  "  </VideoObject>\n")
+
     def toXML(self):
-        result = "  <VideoObject>\n"
-        result += "    <Id>" + self.id + "</Id>\n"
-        result += "    <Name>" + self.name + "</Name>\n"
-        result += "    <Shape>" + str(self.shape_type) + "</Shape>\n"
-        result += "    <VideoObjectLocations>\n"
-        for location in self.locations:
-            result += location.toXML("        ")
-        result += "    </VideoObjectLocations>\n"
+        out = io.StringIO()
+        self.write_XML(out)
 
-        result += "  </VideoObject>\n"
+        return out.getvalue()
 
-        return result
+    def get_keyframe_arrays(self):
+        # columns describing all key-frames: frames, times, visible, label ids, label names and points
+        if self.is_columnar():
+            store = self.locations
+            return (store.frames, store.times, store.visible, store.label_ids, list(store.label_names),
+                    store.points)
 
-    def get_export_info(self, total_frames):
-        # known information ...
-        all_frame_idxs = []
-        all_times = []
+        label_names = []
+        label_index = {}
+        label_ids = []
         for loc in self.locations:
-            all_frame_idxs.append(loc.frame)
-            all_times.append(loc.abs_time)
+            if loc.label is None:
+                label_ids.append(-1)
+            else:
+                if loc.label not in label_index:
+                    label_index[loc.label] = len(label_names)
+                    label_names.append(loc.label)
+                label_ids.append(label_index[loc.label])
 
-        # create inter/extra-polator function
-        time_f = interpolate.interp1d(all_frame_idxs, all_times, fill_value='extrapolate')
+        frames = np.array([loc.frame for loc in self.locations], dtype=np.int64)
+        times = np.array([loc.abs_time for loc in self.locations], dtype=np.float64)
+        visible = np.array([loc.visible for loc in self.locations], dtype=np.bool_)
+        label_ids = np.array(label_ids, dtype=np.int32)
+        points = np.array([loc.polygon_points for loc in self.locations], dtype=np.float64)
 
-        all_frames = []
-        for frame_idx in range(total_frames + 1):
-            frame_time = time_f([frame_idx])[0]
+        return frames, times, visible, label_ids, label_names, points
 
-            loc = self.get_location_at(frame_idx, True, True)
-            known = self.locations[0].frame <= frame_idx <= self.locations[-1].frame
+    def get_trajectory(self, start_frame, end_frame):
+        return VideoObjectTrajectory.FromVideoObject(self, start_frame, end_frame)
 
-            known_str = "1" if known else "0"
-            visible_str = "1" if loc.visible else "0"
+    def get_export_info(self, total_frames):
+        # all frames are estimated in batch
+        trajectory = self.get_trajectory(0, total_frames)
+
+        frame_times = trajectory.frame_times.tolist()
+        labels = trajectory.labels()
 
-            out_label = "" if loc.label is None else loc.label
+        all_frames = []
+        for row, frame_idx in enumerate(trajectory.frame_idxs.tolist()):
+            known_str = "1" if trajectory.known[row] else "0"
+            visible_str = "1" if trajectory.visible[row] else "0"
 
-            general_info = frame_idx, frame_time, known_str, visible_str, out_label
-            polygon_info = loc.polygon_points.ravel()
+            general_info = frame_idx, frame_times[row], known_str, visible_str, labels[row]
+            polygon_info = trajectory.points[row].ravel()
 
             all_frames.append((general_info, polygon_info))
 
         return all_frames
 
     def export_CSV(self, filename, total_frames):
-        # get all the frame-wise data to export
-        all_frames_info = self.get_export_info(total_frames)
-
-        # prepare output headers ....
-        all_lines = []
-        header = ["frame_idx", "frame_time", "known", "visible", "label"]
-        for p_idx in range(self.locations[0].polygon_points.shape[0]):
-            header += ["p_" + str(p_idx) + "_x", "p_" + str(p_idx) + "_y"]
-
-        all_lines.append(",".join(header) + "\n")
-
-        # for each frame to export ... create a string representation
-        for frame_idx in range(total_frames + 1):
-            general_info, polygon_info = all_frames_info[frame_idx]
-
-            frame_idx, frame_time, known_str, visible_str, out_label = general_info
-
-            line_info = [str(frame_idx), str(frame_time), known_str, visible_str, out_label]
-            line_info += [str(val) for val in polygon_info]
-
-            all_lines.append(",".join(line_info) + "\n")
-
-        with open(filename, "w", encoding="utf-8") as output_file:
-            output_file.writelines(all_lines)
-
+        # frame-wise data is computed and written in chunks
+        VideoObjectTrajectory.ExportCSV(self, filename, total_frames)
+
+    def export_NPZ(self, filename, total_frames):
+        VideoObjectTrajectory.ExportNPZ(self, filename, total_frames)
+
+    def export_parquet(self, filename, total_frames):
+        VideoObjectTrajectory.ExportParquet(self, filename, total_frames)
+
+    def export(self, filename, total_frames):
+        # select the output format based on the file extension
+        extension = os.path.splitext(filename)[1].lower()
+        if extension == ".csv":
+            self.export_CSV(filename, total_frames)
+        elif extension == ".npz":
+            self.export_NPZ(filename, total_frames)
+        elif extension == ".parquet":
+            self.export_parquet(filename, total_frames)
+        else:
+            raise Exception("VideoObject: Unknown export format <" + extension + ">")
 
     @staticmethod
-    def fromXML(root):
+    def fromXML(root, columnar=False):
         # general properties
         object_id = root.find(VideoObject.XMLNamespace + 'Id').text
         object_name = root.find(VideoObject.XMLNamespace + 'Name').text
@@ -227,7 +317,7 @@ class VideoObject:
                               VideoObject.ShapePolygon]:
             raise Exception("VideoObject: Invalid Shape Type found!")
 
-        video_object = VideoObject(object_id, object_name, shape_type)
+        video_object = VideoObject(object_id, object_name, shape_type, columnar)
 
         # locations
         locations_root = root.find(VideoObject.XMLNamespace + 'VideoObjectLocations')
@@ -0,0 +1,99 @@
+
+import os
+import fnmatch
+from multiprocessing import Pool
+
+from AM_CommonTools.util.time_helper import TimeHelper
+from .lecture_annotation import LectureAnnotation
+
+
+class VideoObjectExporter:
+    # Exports the frame-wise data of many video objects (from many lecture annotation files)
+    # using a pool of processes. Each job is one annotation file: the process loads it once
+    # and exports all of its selected objects.
+    Formats = ["csv", "npz", "parquet"]
+
+    def __init__(self, export_format="csv", output_dir=None, workers=None, object_patterns=None):
+        export_format = export_format.lower()
+        if export_format not in VideoObjectExporter.Formats:
+            raise Exception("VideoObjectExporter: Unknown export format <" + export_format + ">")
+
+        self.export_format = export_format
+        self.output_dir = output_dir
+        self.workers = workers if workers is not None and workers > 0 else os.cpu_count()
+        # patterns (e.g. "board_*") used to select objects by id, None = all objects
+        self.object_patterns = object_patterns
+
+    def object_selected(self, object_id):
+        if self.object_patterns is None:
+            return True
+
+        for pattern in self.object_patterns:
+            if fnmatch.fnmatch(object_id, pattern.lower()):
+                return True
+
+        return False
+
+    def output_filename(self, annotation_filename, object_id):
+        # same naming used by the annotation tool: [annotation prefix]_[object id].[format]
+        prefix = os.path.splitext(annotation_filename)[0]
+        if self.output_dir is not None:
+            prefix = self.output_dir + "/" + os.path.basename(prefix)
+
+        return "{0:s}_{1:s}.{2:s}".format(prefix, object_id, self.export_format)
+
+    def create_jobs(self, annotation_filenames):
+        # (annotation files are only parsed by the processes that export them)
+        return [(annotation_filename, self.object_patterns, self.output_dir, self.export_format)
+                for annotation_filename in annotation_filenames]
+
+    @staticmethod
+    def export_job(job):
+        annotation_filename, object_patterns, output_dir, export_format = job
+        exporter = VideoObjectExporter(export_format, output_dir, 1, object_patterns)
+
+        annotation = LectureAnnotation.Load(annotation_filename, False, True)
+
+        exported = []
+        for object_id in sorted(annotation.video_objects.keys()):
+            if exporter.object_selected(object_id):
+                output_filename = exporter.output_filename(annotation_filename, object_id)
+                annotation[object_id].export(output_filename, int(annotation.total_frames))
+                exported.append(output_filename)
+
+        return exported
+
+    def export(self, annotation_filenames, verbose=True):
+        timer = TimeHelper()
+        timer.startTimer()
+
+        if self.output_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+        jobs = self.create_jobs(annotation_filenames)
+        if verbose:
+            print("Exporting video objects from {0:d} annotation file(s) using {1:d} process(es)".format(
+                len(jobs), self.workers))
+
+        exported = []
+        if self.workers <= 1 or len(jobs) <= 1:
+            for job in jobs:
+                job_exported = VideoObjectExporter.export_job(job)
+                exported += job_exported
+                if verbose:
+                    for output_filename in job_exported:
+                        print("-> Object data saved to " + output_filename)
+        else:
+            with Pool(min(self.workers, len(jobs))) as pool:
+                for job_exported in pool.imap_unordered(VideoObjectExporter.export_job, jobs):
+                    exported += job_exported
+                    if verbose:
+                        for output_filename in job_exported:
+                            print("-> Object data saved to " + output_filename)
+
+        timer.endTimer()
+
+        if verbose:
+            print("Export completed: " + timer.totalElapsedStamp())
+
+        return exported
@@ -0,0 +1,96 @@
+
+import bisect
+
+import numpy as np
+
+from .video_object_index import VideoObjectIndex
+
+
+class VideoObjectFrameCache:
+    # Per-frame locations of all video objects for continuous playback. For each object it keeps
+    # its key-frame columns, the key-frame interval used on the last frame, and a pre-allocated
+    # buffer where locations are interpolated (no VideoObjectLocation/shapely objects are created).
+    # Objects are re-cached only when their key-frames change. The annotated range of every object
+    # is kept on arrays, so the set of active objects per frame is found in a single vectorized step.
+    def __init__(self):
+        # object id -> entry
+        self.entries = {}
+
+        # ranges of all objects (same order as object_ids)
+        self.object_ids = []
+        self.first_frames = np.zeros(0, dtype=np.int64)
+        self.last_frames = np.zeros(0, dtype=np.int64)
+
+    def refresh(self, video_objects):
+        # updates the entries of objects that were added or changed, returns the ids of these objects
+        changed = []
+        removed = [object_id for object_id in self.entries if object_id not in video_objects]
+        for object_id in removed:
+            del self.entries[object_id]
+
+        for object_id, video_object in video_objects.items():
+            key = VideoObjectIndex.entry_key(video_object)
+            entry = self.entries.get(object_id)
+            if entry is None or entry["key"] != key:
+                self.entries[object_id] = VideoObjectFrameCache.create_entry(video_object, key)
+                changed.append(object_id)
+
+        if len(changed) > 0 or len(removed) > 0:
+            self.object_ids = [object_id for object_id in self.entries if self.entries[object_id]["frames"]]
+            self.first_frames = np.array([self.entries[object_id]["frames"][0] for object_id in self.object_ids],
+                                         dtype=np.int64)
+            self.last_frames = np.array([self.entries[object_id]["frames"][-1] for object_id in self.object_ids],
+                                        dtype=np.int64)
+
+        return changed
+
+    @staticmethod
+    def create_entry(video_object, key):
+        frames, _, visible, _, _, points = video_object.get_keyframe_arrays()
+        n_points = points.shape[1] if points.shape[0] > 0 else 0
+
+        return {
+            "key": key,
+            "frames": frames.tolist(),
+            "visible": visible.tolist(),
+            "points": points.copy(),
+            # last interval used [frames[prev], frames[prev + 1])
+            "prev": 0,
+            "buffer": np.zeros((n_points, 2), dtype=np.float64),
+        }
+
+    def active_objects(self, frame_idx):
+        # objects annotated on the given frame (between their first and last key-frames)
+        active = np.nonzero((self.first_frames <= frame_idx) & (frame_idx <= self.last_frames))[0]
+
+        return [self.object_ids[idx] for idx in active]
+
+    def in_range(self, object_id, frame_idx):
+        frames = self.entries[object_id]["frames"]
+
+        return len(frames) > 0 and frames[0] <= frame_idx <= frames[-1]
+
+    def location_at(self, object_id, frame_idx):
+        # points (in a buffer re-used on every call) and visibility of the object at the given frame
+        # (the first/last key-frames are used out of range)
+        entry = self.entries[object_id]
+        frames = entry["frames"]
+        n_frames = len(frames)
+        prev = entry["prev"]
+
+        # consecutive frames usually fall in the same interval as the last call
+        if not (prev < n_frames and frames[prev] <= frame_idx and (prev + 1 >= n_frames or frame_idx < frames[prev + 1])):
+            prev = max(0, bisect.bisect_right(frames, frame_idx) - 1)
+            entry["prev"] = prev
+
+        buffer = entry["buffer"]
+        points = entry["points"]
+        if frame_idx <= frames[prev] or prev + 1 >= n_frames:
+            # exact key-frame or out of range
+            buffer[:] = points[prev]
+        else:
+            w = (frame_idx - frames[prev]) / float(frames[prev + 1] - frames[prev])
+            np.multiply(points[prev], 1.0 - w, out=buffer)
+            buffer += points[prev + 1] * w
+
+        return buffer, entry["visible"][prev]
@@ -0,0 +1,105 @@
+
+import bisect
+import math
+
+import numpy as np
+
+
+class VideoObjectIndex:
+    # Spatial index over the key-frames of the video objects of a lecture. For each object it
+    # keeps the bounding box of every key-frame, and a uniform grid maps each cell to the objects
+    # whose full extent (all key-frames) overlaps it. Since locations are linearly interpolated,
+    # the location of an object at any frame is contained in the union of the boxes of the two
+    # surrounding key-frames (or in the box of the first/last key-frame out of range). Point
+    # queries only run exact polygon tests on the few objects that pass both filters.
+    #
+    # Entries are refreshed lazily (only for objects whose key-frames changed) before each query.
+    CellSize = 64.0
+
+    def __init__(self, cell_size=None):
+        self.cell_size = VideoObjectIndex.CellSize if cell_size is None else cell_size
+
+        # object id -> (version key, key-frame frames (list), key-frame boxes (n x 4), grid cells)
+        self.entries = {}
+        # grid cell -> set of object ids
+        self.grid = {}
+
+    @staticmethod
+    def entry_key(video_object):
+        # changes every time that the key-frames of the object are modified (or replaced)
+        return video_object.keyframes_version, id(video_object.locations), len(video_object.locations)
+
+    def __cells(self, min_x, min_y, max_x, max_y):
+        cells = []
+        for cell_x in range(int(math.floor(min_x / self.cell_size)), int(math.floor(max_x / self.cell_size)) + 1):
+            for cell_y in range(int(math.floor(min_y / self.cell_size)), int(math.floor(max_y / self.cell_size)) + 1):
+                cells.append((cell_x, cell_y))
+
+        return cells
+
+    def remove(self, object_id):
+        if object_id not in self.entries:
+            return
+
+        for cell in self.entries[object_id][3]:
+            self.grid[cell].discard(object_id)
+            if len(self.grid[cell]) == 0:
+                del self.grid[cell]
+
+        del self.entries[object_id]
+
+    def update(self, video_object):
+        # (re-)indexes the key-frames of a single object
+        self.remove(video_object.id)
+
+        if len(video_object.locations) == 0:
+            return
+
+        frames, _, _, _, _, points = video_object.get_keyframe_arrays()
+        boxes = np.hstack((points.min(axis=1), points.max(axis=1)))
+
+        min_x, min_y = boxes[:, :2].min(axis=0)
+        max_x, max_y = boxes[:, 2:].max(axis=0)
+        cells = self.__cells(min_x, min_y, max_x, max_y)
+        for cell in cells:
+            if cell not in self.grid:
+                self.grid[cell] = set()
+            self.grid[cell].add(video_object.id)
+
+        self.entries[video_object.id] = (VideoObjectIndex.entry_key(video_object), frames.tolist(), boxes, cells)
+
+    def refresh(self, video_objects):
+        # removes deleted (or renamed) objects and re-indexes the objects that changed
+        for object_id in [object_id for object_id in self.entries if object_id not in video_objects]:
+            self.remove(object_id)
+
+        for object_id, video_object in video_objects.items():
+            entry = self.entries.get(object_id)
+            if entry is None or entry[0] != VideoObjectIndex.entry_key(video_object):
+                self.update(video_object)
+
+    def candidates(self, x, y, frame_idx):
+        # ids of the objects whose location at the given frame might contain the point
+        cell = (int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size)))
+        if cell not in self.grid:
+            return []
+
+        result = []
+        for object_id in self.grid[cell]:
+            _, frames, boxes, _ = self.entries[object_id]
+
+            # key-frames that define the location of the object at this frame
+            next_idx = bisect.bisect_left(frames, frame_idx)
+            if next_idx < len(frames) and frames[next_idx] == frame_idx:
+                segment = boxes[next_idx:next_idx + 1]
+            elif next_idx == 0:
+                segment = boxes[0:1]
+            elif next_idx == len(frames):
+                segment = boxes[-1:]
+            else:
+                segment = boxes[next_idx - 1:next_idx + 1]
+
+            if (segment[:, 0].min() <= x <= segment[:, 2].max()) and (segment[:, 1].min() <= y <= segment[:, 3].max()):
+                result.append(object_id)
+
+        return result
@@ -1,4 +1,7 @@
 
+import io
+from xml.sax.saxutils import escape
+
 import numpy as np
 from shapely.geometry import asPolygon, Polygon
 
@@ -105,28 +108,66 @@ class VideoObjectLocation:
 
         return result
 
-    def toXML(self, indent=None):
-        if indent is None:
-            indent = ""
-        result = indent + "<VideoObjectLocation>\n"
-        result += indent + "  <Visible>" + ("1" if self.visible else "0") + "</Visible>\n"
-        result += indent + "  <Frame>" + str(self.frame) + "</Frame>\n"
-        result += indent + "  <AbsTime>" + str(self.abs_time) + "</AbsTime>\n"
-        if self.label is not None:
+    def write_XML(self, out, indent=None):
+        # writes the location directly to the given text stream (file or io.StringIO)
+        VideoObjectLocation.write_values_XML(out, "" if indent is None else indent, self.visible, self.frame,
+                                             self.abs_time, self.polygon_points, self.label)
+
+    @staticmethod
+    def write_values_XML(out, indent, visible, frame, abs_time, polygon_points, label):
+        parts = [indent, "<VideoObjectLocation>\n",
+                 indent, "  <Visible>", ("1" if visible else "0"), "</Visible>\n",
+                 indent, "  <Frame>", str(frame), "</Frame>\n",
+                 indent, "  <AbsTime>", str(abs_time), "</AbsTime>\n"]
+        if label is not None:
             # optional label ...
-            result += indent + "  <Label>" + self.label + "</Label>\n"
-        result += indent + "  <Polygon>\n"
-        for x, y in self.polygon_points:
-            result += indent + "    <Point>\n"
-            result += indent + "      <X>" + str(x) + "</X>\n"
-            result += indent + "      <Y>" + str(y) + "</Y>\n"
-            result += indent + "    </Point>\n"
+            parts += [indent, "  <Label>", escape(label), "</Label>\n"]
+        parts += [indent, "  <Polygon>\n"]
+        point_start = indent + "    <Point>\n" + indent + "      <X>"
+        point_mid = "</X>\n" + indent + "      <Y>"
+        point_end = "</Y>\n" + indent + "    </Point>\n"
+        for x, y in polygon_points:
+            parts += [point_start, str(x), point_mid, str(y), point_end]
 
-        result += indent + "  </Polygon>\n"
+        parts += [indent, "  </Polygon>\n",
+                  indent, "</VideoObjectLocation>\n"]
 
-        result += indent + "</VideoObjectLocation>\n"
+        out.write("".join(parts))
 
-        return result
+    def toXML(self, indent=None):
+        out = io.StringIO()
+        self.write_XML(out, indent)
+
+        return out.getvalue()
+
+    @staticmethod
+    def values_from_XML(root, namespace=''):
+        # single pass over the children of the location node, points are converted in bulk
+        children = {child.tag: child for child in root}
+
+        visible = int(children[namespace + 'Visible'].text) > 0
+        frame = int(children[namespace + 'Frame'].text)
+        abs_time = float(children[namespace + 'AbsTime'].text)
+
+        label_root = children.get(namespace + 'Label')
+        label = None if label_root is None else label_root.text
+
+        polygon_root = children.get(namespace + 'Polygon')
+        if polygon_root is None:
+            print("Warning: Legacy Object Location Annotation found")
+
+            # check for old-rectangular based model
+            x, y, w, h = [float(children[namespace + tag].text) for tag in ['X', 'Y', 'W', 'H']]
+            polygon_points = np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]])
+        else:
+            all_x = [node.text for node in polygon_root.iter(namespace + 'X')]
+            all_y = [node.text for node in polygon_root.iter(namespace + 'Y')]
+
+            polygon_points = np.empty((len(all_x), 2), dtype=np.float64)
+            polygon_points[:, 0] = np.array(all_x, dtype=np.float64)
+            polygon_points[:, 1] = np.array(all_y, dtype=np.float64)
+
+        return visible, frame, abs_time, polygon_points, label
 
     @staticmethod
     def fromXML(root):
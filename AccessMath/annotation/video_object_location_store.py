@@ -0,0 +1,328 @@
+
+import weakref
+
+import numpy as np
+from shapely.geometry import asPolygon
+
+from .video_object_location import VideoObjectLocation
+
+
+class VideoObjectLocationView(VideoObjectLocation):
+    # A lazy VideoObjectLocation that reads (and writes) its values directly from a row of a
+    # VideoObjectLocationStore. Views are created on demand and keep track of their row when
+    # other key-frames are inserted or removed from the store.
+    def __init__(self, store, idx):
+        # Note: VideoObjectLocation.__init__ is not called, all values live in the store
+        self._store = store
+        self._idx = idx
+
+    @property
+    def visible(self):
+        return bool(self._store.visible[self._idx])
+
+    @visible.setter
+    def visible(self, value):
+        self._store.visible[self._idx] = value
+
+    @property
+    def frame(self):
+        return int(self._store.frames[self._idx])
+
+    @frame.setter
+    def frame(self, value):
+        self._store.frames[self._idx] = value
+
+    @property
+    def abs_time(self):
+        return float(self._store.times[self._idx])
+
+    @abs_time.setter
+    def abs_time(self, value):
+        self._store.times[self._idx] = value
+
+    @property
+    def label(self):
+        return self._store.get_label(self._store.label_ids[self._idx])
+
+    @label.setter
+    def label(self, value):
+        self._store.label_ids[self._idx] = self._store.get_label_id(value)
+
+    @property
+    def polygon_points(self):
+        # a copy of the row of the packed point array (rows can move or be reallocated inside the store,
+        # so a view would become stale), modifications must be done with update
+        return self._store.points[self._idx].copy()
+
+    @property
+    def polygon(self):
+        # the adapter is not cached since rows can move inside the store
+        return asPolygon(self.polygon_points)
+
+    def update(self, visible, polygon_points):
+        self._store.update_values(self._idx, visible, polygon_points)
+
+    def n_points(self):
+        return self._store.n_points
+
+    def detach(self):
+        # the row is about to be removed from the store, keep a private copy of its values
+        self._store = self._store.copy_rows(self._idx, self._idx + 1)
+        self._idx = 0
+
+
+class VideoObjectLocationStore:
+    # Array-based storage for the key-frames of a single VideoObject. Key-frames are kept in
+    # columns (frames, times, visible flags, label ids and one packed (N, P, 2) point array)
+    # instead of a list of VideoObjectLocation objects. The store mimics the parts of the list
+    # interface used by VideoObject and the annotation GUI, and returns lazy views on access.
+    InitialCapacity = 16
+
+    def __init__(self, n_points=None, capacity=None):
+        self.n_points = n_points
+        self.size = 0
+
+        # label table (label id -1 is used for None)
+        self.label_names = []
+        self.label_index = {}
+
+        self._frames = None
+        self._times = None
+        self._visible = None
+        self._label_ids = None
+        self._points = None
+
+        # live views that must be updated when rows move
+        self._views = weakref.WeakSet()
+
+        if n_points is not None:
+            self.__allocate(VideoObjectLocationStore.InitialCapacity if capacity is None else capacity)
+
+    def __allocate(self, capacity):
+        frames = np.zeros(capacity, dtype=np.int64)
+        times = np.zeros(capacity, dtype=np.float64)
+        visible = np.zeros(capacity, dtype=np.bool_)
+        label_ids = np.full(capacity, -1, dtype=np.int32)
+        points = np.zeros((capacity, self.n_points, 2), dtype=np.float64)
+
+        if self._frames is not None:
+            # copy existing rows
+            frames[:self.size] = self._frames[:self.size]
+            times[:self.size] = self._times[:self.size]
+            visible[:self.size] = self._visible[:self.size]
+            label_ids[:self.size] = self._label_ids[:self.size]
+            points[:self.size] = self._points[:self.size]
+
+        self._frames = frames
+        self._times = times
+        self._visible = visible
+        self._label_ids = label_ids
+        self._points = points
+
+    def capacity(self):
+        return 0 if self._frames is None else self._frames.shape[0]
+
+    # ===================================================
+    #   Columns (only the valid rows are exposed)
+    # ===================================================
+    @property
+    def frames(self):
+        return self._frames[:self.size] if self._frames is not None else np.zeros(0, dtype=np.int64)
+
+    @property
+    def times(self):
+        return self._times[:self.size] if self._times is not None else np.zeros(0, dtype=np.float64)
+
+    @property
+    def visible(self):
+        return self._visible[:self.size] if self._visible is not None else np.zeros(0, dtype=np.bool_)
+
+    @property
+    def label_ids(self):
+        return self._label_ids[:self.size] if self._label_ids is not None else np.zeros(0, dtype=np.int32)
+
+    @property
+    def points(self):
+        if self._points is None:
+            return np.zeros((0, 0, 2), dtype=np.float64)
+
+        return self._points[:self.size]
+
+    def get_label(self, label_id):
+        return None if label_id < 0 else self.label_names[label_id]
+
+    def get_label_id(self, label):
+        if label is None:
+            return -1
+
+        if label not in self.label_index:
+            self.label_index[label] = len(self.label_names)
+            self.label_names.append(label)
+
+        return self.label_index[label]
+
+    def labels(self):
+        # label per row (None if not labeled)
+        return [self.get_label(label_id) for label_id in self.label_ids]
+
+    # ===================================================
+    #   Row operations
+    # ===================================================
+    def find_idx(self, frame):
+        # position of the key-frame, or the position where it should be inserted
+        return int(np.searchsorted(self.frames, frame, side='left'))
+
+    def insert_values(self, idx, visible, frame, abs_time, polygon_points, label=None):
+        polygon_points = np.asarray(polygon_points, dtype=np.float64)
+
+        if self.n_points is None:
+            # first key-frame defines the number of points of the polygon
+            self.n_points = polygon_points.shape[0]
+            self.__allocate(VideoObjectLocationStore.InitialCapacity)
+        elif polygon_points.shape[0] != self.n_points:
+            raise Exception("VideoObjectLocationStore: All locations must have the same number of points")
+
+        if idx < 0:
+            idx += self.size
+        idx = max(0, min(idx, self.size))
+
+        if self.size == self.capacity():
+            # grow (amortized constant time)
+            self.__allocate(max(VideoObjectLocationStore.InitialCapacity, self.capacity() * 2))
+
+        if idx < self.size:
+            # shift the rows after the insertion point
+            self._frames[idx + 1:self.size + 1] = self._frames[idx:self.size]
+            self._times[idx + 1:self.size + 1] = self._times[idx:self.size]
+            self._visible[idx + 1:self.size + 1] = self._visible[idx:self.size]
+            self._label_ids[idx + 1:self.size + 1] = self._label_ids[idx:self.size]
+            self._points[idx + 1:self.size + 1] = self._points[idx:self.size]
+
+            for view in self._views:
+                if view._idx >= idx:
+                    view._idx += 1
+
+        self._frames[idx] = frame
+        self._times[idx] = abs_time
+        self._visible[idx] = visible
+        self._label_ids[idx] = self.get_label_id(label)
+        self._points[idx] = polygon_points
+
+        self.size += 1
+
+    def update_values(self, idx, visible, polygon_points):
+        self.visible[idx] = visible
+        self.points[idx] = polygon_points
+
+    def insert(self, idx, location):
+        self.insert_values(idx, location.visible, location.frame, location.abs_time, location.polygon_points,
+                           location.label)
+
+    def append(self, location):
+        self.insert_values(self.size, location.visible, location.frame, location.abs_time,
+                           location.polygon_points, location.label)
+
+    def extend(self, locations):
+        for location in locations:
+            self.append(location)
+
+    def scale_timeline(self, frame_scale_factor, time_scale_factor):
+        frames = self.frames
+        frames[:] = np.round(frames * frame_scale_factor).astype(np.int64)
+        self.times[:] *= time_scale_factor
+
+    def copy_rows(self, start, end):
+        copy = VideoObjectLocationStore(self.n_points, max(1, end - start))
+
+        copy._frames[:end - start] = self._frames[start:end]
+        copy._times[:end - start] = self._times[start:end]
+        copy._visible[:end - start] = self._visible[start:end]
+        copy._points[:end - start] = self._points[start:end]
+        copy.size = end - start
+
+        # labels are re-indexed on the copy
+        for row, label_id in enumerate(self._label_ids[start:end]):
+            copy._label_ids[row] = copy.get_label_id(self.get_label(label_id))
+
+        return copy
+
+    def copy(self):
+        return self.copy_rows(0, self.size)
+
+    @staticmethod
+    def from_locations(locations):
+        locations = list(locations)
+        n_points = locations[0].n_points() if len(locations) > 0 else None
+        store = VideoObjectLocationStore(n_points, max(len(locations), VideoObjectLocationStore.InitialCapacity))
+        for location in locations:
+            store.append(location)
+
+        return store
+
+    @staticmethod
+    def from_arrays(frames, times, visible, label_ids, label_names, points):
+        # store with a copy of the given columns (same layout returned by VideoObject.get_keyframe_arrays)
+        n_rows = frames.shape[0]
+        if n_rows == 0:
+            return VideoObjectLocationStore()
+
+        store = VideoObjectLocationStore(points.shape[1], n_rows)
+        store._frames[:] = frames
+        store._times[:] = times
+        store._visible[:] = visible
+        store._label_ids[:] = label_ids
+        store._points[:] = points
+        store.label_names = list(label_names)
+        store.label_index = {label: idx for idx, label in enumerate(store.label_names)}
+        store.size = n_rows
+
+        return store
+
+    # ===================================================
+    #   List-like interface
+    # ===================================================
+    def __len__(self):
+        return self.size
+
+    def __normalize_idx(self, idx):
+        if idx < 0:
+            idx += self.size
+
+        if idx < 0 or idx >= self.size:
+            raise IndexError("VideoObjectLocationStore: index out of range")
+
+        return idx
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[row] for row in range(*idx.indices(self.size))]
+
+        view = VideoObjectLocationView(self, self.__normalize_idx(idx))
+        self._views.add(view)
+
+        return view
+
+    def __delitem__(self, idx):
+        idx = self.__normalize_idx(idx)
+
+        for view in list(self._views):
+            if view._idx == idx:
+                view.detach()
+                self._views.discard(view)
+            elif view._idx > idx:
+                view._idx -= 1
+
+        self._frames[idx:self.size - 1] = self._frames[idx + 1:self.size]
+        self._times[idx:self.size - 1] = self._times[idx + 1:self.size]
+        self._visible[idx:self.size - 1] = self._visible[idx + 1:self.size]
+        self._label_ids[idx:self.size - 1] = self._label_ids[idx + 1:self.size]
+        self._points[idx:self.size - 1] = self._points[idx + 1:self.size]
+
+        self.size -= 1
+
+    def __iter__(self):
+        for idx in range(self.size):
+            yield self[idx]
+
+    def __repr__(self):
+        return "LocStore<{0:d} key-frames, {1} points>".format(self.size, self.n_points)
@@ -0,0 +1,167 @@
+
+import numpy as np
+
+
+class VideoObjectTrajectory:
+    # Dense (frame by frame) representation of a VideoObject over a range of frames. All values
+    # are computed in batch from the key-frames of the object, following the same rules used by
+    # VideoObject.get_location_at (linear interpolation between key-frames, first/last key-frame
+    # outside of the annotated range) and the same linear inter/extra-polation of frame times
+    # used by the original CSV export
+    ExportChunkSize = 10000
+
+    def __init__(self, frame_idxs, frame_times, known, visible, label_ids, label_names, points):
+        self.frame_idxs = frame_idxs
+        self.frame_times = frame_times
+        self.known = known
+        self.visible = visible
+        self.label_ids = label_ids
+        self.label_names = label_names
+        self.points = points
+
+    def __len__(self):
+        return self.frame_idxs.shape[0]
+
+    def n_points(self):
+        return self.points.shape[1]
+
+    def labels(self):
+        return [("" if label_id < 0 else self.label_names[label_id]) for label_id in self.label_ids]
+
+    @staticmethod
+    def interpolate_times(kf_frames, kf_times, frame_idxs):
+        if kf_frames.shape[0] == 1:
+            # a single key-frame, no rate can be estimated
+            return np.full(frame_idxs.shape[0], kf_times[0], dtype=np.float64)
+
+        # same segment selection and formula used by scipy's interp1d (linear, extrapolate)
+        hi = np.clip(np.searchsorted(kf_frames, frame_idxs, side='left'), 1, kf_frames.shape[0] - 1)
+        lo = hi - 1
+
+        slope = (kf_times[hi] - kf_times[lo]) / (kf_frames[hi] - kf_frames[lo])
+
+        return slope * (frame_idxs - kf_frames[lo]) + kf_times[lo]
+
+    @staticmethod
+    def FromKeyframes(kf_frames, kf_times, kf_visible, kf_label_ids, label_names, kf_points, start_frame, end_frame):
+        n_keyframes = kf_frames.shape[0]
+        if n_keyframes == 0:
+            raise Exception("VideoObjectTrajectory: Cannot estimate trajectory, no existing locations")
+
+        frame_idxs = np.arange(start_frame, end_frame + 1, dtype=np.int64)
+
+        frame_times = VideoObjectTrajectory.interpolate_times(kf_frames, kf_times, frame_idxs)
+
+        # last key-frame at or before each frame (the first one is used before the annotated range)
+        prev_idx = np.clip(np.searchsorted(kf_frames, frame_idxs, side='right') - 1, 0, n_keyframes - 1)
+        next_idx = np.minimum(prev_idx + 1, n_keyframes - 1)
+
+        # interpolation weights (zero for exact key-frames and frames out of range)
+        interval = kf_frames[next_idx] - kf_frames[prev_idx]
+        offset = frame_idxs - kf_frames[prev_idx]
+        in_between = (interval > 0) & (offset > 0)
+        weights = np.zeros(frame_idxs.shape[0], dtype=np.float64)
+        weights[in_between] = offset[in_between] / interval[in_between]
+
+        w = weights[:, None, None]
+        points = kf_points[prev_idx] * (1.0 - w) + kf_points[next_idx] * w
+
+        known = (kf_frames[0] <= frame_idxs) & (frame_idxs <= kf_frames[-1])
+
+        return VideoObjectTrajectory(frame_idxs, frame_times, known, kf_visible[prev_idx], kf_label_ids[prev_idx],
+                                     label_names, points)
+
+    @staticmethod
+    def FromVideoObject(video_object, start_frame, end_frame):
+        frames, times, visible, label_ids, label_names, points = video_object.get_keyframe_arrays()
+
+        return VideoObjectTrajectory.FromKeyframes(frames, times, visible, label_ids, label_names, points,
+                                                   start_frame, end_frame)
+
+    @staticmethod
+    def IterateChunks(video_object, total_frames, chunk_size=None):
+        if chunk_size is None:
+            chunk_size = VideoObjectTrajectory.ExportChunkSize
+
+        frames, times, visible, label_ids, label_names, points = video_object.get_keyframe_arrays()
+
+        for start_frame in range(0, total_frames + 1, chunk_size):
+            end_frame = min(start_frame + chunk_size - 1, total_frames)
+
+            yield VideoObjectTrajectory.FromKeyframes(frames, times, visible, label_ids, label_names, points,
+                                                      start_frame, end_frame)
+
+    @staticmethod
+    def CSVHeader(n_points):
+        header = ["frame_idx", "frame_time", "known", "visible", "label"]
+        for p_idx in range(n_points):
+            header += ["p_" + str(p_idx) + "_x", "p_" + str(p_idx) + "_y"]
+
+        return ",".join(header) + "\n"
+
+    def to_CSV_lines(self):
+        all_lines = []
+
+        frame_idxs = self.frame_idxs.tolist()
+        frame_times = self.frame_times.tolist()
+        known = self.known.tolist()
+        visible = self.visible.tolist()
+        labels = self.labels()
+        points = self.points.reshape(self.points.shape[0], -1).tolist()
+
+        for row in range(len(frame_idxs)):
+            line_info = [str(frame_idxs[row]), str(frame_times[row]), "1" if known[row] else "0",
+                         "1" if visible[row] else "0", labels[row]]
+            line_info += [str(val) for val in points[row]]
+
+            all_lines.append(",".join(line_info) + "\n")
+
+        return all_lines
+
+    @staticmethod
+    def ExportCSV(video_object, filename, total_frames, chunk_size=None):
+        with open(filename, "w", encoding="utf-8") as output_file:
+            output_file.write(VideoObjectTrajectory.CSVHeader(video_object.polygon_points()))
+
+            # compute and write one chunk of frames at a time
+            for trajectory in VideoObjectTrajectory.IterateChunks(video_object, total_frames, chunk_size):
+                output_file.writelines(trajectory.to_CSV_lines())
+
+    @staticmethod
+    def ExportNPZ(video_object, filename, total_frames, compressed=True):
+        trajectory = VideoObjectTrajectory.FromVideoObject(video_object, 0, total_frames)
+
+        save_function = np.savez_compressed if compressed else np.savez
+        save_function(filename, frame_idx=trajectory.frame_idxs, frame_time=trajectory.frame_times,
+                      known=trajectory.known, visible=trajectory.visible, label_id=trajectory.label_ids,
+                      label_names=np.array(trajectory.label_names, dtype=np.str_), points=trajectory.points)
+
+    @staticmethod
+    def ExportParquet(video_object, filename, total_frames, chunk_size=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception("VideoObjectTrajectory: pyarrow is required to export Parquet files")
+
+        n_points = video_object.polygon_points()
+        column_names = VideoObjectTrajectory.CSVHeader(n_points).strip().split(",")
+
+        writer = None
+        try:
+            for trajectory in VideoObjectTrajectory.IterateChunks(video_object, total_frames, chunk_size):
+                flat_points = trajectory.points.reshape(trajectory.points.shape[0], -1)
+
+                columns = [pa.array(trajectory.frame_idxs), pa.array(trajectory.frame_times),
+                           pa.array(trajectory.known), pa.array(trajectory.visible),
+                           pa.array(trajectory.labels(), type=pa.string())]
+                columns += [pa.array(flat_points[:, col]) for col in range(flat_points.shape[1])]
+
+                table = pa.Table.from_arrays(columns, names=column_names)
+                if writer is None:
+                    writer = pq.ParquetWriter(filename, table.schema)
+
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
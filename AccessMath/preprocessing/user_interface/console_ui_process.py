@@ -1,5 +1,6 @@
 
 import os
+import concurrent.futures
 
 from AM_CommonTools.configuration.configuration import Configuration
 from AM_CommonTools.util.time_helper import TimeHelper
@@ -119,33 +120,92 @@ class ConsoleUIProcess:
         return m_videos, out_file, skip
 
     def start_video_processing(self, frames_per_second, get_worker_function, get_results_function, frames_limit=0,
-                               verbose=False,force_no_seek=False):
-        for lecture in self.database.lectures:
-            self.current_lecture = lecture
-            m_videos, out_file, skip = self.get_lecture_params(lecture)
-
-            if skip:
-                continue
-
-            # create a worker ...
-            worker = get_worker_function(self)
-
-            # execute the actual process ....
-            processor = VideoProcessor(m_videos, frames_per_second)
-            if "forced_width" in lecture.parameters:
-                processor.force_resolution(lecture.parameters["forced_width"], lecture.parameters["forced_height"])
-            processor.doProcessing(worker, frames_limit, verbose,force_no_seek) # 0
-
-            # save results
-            if self.output_temp_prefix is not None:
-                results = get_results_function(worker)
-
-                os.makedirs(self.temp_dir, exist_ok=True)
-                if not isinstance(self.output_temp_prefix, list):
-                    MiscHelper.dump_save(results, self.temp_dir + '/' + self.output_temp_prefix + out_file)
-                else:
-                    for out_idx, temp_prefix in enumerate(self.output_temp_prefix):
-                        MiscHelper.dump_save(results[out_idx], self.temp_dir + '/' + temp_prefix + out_file)
+                               verbose=False,force_no_seek=False, workers=1, decode_workers=1):
+        # (workers > 1) lectures are processed concurrently on separate processes. In that case, the worker and
+        # results functions must be defined at module level (so they can be used by the other processes)
+        # (decode_workers > 1) each video is decoded by multiple processes (see VideoProcessor.doChunkedProcessing)
+        if "w" in self.params:
+            workers = int(self.params["w"])
+
+        if workers <= 1:
+            for lecture in self.database.lectures:
+                self.current_lecture = lecture
+                m_videos, out_file, skip = self.get_lecture_params(lecture)
+
+                if skip:
+                    continue
+
+                self.process_lecture_video(lecture, m_videos, out_file, frames_per_second, get_worker_function,
+                                           get_results_function, frames_limit, verbose, force_no_seek,
+                                           decode_workers)
+            return
+
+        # each process receives a copy of this process without the database (once per process)
+        worker_process = self.copy_for_workers()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_set_worker_process,
+                                                    initargs=(worker_process,)) as executor:
+            futures = []
+            for lecture in self.database.lectures:
+                m_videos, out_file, skip = self.get_lecture_params(lecture)
+
+                if skip:
+                    continue
+
+                futures.append((lecture, executor.submit(_process_lecture_job, lecture, m_videos, out_file,
+                                                         frames_per_second, get_worker_function,
+                                                         get_results_function, frames_limit, verbose,
+                                                         force_no_seek, decode_workers)))
+
+            failed = []
+            for lecture, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    print("Failed to process <" + lecture.title + ">: " + str(e))
+                    failed.append(lecture.title)
+
+        if len(failed) > 0:
+            raise Exception("ConsoleUIProcess: the following lectures could not be processed: " + ", ".join(failed))
+
+    def copy_for_workers(self):
+        # (only the values used to process a lecture) the database is not copied
+        worker_process = ConsoleUIProcess(self.database_file, self.raw_params, self.input_temp_prefix,
+                                          self.output_temp_prefix)
+        # (the selected datasets are only used to select the lectures)
+        worker_process.params = {name: value for name, value in self.params.items() if name != "d"}
+        worker_process.temp_dir = self.temp_dir
+        worker_process.img_dir = self.img_dir
+        worker_process.debug_max_time = self.debug_max_time
+        worker_process.configuration = self.configuration
+
+        return worker_process
+
+    def process_lecture_video(self, lecture, m_videos, out_file, frames_per_second, get_worker_function,
+                              get_results_function, frames_limit, verbose, force_no_seek, decode_workers=1):
+        self.current_lecture = lecture
+
+        # create a worker ...
+        worker = get_worker_function(self)
+
+        # execute the actual process ....
+        processor = VideoProcessor(m_videos, frames_per_second)
+        if "forced_width" in lecture.parameters:
+            processor.force_resolution(lecture.parameters["forced_width"], lecture.parameters["forced_height"])
+        processor.set_decode_workers(decode_workers)
+        # seek indices are stored with the temporal files (the video directories are not written)
+        processor.set_seek_index_dir(self.temp_dir + "/seek_index")
+        processor.doProcessing(worker, frames_limit, verbose,force_no_seek) # 0
+
+        # save results
+        if self.output_temp_prefix is not None:
+            results = get_results_function(worker)
+
+            os.makedirs(self.temp_dir, exist_ok=True)
+            if not isinstance(self.output_temp_prefix, list):
+                MiscHelper.dump_save(results, self.temp_dir + '/' + self.output_temp_prefix + out_file)
+            else:
+                for out_idx, temp_prefix in enumerate(self.output_temp_prefix):
+                    MiscHelper.dump_save(results[out_idx], self.temp_dir + '/' + temp_prefix + out_file)
 
     def start_input_processing(self, process_function):
         for lecture in self.database.lectures:
@@ -247,6 +307,7 @@ class ConsoleUIProcess:
             print("Options")
             print("\t-l [lecture]\t: Process only the specified lecture(s)")
             print("\t-d [dataset_name(s)]\t: Process only the specified dataset(s)")
+            print("\t-w [workers]\t: Number of lectures processed concurrently (if supported)")
             return False
         else:
             return True
@@ -288,3 +349,19 @@ class ConsoleUIProcess:
         console_ui_process.configuration = configuration
 
         return console_ui_process
+
+
+# (lectures processed concurrently) copy of the ConsoleUIProcess used by the current worker process
+_worker_process = None
+
+
+def _set_worker_process(worker_process):
+    global _worker_process
+    _worker_process = worker_process
+
+
+def _process_lecture_job(lecture, m_videos, out_file, frames_per_second, get_worker_function, get_results_function,
+                         frames_limit, verbose, force_no_seek, decode_workers):
+    _worker_process.process_lecture_video(lecture, m_videos, out_file, frames_per_second, get_worker_function,
+                                          get_results_function, frames_limit, verbose, force_no_seek,
+                                          decode_workers)
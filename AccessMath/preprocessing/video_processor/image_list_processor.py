@@ -1,11 +1,23 @@
-import json
+import os
+import concurrent.futures
+
 import numpy as np
 import cv2
 
 from AM_CommonTools.util.time_helper import TimeHelper
+from AccessMath.preprocessing.video_worker.multi_worker import MultiVideoWorker
+from AccessMath.preprocessing.video_worker.frame_exporter import FrameExporter
+from AccessMath.util.frame_export_index import FrameExportIndex
+from AccessMath.util.shared_frame_ring import SharedFrameRing
 
 class ImageListGenerator(object):
-    def __init__(self, folder, extension, preload=False):
+    # Images of a frame export (one file per image, or a raw frames file, see FrameExporter).
+    # With preload, all images are read into a single array by a pool of threads (cv2 releases the GIL
+    # while decoding). The array can be backed by a cache file (np.memmap, .npy format), which is reused
+    # by later sessions (opened instantly without decoding) as long as it is newer than the index.
+    PreloadProgressStep = 0.1
+
+    def __init__(self, folder, extension, preload=False, preload_workers=None, preload_cache=None):
         self.folder = folder
 
         # remove preceding dot in format (if it has been added)
@@ -13,37 +25,119 @@ class ImageListGenerator(object):
             extension = extension[1:]
 
         self.im_ext = extension
-        self.index_path = '{}/index.json'.format(self.folder)
         print(self.folder)
-        with open(self.index_path, 'r') as f:
-            self.metadata = json.load(f)
-        self.metadata['0'] = {'video_time': 0.0,
-                              'frame_idx': 0,
-                              'abs_time': 0.0,
-                              'video_idx': 0}
-        self.frameIDs = list(map(int, self.metadata.keys()))
-        self.frameIDs.sort()
+        # (binary index, or index.json on older exports)
+        self.index = FrameExportIndex.FromExportDir(self.folder)
+        self.index_path = self.index.filename
+        # metadata columns, the first row is the start of the video
+        self.columns = {'video_time': np.concatenate(([0.0], self.index.video_time)),
+                        'frame_idx': np.concatenate(([0], self.index.frame_idx)),
+                        'abs_time': np.concatenate(([0.0], self.index.abs_time)),
+                        'video_idx': np.concatenate(([0], self.index.video_idx))}
+        self.frameIDs = self.columns['frame_idx'].tolist()
         print('Number of Frames', len(self.frameIDs) - 1)
-        first_filename = '{}/{}.{}'.format(self.folder, self.frameIDs[1], self.im_ext)
-        im = cv2.imread(first_filename)
-        if im is None:
-            raise Exception("Cannot open the file: " + first_filename)
-        self.height, self.width, self.channels = im.shape if im is not None else (None, None, None)
+        if self.im_ext == 'raw':
+            # frames are records of a single file, mapped to memory (see FrameExporter)
+            self.height, self.width, self.channels = self.index.height, self.index.width, self.index.channels
+            self.raw_frames = ImageListGenerator.OpenRawFrames(self.folder, self.width, self.height, self.channels)
+            # record of each image
+            self.raw_order = self.index.raw_index
+        else:
+            self.raw_frames = None
+            first_filename = '{}/{}.{}'.format(self.folder, self.frameIDs[1], self.im_ext)
+            im = cv2.imread(first_filename)
+            if im is None:
+                raise Exception("Cannot open the file: " + first_filename)
+            self.height, self.width, self.channels = im.shape if im is not None else (None, None, None)
         print(self.width, self.height)
         self.curr_idx = 0
-        self.properties = self.metadata[str(self.frameIDs[0])].keys()
+        self.properties = self.columns.keys()
         self.preload = preload
         if self.preload:
-            self.ims = np.empty((len(self.frameIDs), self.height, self.width, self.channels), dtype=np.uint8)
-            print('preloading images...')
-            for i, frameID in enumerate(self.frameIDs[1:]):
-                self.ims[i, ...] = cv2.imread('{}/{}.{}'.format(self.folder, frameID, self.im_ext))
-            print('done')
+            self.ims = self.preload_images(preload_workers, preload_cache)
+        elif self.raw_frames is not None:
+            self.ims = None
         else:
             self.ims = []
             for i, frameID in enumerate(self.frameIDs[1:]):
                 self.ims += ['{}/{}.{}'.format(self.folder, frameID, self.im_ext)]
 
+    @staticmethod
+    def OpenRawFrames(folder, width, height, channels):
+        # (read-only, copy-on-write) array of all records on the raw frames file of the folder
+        raw_filename = '{}/{}'.format(folder, FrameExporter.RawFramesFilename)
+        frame_shape = (height, width, channels) if channels > 1 else (height, width)
+        n_records = os.path.getsize(raw_filename) // int(np.prod(frame_shape))
+
+        return np.memmap(raw_filename, dtype=np.uint8, mode='c', shape=(n_records,) + frame_shape)
+
+    @staticmethod
+    def DefaultPreloadCache(folder, extension):
+        return '{}/preload_{}.npy'.format(folder, extension)
+
+    def preload_images(self, workers=None, cache_filename=None):
+        # (cache_filename = True uses the default cache file of the folder)
+        if self.raw_frames is not None:
+            # (already decoded) the records are copied to memory, in image order
+            print('preloading raw frames...')
+            return self.raw_frames[self.raw_order]
+
+        if cache_filename is True:
+            cache_filename = ImageListGenerator.DefaultPreloadCache(self.folder, self.im_ext)
+
+        shape = (len(self), self.height, self.width, self.channels)
+        if cache_filename is not None and os.path.exists(cache_filename):
+            if os.path.getmtime(cache_filename) >= os.path.getmtime(self.index_path):
+                ims = np.load(cache_filename, mmap_mode='c')
+                if ims.shape == shape and ims.dtype == np.uint8:
+                    print('using preloaded images from ' + cache_filename)
+                    return ims
+
+            print('preload cache is outdated: ' + cache_filename)
+
+        if cache_filename is not None:
+            # (written under a temporary name, replaced once all images have been read)
+            tempo_filename = cache_filename + '.tmp'
+            ims = np.lib.format.open_memmap(tempo_filename, mode='w+', dtype=np.uint8, shape=shape)
+        else:
+            ims = np.empty(shape, dtype=np.uint8)
+
+        filenames = ['{}/{}.{}'.format(self.folder, frameID, self.im_ext) for frameID in self.frameIDs[1:]]
+
+        def read_image(idx):
+            im = cv2.imread(filenames[idx])
+            if im is None:
+                raise Exception("ImageListGenerator: Cannot open the file: " + filenames[idx])
+            ims[idx] = im
+
+        print('preloading images...')
+        workers = os.cpu_count() if workers is None else max(1, workers)
+        progress_step = max(1, int(len(filenames) * ImageListGenerator.PreloadProgressStep))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(read_image, idx) for idx in range(len(filenames))]
+            try:
+                for count, future in enumerate(concurrent.futures.as_completed(futures)):
+                    # raises the first error found
+                    future.result()
+
+                    if (count + 1) % progress_step == 0:
+                        print('preloading images... {0:.0%}'.format((count + 1) / len(filenames)))
+            except Exception:
+                for future in futures:
+                    future.cancel()
+
+                if cache_filename is not None:
+                    os.remove(tempo_filename)
+                raise
+        print('done')
+
+        if cache_filename is not None:
+            ims.flush()
+            os.replace(tempo_filename, cache_filename)
+            ims = np.load(cache_filename, mmap_mode='c')
+
+        return ims
+
     def __len__(self):
         return len(self.frameIDs) - 1
 
@@ -51,6 +145,9 @@ class ImageListGenerator(object):
         try:
             if self.preload:
                 return self.ims[item]
+            elif self.raw_frames is not None:
+                # zero-copy view of the record
+                return self.raw_frames[self.raw_order[item]]
             else:
                 im = cv2.imread(self.ims[item])
                 return im
@@ -76,15 +173,20 @@ class ImageListGenerator(object):
         if prop not in self.properties:
             return None
         self.curr_idx = -1 if self.curr_idx >= len(self) else self.curr_idx
-        return self.metadata[str(self.frameIDs[self.curr_idx])][prop]
+        return self.columns[prop][self.curr_idx].item()
 
 class ImageListProcessor:
-    def __init__(self, src_dir, frames_per_second=-1, img_extension='.png'):
+    def __init__(self, src_dir, frames_per_second=-1, img_extension='.png', preload=False, preload_workers=None,
+                 preload_cache=None):
         self.src_dir = src_dir
         self.img_extension = img_extension
         self.frames_per_second = frames_per_second
         self.forced_width = None
         self.forced_height = None
+        # (see ImageListGenerator)
+        self.preload = preload
+        self.preload_workers = preload_workers
+        self.preload_cache = preload_cache
 
     def force_resolution(self, width, height):
         self.forced_width = width
@@ -94,6 +196,9 @@ class ImageListProcessor:
         print("Works?")
 
     def doProcessing(self, video_worker, limit=0, verbose=False):
+        # (a list of workers share the loaded frames)
+        video_worker = MultiVideoWorker.FromWorkers(video_worker)
+
         # initially....
         width = None
         height = None
@@ -112,11 +217,12 @@ class ImageListProcessor:
         # open video...
         try:
             print(self.src_dir)
-            capture =  ImageListGenerator('{}/{}'.format(self.src_dir, 'JPEGImages'), self.img_extension)
+            capture =  ImageListGenerator('{}/{}'.format(self.src_dir, 'JPEGImages'), self.img_extension, self.preload,
+                                          self.preload_workers, self.preload_cache)
         except Exception as e:
             # error loading
             print(e)
-            raise Exception("The directory <" + self.src_dir + "> is not in the correct export format, check index.json")
+            raise Exception("The directory <" + self.src_dir + "> is not in the correct export format, check its index")
 
         last_frame = None
         capture_width = capture.width
@@ -140,6 +246,8 @@ class ImageListProcessor:
                 height = capture_height
 
             # on the worker class...
+            # (for workers on other processes) frames are published on shared memory
+            frame_ring = SharedFrameRing.ForWorker(video_worker, width, height, capture.channels)
             video_worker.initialize(width, height)
         else:
             if self.forced_width is not None:
@@ -149,34 +257,48 @@ class ImageListProcessor:
                     # invalid, all main video files must be the same resolution...
                     raise Exception("All files on the list must have the same resolution")
 
-        while limit == 0 or offset_frame < limit:
-            # get frame..
-            flag, frame = capture.read()
-            if not flag:
-                # end of video reached...
-                print('end of video reached...')
-                break
-            else:
-                offset_frame += 1
-                current_time = capture.get('abs_time')
-                current_frame = capture.index2frameID()
-            if forced_resizing:
-                frame = cv2.resize(frame, (self.forced_width, self.forced_height))
-
-            if offset_frame >= 0:
-                frame_time = absolute_time + current_time
-                frame_idx = int(absolute_frame + current_frame)
-                video_worker.handleFrame(frame, last_frame, 0, frame_time, current_time, frame_idx)
-
-                if verbose and offset_frame % 50 == 0:
-                    print("Frames Processed = " + str(offset_frame) +
-                          ", Video Time = " + TimeHelper.stampToStr(frame_time))
-
-            last_frame = frame
-            last_time = current_time
-
-        # processing finished...
-        video_worker.finalize()
+        try:
+            while limit == 0 or offset_frame < limit:
+                # get frame..
+                flag, frame = capture.read()
+                if not flag:
+                    # end of video reached...
+                    print('end of video reached...')
+                    break
+                else:
+                    offset_frame += 1
+                    current_time = capture.get('abs_time')
+                    current_frame = capture.index2frameID()
+                if forced_resizing:
+                    frame = cv2.resize(frame, (self.forced_width, self.forced_height))
+
+                if offset_frame >= 0:
+                    frame_time = absolute_time + current_time
+                    frame_idx = int(absolute_frame + current_frame)
+                    slot = frame_ring.publish(frame) if frame_ring is not None else None
+                    try:
+                        video_worker.handleFrame(frame, last_frame, 0, frame_time, current_time, frame_idx)
+                    finally:
+                        if slot is not None:
+                            frame_ring.release(slot)
+
+                    if verbose and offset_frame % 50 == 0:
+                        print("Frames Processed = " + str(offset_frame) +
+                              ", Video Time = " + TimeHelper.stampToStr(frame_time))
+
+                last_frame = frame
+                last_time = current_time
+
+            # processing finished...
+            video_worker.finalize()
+        except Exception:
+            # workers on other processes are stopped (without finalizing them)
+            if hasattr(video_worker, "abort"):
+                video_worker.abort()
+            raise
+        finally:
+            if frame_ring is not None:
+                frame_ring.close()
 
         # end time counter...
         timer.endTimer()
@@ -1,6 +1,13 @@
+import queue
+import multiprocessing
+
 import cv2
 
 from AM_CommonTools.util.time_helper import TimeHelper
+from AccessMath.util.video_seek_index import VideoSeekIndex
+from AccessMath.util.shared_frame_ring import SharedFrameRing
+from AccessMath.preprocessing.video_processor.video_sampler import VideoSampler
+from AccessMath.preprocessing.video_worker.multi_worker import MultiVideoWorker
 
 
 # ===================================================================
@@ -19,21 +26,41 @@ from AM_CommonTools.util.time_helper import TimeHelper
 # ===================================================================
 
 class VideoProcessor:
-    
+    # (chunked decoding) max. frames decoded ahead by each process
+    ChunkQueueSize = 16
+
     def __init__(self, file_list, frames_per_second=1):
         self.file_list = file_list
         self.frames_per_second = frames_per_second
         self.forced_width = None
         self.forced_height = None
+        # (> 1) each video is split in ranges of frames decoded by separate processes
+        self.decode_workers = 1
+        # directory where the seek indices of the videos are stored (see VideoSeekIndex). If None, frames are
+        # sampled without key-frames, and the indices required by the chunked decoding are not stored
+        self.seek_index_dir = None
 
     def force_resolution(self, width, height):
         self.forced_width = width
         self.forced_height = height
 
+    def set_decode_workers(self, workers):
+        self.decode_workers = workers
+
+    def set_seek_index_dir(self, seek_index_dir):
+        self.seek_index_dir = seek_index_dir
+
     def checkError(self):
         print("Works?")
 
     def doProcessing(self, video_worker, limit=0, verbose=False,force_no_seek=False):
+        # (a list of workers share the decoded frames)
+        video_worker = MultiVideoWorker.FromWorkers(video_worker)
+
+        if self.decode_workers > 1:
+            self.doChunkedProcessing(video_worker, limit, verbose)
+            return
+
         #initially....
         width = None
         height = None
@@ -41,6 +68,8 @@ class VideoProcessor:
         offset_frame = -1
         absolute_frame = 0
         absolute_time = 0.0
+        # (for workers on other processes) frames are published on shared memory
+        frame_ring = None
 
         if verbose:
             print( "Video processing for " + video_worker.getWorkName() + " has begun" )
@@ -49,153 +78,352 @@ class VideoProcessor:
         timer = TimeHelper()
         timer.startTimer()
 
-        #open video...
-        for video_idx, video_file in enumerate(self.file_list):
-            try:
-                capture = cv2.VideoCapture(video_file)
-            except Exception as e:
-                # error loading
-                raise Exception( "The file <" + video_file + "> could not be opened")
-
-            capture_width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
-            capture_height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-            # ...check size ...
-            forced_resizing = False
-            if width is None:
-                # first video....
-                # initialize local parameters....
-                if self.forced_width is not None:
-                    # ...size...
-                    width = self.forced_width
-                    height = self.forced_height
-
-                    if capture_width != self.forced_width or capture_height != self.forced_height:
-                        forced_resizing = True
-                else:
-                    width = capture_width
-                    height = capture_height
+        try:
+            #open video...
+            for video_idx, video_file in enumerate(self.file_list):
+                try:
+                    capture = cv2.VideoCapture(video_file)
+                except Exception as e:
+                    # error loading
+                    raise Exception( "The file <" + video_file + "> could not be opened")
+
+                capture_width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+                capture_height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+                # ...check size ...
+                forced_resizing = False
+                if width is None:
+                    # first video....
+                    # initialize local parameters....
+                    if self.forced_width is not None:
+                        # ...size...
+                        width = self.forced_width
+                        height = self.forced_height
+
+                        if capture_width != self.forced_width or capture_height != self.forced_height:
+                            forced_resizing = True
+                    else:
+                        width = capture_width
+                        height = capture_height
 
-                # on the worker class...
-                video_worker.initialize(width, height)
-            else:
-                if self.forced_width is not None:
-                    forced_resizing = (capture_width != self.forced_width or capture_height != self.forced_height)
+                    # on the worker class...
+                    frame_ring = SharedFrameRing.ForWorker(video_worker, width, height)
+                    video_worker.initialize(width, height)
                 else:
-                    if (width != capture_width) or (height != capture_height):
-                        # invalid, all main video files must be the same resolution...
-                        raise Exception("All video files on the list must have the same resolution")
-
-            # get current FPS
-            video_fps = capture.get(cv2.CAP_PROP_FPS)
-            # will use some frames per second
-            if self.frames_per_second is None or self.frames_per_second <= 0.0:
-                # use all frames ...
-                jump_frames = 0
+                    if self.forced_width is not None:
+                        forced_resizing = (capture_width != self.forced_width or capture_height != self.forced_height)
+                    else:
+                        if (width != capture_width) or (height != capture_height):
+                            # invalid, all main video files must be the same resolution...
+                            raise Exception("All video files on the list must have the same resolution")
+
+                # Read video until the end or until limit has been reached
+                jump_frames = self.get_jump_frames(capture.get(cv2.CAP_PROP_FPS))
+                if force_no_seek or jump_frames <= 1 or self.seek_index_dir is None:
+                    seek_index = None
+                else:
+                    # key-frames allow exact seeking (built once, stored on the seek index directory)
+                    seek_index = VideoSeekIndex.FromVideoFile(video_file, verbose, index_dir=self.seek_index_dir)
+                sampler = VideoSampler(capture, jump_frames, seek_index, force_no_seek)
+
+                while limit == 0 or offset_frame < limit:
+                    flag, frame = sampler.read()
+                    if not flag:
+                        # end of video reached...
+                        break
+                    else:
+                        offset_frame += 1
+                        current_time = sampler.current_time
+                        current_frame = sampler.current_frame
+
+                    if forced_resizing:
+                        frame = cv2.resize(frame, (self.forced_width, self.forced_height))
+
+                    if offset_frame > 0:
+                        frame_time = absolute_time + current_time
+                        frame_idx = int(absolute_frame + current_frame)
+                        slot = frame_ring.publish(frame) if frame_ring is not None else None
+                        try:
+                            video_worker.handleFrame(frame, last_frame, video_idx, frame_time, current_time, frame_idx)
+                        finally:
+                            if slot is not None:
+                                frame_ring.release(slot)
+
+                        if verbose and offset_frame % 50 == 0:
+                            print( "Frames Processed = " + str(offset_frame) + \
+                                   ", Video Time = " + TimeHelper.stampToStr( frame_time ) )
+                    
+                    
+                    last_frame = frame
+                    last_time = current_time
+                
+                if verbose:
+                    print(sampler.report())
+
+                # (includes frames grabbed after the last sampled frame)
+                current_time = sampler.current_time
+                current_frame = sampler.current_frame
+
+                #at the end of the processing of current video
+                capture.set(cv2.CAP_PROP_POS_AVI_RATIO, 1.0)
+                video_length = capture.get(cv2.CAP_PROP_POS_MSEC)
+                video_frames = capture.get(cv2.CAP_PROP_POS_FRAMES)
+
+                if video_length < current_time or video_frames < current_frame:
+                    video_frames = current_frame
+                    video_length = current_time
+            
+                absolute_time += video_length
+                absolute_frame += video_frames
+            #processing finished...
+            video_worker.finalize()
+        except Exception:
+            # workers on other processes are stopped (without finalizing them)
+            if hasattr(video_worker, "abort"):
+                video_worker.abort()
+            raise
+        finally:
+            if frame_ring is not None:
+                frame_ring.close()
+
+        #end time counter...
+        timer.endTimer()
+
+        if verbose:
+            print("Video processing for " + video_worker.getWorkName() + " completed: " +
+                  TimeHelper.stampToStr(timer.lastElapsedTime() * 1000.0))
+
+
+
+    def get_jump_frames(self, video_fps):
+        # will use some frames per second
+        if self.frames_per_second is None or self.frames_per_second <= 0.0:
+            # use all frames ...
+            return 0
+        else:
+            # jump some frames ...
+            return int(video_fps / self.frames_per_second)
+
+    @staticmethod
+    def decode_range(chunk_idx, video_file, seek_index, start_frame, end_frame, jump_frames, forced_size, out_queue):
+        # (runs on its own process) decodes the frames in [start_frame, end_frame) that doProcessing would sample
+        # (a frame is read after skipping jump_frames - 1 frames), plus the sampled frame right before the range
+        # (sent as "prev") so the first frame of the range also has a last frame.
+        try:
+            capture = cv2.VideoCapture(video_file)
+            step = max(1, jump_frames)
+
+            # first sampled frame (0-based) of the range
+            first_sampled = start_frame + (step - 1 - start_frame) % step
+            if first_sampled >= step:
+                position = first_sampled - step
+                kind = "prev"
             else:
-                # jump some frames ...
-                jump_frames = int(video_fps / self.frames_per_second)
+                position = first_sampled
+                kind = "frame"
 
-            # Read video until the end or until limit has been reached
-            selection_step = 4 if force_no_seek else 1
-            timer_1 = TimeHelper()
-            timer_2 = TimeHelper()
+            # starts at the first frame to read, then samples like doProcessing
+            sampler = VideoSampler(capture, step, seek_index, first_sample=position)
+            while True:
+                flag, frame = sampler.read()
+                if not flag:
+                    # end of video reached...
+                    break
 
-            current_time = 0.0
-            current_frame = 0
+                if forced_size is not None and (frame.shape[1], frame.shape[0]) != forced_size:
+                    frame = cv2.resize(frame, forced_size)
 
-            while limit == 0 or offset_frame < limit:
+                out_queue.put((chunk_idx, kind, frame, sampler.current_time, sampler.current_frame))
+                kind = "frame"
 
-                if selection_step == 2 or selection_step == 5:
-                    # jump to frame in single step
-                    timer_2.startTimer()
+                position += step
+                if end_frame is not None and position >= end_frame:
+                    break
 
-                    target_frame = capture.get(cv2.CAP_PROP_POS_FRAMES) + jump_frames - 1
-                    valid_grab = capture.set(cv2.CAP_PROP_POS_FRAMES, target_frame)
+            capture.release()
+            out_queue.put((chunk_idx, "end", None, sampler.current_time, sampler.current_frame))
+        except Exception as e:
+            out_queue.put((chunk_idx, "error", None, str(e), None))
 
-                    timer_2.endTimer()
+    def doChunkedProcessing(self, video_worker, limit=0, verbose=False):
+        # Each video is split in self.decode_workers ranges of frames, decoded concurrently by separate processes.
+        # Frames are handled in order (the output of each range waits on its own bounded queue), unless the
+        # worker declares that it can handle them in any order (OrderIndependent = True). Frames are sampled just
+        # like doProcessing (see VideoSampler), and the absolute frame indices and times are the same.
+        video_worker = MultiVideoWorker.FromWorkers(video_worker)
+        in_order = not getattr(video_worker, "OrderIndependent", False)
 
-                    if selection_step == 2:
-                        selection_step = 3
+        width = None
+        height = None
 
-                if selection_step == 1 or selection_step == 4:
-                    timer_1.startTimer()
+        offset_frame = -1
+        absolute_frame = 0
+        absolute_time = 0.0
+        last_frame = None
+        frame_ring = None
 
-                    # jump to frame by grabbing frames ...
-                    valid_grab = True
-                    for x in range(jump_frames - 1):
-                        valid_grab = capture.grab()
-                        if not valid_grab:
-                            break
-                        else:
-                            current_time = capture.get(cv2.CAP_PROP_POS_MSEC)
-                            current_frame = capture.get(cv2.CAP_PROP_POS_FRAMES)
+        if verbose:
+            print("Video processing for " + video_worker.getWorkName() + " has begun (" +
+                  str(self.decode_workers) + " decoding processes)")
 
-                    timer_1.endTimer()
+        # for timer...
+        timer = TimeHelper()
+        timer.startTimer()
 
-                    if selection_step == 1:
-                        selection_step = 2
+        try:
+            for video_idx, video_file in enumerate(self.file_list):
+                capture = cv2.VideoCapture(video_file)
+                if not capture.isOpened():
+                    raise Exception("The file <" + video_file + "> could not be opened")
 
-                if selection_step == 3:
-                    # decide which sampling grabbing method is faster
-                    if timer_1.totalElapsedTime() < timer_2.totalElapsedTime():
-                        print("Grabbing frames to jump")
-                        selection_step = 4
-                    else:
-                        print("Jumping to frames directly")
-                        selection_step = 5
+                capture_width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+                capture_height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
-                # get frame..
-                if valid_grab:
-                    flag, frame = capture.read()
+                # ...check size ...
+                if width is None:
+                    if self.forced_width is not None:
+                        width = self.forced_width
+                        height = self.forced_height
+                    else:
+                        width = capture_width
+                        height = capture_height
+
+                    # on the worker class...
+                    frame_ring = SharedFrameRing.ForWorker(video_worker, width, height)
+                    video_worker.initialize(width, height)
+                elif self.forced_width is None and ((width != capture_width) or (height != capture_height)):
+                    # invalid, all main video files must be the same resolution...
+                    raise Exception("All video files on the list must have the same resolution")
+
+                forced_size = (self.forced_width, self.forced_height) if self.forced_width is not None else None
+                jump_frames = self.get_jump_frames(capture.get(cv2.CAP_PROP_FPS))
+                total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+                # key-frames allow exact positioning at the start of each range
+                seek_index = VideoSeekIndex.FromVideoFile(video_file, index_dir=self.seek_index_dir,
+                                                          save=self.seek_index_dir is not None)
+
+                # ranges (the last one is decoded until the end of the video)
+                n_ranges = max(1, min(self.decode_workers, total_frames // max(1, jump_frames)))
+                starts = [int(total_frames * idx / n_ranges) for idx in range(n_ranges)]
+                ends = starts[1:] + [None]
+
+                if in_order:
+                    queues = [multiprocessing.Queue(VideoProcessor.ChunkQueueSize) for _ in range(n_ranges)]
                 else:
-                    flag, frame = False, None
-
-                #print("Grab time: " + str(capture.get(cv2.CAP_PROP_POS_FRAMES)))
-                #print((valid_grab, flag, type(frame), selection_step, jump_frames))
-                if not flag:
-                    # end of video reached...
+                    shared_queue = multiprocessing.Queue(VideoProcessor.ChunkQueueSize * n_ranges)
+                    queues = [shared_queue] * n_ranges
+
+                processes = []
+                for idx in range(n_ranges):
+                    process = multiprocessing.Process(target=VideoProcessor.decode_range,
+                                                      args=(idx, video_file, seek_index, starts[idx], ends[idx],
+                                                            jump_frames, forced_size, queues[idx]), daemon=True)
+                    process.start()
+                    processes.append(process)
+
+                # last frame received from each range
+                range_last_frames = [None] * n_ranges
+                current_time = 0.0
+                current_frame = 0
+                limit_reached = False
+                stalled = False
+                try:
+                    pending = list(range(n_ranges))
+                    while len(pending) > 0 and not limit_reached:
+                        # next range to read from (all ranges share one queue if the order does not matter)
+                        try:
+                            item = queues[pending[0]].get(timeout=1.0)
+                        except queue.Empty:
+                            if all(processes[idx].exitcode is not None for idx in pending):
+                                # (checked twice, their last frames might be still on the way)
+                                if stalled:
+                                    raise Exception("Decoding processes of <" + video_file + "> ended unexpectedly")
+                                stalled = True
+                            continue
+
+                        chunk_idx, kind, frame, frame_current_time, frame_current_frame = item
+
+                        if kind == "error":
+                            raise Exception("Error decoding <" + video_file + ">: " + frame_current_time)
+
+                        if kind == "end":
+                            pending.remove(chunk_idx)
+                            if ends[chunk_idx] is None:
+                                # final position on the video
+                                current_time = frame_current_time
+                                current_frame = frame_current_frame
+                            continue
+
+                        previous = range_last_frames[chunk_idx]
+                        range_last_frames[chunk_idx] = frame
+                        if kind == "prev":
+                            continue
+
+                        offset_frame += 1
+                        if previous is None:
+                            # first frame of the video, the last frame is the last one of the previous video
+                            previous = last_frame
+
+                            if previous is None:
+                                # first frame of the lecture, only used as last frame (just like doProcessing)
+                                continue
+
+                        frame_time = absolute_time + frame_current_time
+                        frame_idx = int(absolute_frame + frame_current_frame)
+                        slot = frame_ring.publish(frame) if frame_ring is not None else None
+                        try:
+                            video_worker.handleFrame(frame, previous, video_idx, frame_time, frame_current_time,
+                                                     frame_idx)
+                        finally:
+                            if slot is not None:
+                                frame_ring.release(slot)
+
+                        if verbose and offset_frame % 50 == 0:
+                            print("Frames Processed = " + str(offset_frame) +
+                                  ", Video Time = " + TimeHelper.stampToStr(frame_time))
+
+                        if limit > 0 and offset_frame >= limit:
+                            limit_reached = True
+                finally:
+                    for process in processes:
+                        if process.is_alive():
+                            process.terminate()
+                        process.join()
+
+                # the last frame of this video is the last frame of the previous video for the next one
+                last_frame = range_last_frames[-1]
+
+                # at the end of the processing of current video
+                capture.set(cv2.CAP_PROP_POS_AVI_RATIO, 1.0)
+                video_length = capture.get(cv2.CAP_PROP_POS_MSEC)
+                video_frames = capture.get(cv2.CAP_PROP_POS_FRAMES)
+                capture.release()
+
+                if video_length < current_time or video_frames < current_frame:
+                    video_frames = current_frame
+                    video_length = current_time
+
+                absolute_time += video_length
+                absolute_frame += video_frames
+
+                if limit_reached:
                     break
-                else:                
-                    offset_frame += 1
-                    current_time = capture.get(cv2.CAP_PROP_POS_MSEC)
-                    current_frame = capture.get(cv2.CAP_PROP_POS_FRAMES)
-
-                if forced_resizing:
-                    frame = cv2.resize(frame, (self.forced_width, self.forced_height))
-
-                if offset_frame > 0:
-                    frame_time = absolute_time + current_time
-                    frame_idx = int(absolute_frame + current_frame)
-                    video_worker.handleFrame(frame, last_frame, video_idx, frame_time, current_time, frame_idx)
-
-                    if verbose and offset_frame % 50 == 0:
-                        print( "Frames Processed = " + str(offset_frame) + \
-                               ", Video Time = " + TimeHelper.stampToStr( frame_time ) )
-                    
-                    
-                last_frame = frame
-                last_time = current_time
-                
-            #at the end of the processing of current video
-            capture.set(cv2.CAP_PROP_POS_AVI_RATIO, 1.0)
-            video_length = capture.get(cv2.CAP_PROP_POS_MSEC)
-            video_frames = capture.get(cv2.CAP_PROP_POS_FRAMES)
-
-            if video_length < current_time or video_frames < current_frame:
-                video_frames = current_frame
-                video_length = current_time
-            
-            absolute_time += video_length
-            absolute_frame += video_frames
-        #processing finished...
-        video_worker.finalize()
 
-        #end time counter...
+            # processing finished...
+            video_worker.finalize()
+        except Exception:
+            # workers on other processes are stopped (without finalizing them)
+            if hasattr(video_worker, "abort"):
+                video_worker.abort()
+            raise
+        finally:
+            if frame_ring is not None:
+                frame_ring.close()
+
+        # end time counter...
         timer.endTimer()
 
         if verbose:
             print("Video processing for " + video_worker.getWorkName() + " completed: " +
                   TimeHelper.stampToStr(timer.lastElapsedTime() * 1000.0))
-
-
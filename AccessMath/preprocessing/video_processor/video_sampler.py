@@ -0,0 +1,193 @@
+
+import time
+
+import cv2
+import numpy as np
+
+
+class VideoSampler:
+    # Reads every jump_frames-th frame of a video capture (a frame is read after skipping jump_frames - 1 frames).
+    # There are several ways to skip frames, and which one is faster depends on the codec and on the distance
+    # between sampled frames:
+    #   - Grab:     grab (decode without retrieving) every frame in between
+    #   - Seek:     let OpenCV seek directly to the next sampled frame. Only used without a VideoSeekIndex, and
+    #               only if the first frame read this way is the same frame obtained by grabbing (checked once).
+    #   - KeyFrame: (requires a VideoSeekIndex) seek to the closest key-frame before the next sampled frame
+    #               (only if it is after the current position) and grab from there. Always exact.
+    # The first sampled frames are used as probes: each strategy is timed ProbesPerStrategy times (in turns),
+    # and the one with the lowest median time per sampled frame is used for the rest of the video.
+    Grab = "grab"
+    Seek = "seek"
+    KeyFrame = "keyframe"
+
+    ProbesPerStrategy = 3
+
+    def __init__(self, capture, jump_frames, seek_index=None, force_no_seek=False, first_sample=None):
+        self.capture = capture
+        self.step = max(1, jump_frames)
+        self.seek_index = seek_index
+
+        # frame (0-based) that the capture will return on the next read
+        self.position = 0
+        # next frame to sample
+        self.next_sample = self.step - 1 if first_sample is None else first_sample
+
+        # time and index (as reported by OpenCV) of the last frame grabbed or read
+        self.current_time = 0.0
+        self.current_frame = 0
+
+        if self.step == 1 or force_no_seek:
+            # nothing to skip (or seeking not allowed)
+            self.candidates = [VideoSampler.Grab]
+        elif seek_index is not None:
+            # (exact) key-frames are used instead of seeking directly
+            self.candidates = [VideoSampler.Grab, VideoSampler.KeyFrame]
+        else:
+            self.candidates = [VideoSampler.Grab, VideoSampler.Seek]
+        # the position reported by OpenCV after seeking can be wrong, so the first seek is checked
+        self.seek_checked = False
+
+        self.probe_times = {strategy: [] for strategy in self.candidates}
+        self.strategy = self.candidates[0] if len(self.candidates) == 1 else None
+
+        # for statistics
+        self.sampled_frames = 0
+        self.start_time = time.time()
+
+        if first_sample is not None and first_sample > 0:
+            # start at the given frame (not used as probe)
+            if self.seek_index is not None:
+                self.__keyframe_move(first_sample)
+            else:
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, first_sample)
+                self.position = first_sample
+
+    def __update_current(self):
+        self.current_time = self.capture.get(cv2.CAP_PROP_POS_MSEC)
+        self.current_frame = self.capture.get(cv2.CAP_PROP_POS_FRAMES)
+
+    def __grab_move(self, target):
+        while self.position < target:
+            if not self.capture.grab():
+                return False
+
+            self.position += 1
+            self.__update_current()
+
+        return True
+
+    def __keyframe_move(self, target):
+        keyframe = self.seek_index.keyframe_before(target)
+        if keyframe > self.position:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+            self.position = keyframe
+
+        return self.__grab_move(target)
+
+    def __seek_move(self, target):
+        if target == self.position:
+            return True
+
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, target)
+        self.position = target
+
+        return True
+
+    def __check_seek(self, target, frame):
+        # compares the frame read after seeking with the same frame read by grabbing from the start of the
+        # video, returns the right frame (the capture ends at the same position in both cases)
+        self.seek_checked = True
+
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.position = 0
+        if not self.__grab_move(target):
+            return False, None
+
+        flag, reference = self.capture.read()
+        if not flag:
+            return False, None
+
+        if not np.array_equal(frame, reference):
+            # inexact seek on this video, do not use it again
+            self.candidates.remove(VideoSampler.Seek)
+            del self.probe_times[VideoSampler.Seek]
+            if self.strategy == VideoSampler.Seek:
+                self.strategy = VideoSampler.Grab
+
+        return True, reference
+
+    def __move(self, strategy, target):
+        if strategy == VideoSampler.Grab:
+            return self.__grab_move(target)
+        elif strategy == VideoSampler.Seek:
+            return self.__seek_move(target)
+        else:
+            return self.__keyframe_move(target)
+
+    def __next_probe(self):
+        # strategy with the fewest probes so far (or None if all of them have been probed)
+        strategy = min(self.candidates, key=lambda name: len(self.probe_times[name]))
+        if len(self.probe_times[strategy]) >= VideoSampler.ProbesPerStrategy:
+            return None
+
+        return strategy
+
+    def __choose_strategy(self):
+        medians = {name: np.median(times) for name, times in self.probe_times.items() if len(times) > 0}
+        self.strategy = min(medians, key=lambda name: medians[name])
+
+    def read(self):
+        # reads the next sampled frame
+        target = self.next_sample
+
+        strategy = self.strategy
+        probing = strategy is None
+        if probing:
+            strategy = self.__next_probe()
+            if strategy is None:
+                self.__choose_strategy()
+                strategy = self.strategy
+                probing = False
+
+        start_time = time.time()
+        if not self.__move(strategy, target):
+            # end of video reached...
+            return False, None
+
+        flag, frame = self.capture.read()
+        if not flag:
+            return False, None
+
+        if probing:
+            self.probe_times[strategy].append(time.time() - start_time)
+
+        if strategy == VideoSampler.Seek and not self.seek_checked:
+            flag, frame = self.__check_seek(target, frame)
+            if not flag:
+                return False, None
+
+        self.position += 1
+        self.next_sample += self.step
+        self.sampled_frames += 1
+        self.__update_current()
+
+        return True, frame
+
+    def report(self):
+        # chosen strategy (with the probe times) and effective decoding speed
+        if self.strategy is None and any(len(times) > 0 for times in self.probe_times.values()):
+            # (video ended while probing)
+            self.__choose_strategy()
+
+        probes = ", ".join(["{0:s}: {1:.2f} ms".format(name, np.median(times) * 1000.0)
+                            for name, times in self.probe_times.items() if len(times) > 0])
+        elapsed = max(time.time() - self.start_time, 1e-6)
+
+        result = "Sampling strategy: " + str(self.strategy)
+        if len(probes) > 0:
+            result += " (median time per sampled frame: " + probes + ")"
+
+        result += ", {0:d} frames sampled in {1:.2f} s ({2:.1f} sampled fps, {3:.1f} video fps)".format(
+            self.sampled_frames, elapsed, self.sampled_frames / elapsed, self.position / elapsed)
+
+        return result
@@ -1,27 +1,97 @@
+
+import os
 import cv2
-import json
+import numpy as np
+import threading
+import concurrent.futures
+
+from AccessMath.util.frame_export_index import FrameExportIndex
 
 class FrameExporter:
-    def __init__(self, export_dir, img_extension='png', img_quality=100):
+    # images are encoded and saved by a pool of writer threads (cv2 releases the GIL while encoding),
+    # frames wait on a bounded queue and handleFrame blocks once it is full
+    MaxPendingWrites = 64
+    # frames can be handled in any order (e.g. when decoded by multiple processes)
+    OrderIndependent = True
+    # frames are not referenced after handleFrame returns (images waiting to be saved are copies)
+    KeepsFrames = False
+    # (img_extension = 'raw') frames are stored un-compressed on a single file of fixed-size records
+    # (height x width x channels bytes, in the order they were handled), the record of each frame is
+    # stored on the index (raw_index). Readers map the file to memory, avoiding any image decoding.
+    RawFramesFilename = "frames.raw"
+
+    def __init__(self, export_dir, img_extension='png', img_quality=100, writers=None):
         self.width = None
         self.height = None
 
         self.all_metadata = {}
-        self.img_format = img_extension if img_extension in ['jpg', 'png'] else 'png'
+        self.img_format = img_extension if img_extension in ['jpg', 'png', 'raw'] else 'png'
         self.img_quality = img_quality
 
         # directory where results will be stored ...
         self.export_dir = export_dir
 
+        # number of writer threads (0 = save on the calling thread)
+        self.writers = os.cpu_count() if writers is None else writers
+        self.write_pool = None
+        self.pending_writes = None
+        self.write_errors = []
+
+        # (raw format) file with the frames, and shape of its records
+        self.raw_file = None
+        self.raw_shape = None
+        self.raw_count = 0
+
     def initialize(self, width, height):
         self.width = width
         self.height = height
 
         self.all_metadata = {}
 
+        if self.img_format == 'raw':
+            self.raw_file = open("{0:s}/{1:s}".format(self.export_dir, FrameExporter.RawFramesFilename), "wb")
+            self.raw_shape = None
+            self.raw_count = 0
+        elif self.writers > 0 and self.write_pool is None:
+            self.write_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.writers,
+                                                                    thread_name_prefix="FrameExporter-writer")
+            self.pending_writes = threading.BoundedSemaphore(FrameExporter.MaxPendingWrites)
+            self.write_errors = []
+
     def getWorkName(self):
         return "Raw Frame Exporter"
 
+    def __write_image(self, out_img_filename, frame):
+        # ... save image ...
+        if self.img_format.lower() == 'png':
+            saved = cv2.imwrite(out_img_filename, frame)
+        else:
+            saved = cv2.imwrite(out_img_filename, frame, (cv2.IMWRITE_JPEG_QUALITY, self.img_quality))
+
+        if not saved:
+            raise Exception("FrameExporter: Could not save image <" + out_img_filename + ">")
+
+    def __async_write_image(self, out_img_filename, frame):
+        try:
+            self.__write_image(out_img_filename, frame)
+        except Exception as e:
+            self.write_errors.append(e)
+        finally:
+            self.pending_writes.release()
+
+    def __write_raw(self, frame, frame_idx):
+        if self.raw_shape is None:
+            self.raw_shape = frame.shape
+        elif frame.shape != self.raw_shape:
+            raise Exception("FrameExporter: All frames of a raw export must have the same size")
+
+        # (the record is copied from the frame, the file buffer is written by the OS)
+        self.raw_file.write(np.ascontiguousarray(frame, dtype=np.uint8).data)
+
+        self.all_metadata[frame_idx]["channels"] = frame.shape[2] if len(frame.shape) > 2 else 1
+        self.all_metadata[frame_idx]["raw_index"] = self.raw_count
+        self.raw_count += 1
+
     def handleFrame(self, frame, last_frame, video_idx, frame_time, current_time, frame_idx):
         # Compute and export sample frame metadata
         self.all_metadata[frame_idx] = {
@@ -34,18 +104,42 @@ class FrameExporter:
             "extension": self.img_format
         }
 
+        if self.img_format == 'raw':
+            self.__write_raw(frame, frame_idx)
+            return
+
         # Output file names ...
         out_img_filename = "{0:s}/{1:d}.{2:s}".format(self.export_dir, frame_idx, self.img_format)
-        # ... save image ...
-        if self.img_format.lower() == 'png':
-            cv2.imwrite(out_img_filename, frame)
+
+        if self.write_pool is None:
+            self.__write_image(out_img_filename, frame)
         else:
-            cv2.imwrite(out_img_filename, frame, (cv2.IMWRITE_JPEG_QUALITY, self.img_quality))
+            if len(self.write_errors) > 0:
+                raise self.write_errors[0]
+
+            # back-pressure: wait until there is room on the queue
+            self.pending_writes.acquire()
+            # the frame is copied, the caller can re-use its buffer (e.g. a slot of a SharedFrameRing) once
+            # handleFrame returns (the copies are limited by MaxPendingWrites)
+            self.write_pool.submit(self.__async_write_image, out_img_filename, frame.copy())
+
+    def flush(self):
+        # waits for all pending images to be saved
+        if self.raw_file is not None:
+            self.raw_file.close()
+            self.raw_file = None
+
+        if self.write_pool is not None:
+            self.write_pool.shutdown(wait=True)
+            self.write_pool = None
+
+        if len(self.write_errors) > 0:
+            raise self.write_errors[0]
 
     def finalize(self):
-        out_json_filename = "{0:s}/index.json".format(self.export_dir)
+        self.flush()
 
-        with open(out_json_filename, "w") as out_file:
-            json.dump(self.all_metadata, out_file)
+        out_index_filename = "{0:s}/{1:s}".format(self.export_dir, FrameExportIndex.Filename)
+        FrameExportIndex.FromMetadata(self.all_metadata).save(out_index_filename)
 
-        print("-> Metadata saved to: {0:s}".format(out_json_filename))
+        print("-> Metadata saved to: {0:s}".format(out_index_filename))
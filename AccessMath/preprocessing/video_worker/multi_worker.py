@@ -0,0 +1,60 @@
+
+
+class MultiVideoWorker:
+    # Feeds every frame to a list of video workers, so several analyses can share a single decoding of
+    # the video. Workers are called in the given order, and can be wrapped to run on their own process
+    # (ProcessVideoWorker). Frames are shared by all workers, they should not be modified in place.
+    def __init__(self, workers):
+        if len(workers) == 0:
+            raise Exception("MultiVideoWorker: at least one worker is required")
+
+        self.workers = list(workers)
+        # frames can be handled in any order only if all workers allow it
+        self.OrderIndependent = all(getattr(worker, "OrderIndependent", False) for worker in self.workers)
+        # frames are kept after handleFrame if any worker keeps them (see ProcessVideoWorker)
+        self.KeepsFrames = any(getattr(worker, "KeepsFrames", True) for worker in self.workers)
+        # frames are published once on a shared ring for all the workers that use it
+        self.SharedFrames = any(getattr(worker, "SharedFrames", False) for worker in self.workers)
+
+    @staticmethod
+    def FromWorkers(video_worker):
+        # the video processors accept a single worker or a list of workers
+        if isinstance(video_worker, (list, tuple)):
+            return MultiVideoWorker(video_worker)
+
+        return video_worker
+
+    def set_frame_ring(self, ring):
+        for worker in self.workers:
+            if getattr(worker, "SharedFrames", False):
+                worker.set_frame_ring(ring)
+
+    def initialize(self, width, height):
+        for worker in self.workers:
+            worker.initialize(width, height)
+
+    def getWorkName(self):
+        return " + ".join([worker.getWorkName() for worker in self.workers])
+
+    def handleFrame(self, frame, last_frame, video_idx, frame_time, current_time, frame_idx):
+        for worker in self.workers:
+            worker.handleFrame(frame, last_frame, video_idx, frame_time, current_time, frame_idx)
+
+    def abort(self):
+        # (see ProcessVideoWorker.abort) only some workers need to be stopped
+        for worker in self.workers:
+            if hasattr(worker, "abort"):
+                worker.abort()
+
+    def finalize(self):
+        # all workers are finalized (even if one of them fails), the first error is raised
+        error = None
+        for worker in self.workers:
+            try:
+                worker.finalize()
+            except Exception as e:
+                if error is None:
+                    error = e
+
+        if error is not None:
+            raise error
@@ -0,0 +1,226 @@
+
+import queue
+import pickle
+import traceback
+import multiprocessing
+
+from AccessMath.util.shared_frame_ring import SharedFrameRing
+
+
+class ProcessVideoWorker:
+    # Wraps a video worker so that its frames are handled on a separate process (for CPU heavy workers).
+    # The worker is initialized, used and finalized on the other process, and the finalized worker is sent
+    # back (if it can be pickled), so its results can be read from this object's worker after finalize().
+    # Frames are passed through a SharedFrameRing: the video processors publish each frame on the ring
+    # once (shared by all process workers, see set_frame_ring), otherwise frames are published on a ring
+    # owned by this worker. The other process gets views of the slots, and releases each slot once the
+    # frame is no longer needed (after handling the next frame, as it is its last frame). Since a released
+    # slot is overwritten by the producer, the views are copied unless the worker declares that it does not
+    # keep frames after handleFrame returns (KeepsFrames = False), or copy_frames is given.
+    SharedFrames = True
+    # message that stops the other process without finalizing the worker (see abort)
+    AbortMessage = "abort"
+    # seconds given to the other process to stop before terminating it
+    AbortTimeout = 5.0
+
+    def __init__(self, worker, slots=None, copy_frames=None):
+        self.worker = worker
+        self.slots = SharedFrameRing.DefaultSlots if slots is None else slots
+        if copy_frames is None:
+            copy_frames = getattr(worker, "KeepsFrames", True)
+        self.copy_frames = copy_frames
+
+        self.ring = None
+        self.own_ring = False
+        self.width = None
+        self.height = None
+
+        self.messages = None
+        self.results = None
+        self.process = None
+        self.error = None
+        self.previous_frame = None
+
+    def set_frame_ring(self, ring):
+        # ring where the producer publishes the frames given to handleFrame
+        self.ring = ring
+        self.own_ring = False
+
+    @staticmethod
+    def Run(worker, width, height, ring, copy_frames, messages, results):
+        # (runs on its own process)
+        held_slots = []
+        try:
+            worker.initialize(width, height)
+
+            previous_frame = None
+            while True:
+                args = messages.get()
+                if args is None:
+                    break
+                if args == ProcessVideoWorker.AbortMessage:
+                    return
+
+                frame, last_frame, video_idx, frame_time, current_time, frame_idx = args
+
+                # frames are given as slots of the ring (or as arrays if they do not fit on the ring)
+                slots = []
+                if isinstance(frame, int):
+                    slots.append(frame)
+                    frame = ring.view(frame)
+                    if copy_frames:
+                        frame = frame.copy()
+                if last_frame is None:
+                    last_frame = previous_frame
+                elif isinstance(last_frame, int):
+                    slots.append(last_frame)
+                    last_frame = ring.view(last_frame)
+                    if copy_frames:
+                        last_frame = last_frame.copy()
+
+                worker.handleFrame(frame, last_frame, video_idx, frame_time, current_time, frame_idx)
+                previous_frame = frame
+
+                # only the slot of the current frame is still needed
+                for slot in held_slots:
+                    ring.release(slot)
+                held_slots = slots[:1]
+                for slot in slots[1:]:
+                    ring.release(slot)
+
+            worker.finalize()
+        except Exception:
+            results.put(("error", traceback.format_exc()))
+
+            # keep consuming frames (so the other process does not block) until the end
+            while True:
+                args = messages.get()
+                if args is None or args == ProcessVideoWorker.AbortMessage:
+                    break
+
+                for slot in args[:2]:
+                    if isinstance(slot, int):
+                        ring.release(slot)
+            return
+        finally:
+            for slot in held_slots:
+                ring.release(slot)
+            if ring is not None:
+                ring.close()
+
+        try:
+            data = pickle.dumps(worker)
+        except Exception:
+            # results are not available on the main process
+            data = None
+
+        results.put(("done", data))
+
+    def initialize(self, width, height):
+        self.width = width
+        self.height = height
+
+        if self.ring is None:
+            # (created with the first frame, once the shape of the frames is known)
+            self.own_ring = True
+        else:
+            self.__start()
+
+    def __start(self):
+        self.messages = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=ProcessVideoWorker.Run, name="ProcessVideoWorker",
+                                               args=(self.worker, self.width, self.height, self.ring,
+                                                     self.copy_frames, self.messages, self.results), daemon=True)
+        self.process.start()
+
+    def getWorkName(self):
+        return self.worker.getWorkName()
+
+    def __check_error(self):
+        if self.error is None:
+            try:
+                kind, data = self.results.get_nowait()
+                if kind == "error":
+                    self.error = data
+            except queue.Empty:
+                if not self.process.is_alive():
+                    self.error = "The process ended unexpectedly"
+
+        if self.error is not None:
+            raise Exception("ProcessVideoWorker: " + self.getWorkName() + " failed\n" + self.error)
+
+    def __share(self, frame):
+        # slot of the ring with the frame (a new reference for the other process), or the frame itself
+        if not self.ring.fits(frame):
+            return frame
+
+        slot = self.ring.retain(frame)
+        if slot is None:
+            # not published by the producer
+            slot = self.ring.publish(frame)
+
+        return slot
+
+    def handleFrame(self, frame, last_frame, video_idx, frame_time, current_time, frame_idx):
+        if self.process is None:
+            self.ring = SharedFrameRing(self.slots, frame.shape, frame.dtype)
+            self.__start()
+
+        self.__check_error()
+
+        frame_data = self.__share(frame)
+        if last_frame is self.previous_frame:
+            # already on the other process
+            last_data = None
+        else:
+            last_data = self.__share(last_frame)
+
+        self.messages.put((frame_data, last_data, video_idx, frame_time, current_time, frame_idx))
+        self.previous_frame = frame
+
+    def abort(self):
+        # (called by the video processors when the processing fails) stops the other process without
+        # finalizing the worker, and releases the ring
+        if self.process is not None:
+            self.messages.put(ProcessVideoWorker.AbortMessage)
+            self.process.join(ProcessVideoWorker.AbortTimeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+            self.process = None
+
+        self.previous_frame = None
+        if self.own_ring and self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def finalize(self):
+        if self.process is None:
+            # no frames were given
+            self.__start()
+
+        self.messages.put(None)
+        self.previous_frame = None
+
+        kind, data = ("error", self.error) if self.error is not None else (None, None)
+        while kind is None:
+            try:
+                kind, data = self.results.get(timeout=1.0)
+            except queue.Empty:
+                if not self.process.is_alive() and self.results.empty():
+                    kind, data = "error", "The process ended unexpectedly"
+
+        self.process.join()
+        self.process = None
+
+        if self.own_ring and self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+        if kind == "error":
+            self.error = data
+            raise Exception("ProcessVideoWorker: " + self.getWorkName() + " failed\n" + self.error)
+
+        if data is not None:
+            self.worker = pickle.loads(data)
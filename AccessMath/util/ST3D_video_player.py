@@ -83,6 +83,16 @@ class ST3D_SequentialReader:
             else:
                 raise Exception("Unknown Sequential Reader Mode")
 
+            self.skip()
+
+            return True, frame
+        else:
+            # ended, cannot continue reading ....
+            return False, None
+
+    def skip(self):
+        # moves to the next frame without computing the current one (e.g. it was cached)
+        if self.offset < len(self.st3D.frame_indices):
             # copy current properties ...
             self.last_frame_idx = self.st3D.frame_indices[self.offset]
             self.last_frame_time = self.st3D.frame_times[self.offset]
@@ -90,10 +100,9 @@ class ST3D_SequentialReader:
             # move ....
             self.offset += 1
 
-            return True, frame
+            return True
         else:
-            # ended, cannot continue reading ....
-            return False, None
+            return False
 
     def get_current_time(self):
         return self.last_frame_time
@@ -135,9 +144,13 @@ class ST3D_SequentialReader:
             self.last_frame_time = self.st3D.frame_times[self.offset]
 
 from .base_video_player import BaseVideoPlayer
+from .frame_cache import FrameCache
+from .frame_ring_buffer import FrameRingBuffer
 
 class ST3D_VideoPlayer(BaseVideoPlayer):
-    FrameCache = 500  # around 3 GB (500, un-compressed)
+    PlaybackWindow = 512 * 1024 * 1024  # bytes of frames kept around the play head
+    MinWindowFrames = 16
+    StepBackFrames = 30  # max. frames rendered backwards (instead of re-starting the window) on a jump back
 
     def __init__(self, cc_stability, st3d):
         BaseVideoPlayer.__init__(self)
@@ -158,14 +171,18 @@ class ST3D_VideoPlayer(BaseVideoPlayer):
         self.total_frames = self.st3D.frame_indices[-1]
         self.total_length = self.st3D.frame_times[-1]
 
-        self.cache_images = []
-        self.cache_times = []
-        self.cache_frames = []
-        self.cache_offset = 0.0
-        self.cache_pos = 0
-
         self.black_frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
 
+        # rendered frames around the play head (oldest to newest) and position of the play head on them
+        window_frames = ST3D_VideoPlayer.PlaybackWindow // self.black_frame.nbytes
+        self.frame_buffer = FrameRingBuffer(max(ST3D_VideoPlayer.MinWindowFrames, window_frames))
+        self.cache_pos = 0
+        # reader offset of the first frame on the window
+        self.window_first = 0
+
+        # rendered frames are also kept on the cache shared by all players (key: read mode, reader offset)
+        self.frame_cache = FrameCache.Shared()
+        self.cache_owner = FrameCache.NewOwnerId()
 
     def get_frame(self):
         self.current_time = time.time()
@@ -176,47 +193,68 @@ class ST3D_VideoPlayer(BaseVideoPlayer):
         if self.playing:
             # update last frame ...
             # use milliseconds (just like opencv does)
-            self.play_abs_position += delta * 1000.0
+            if self.play_reverse:
+                self.play_abs_position -= delta * 1000.0
+            else:
+                self.play_abs_position += delta * 1000.0
 
             # while desired frame not in cache ....
             while not self.__frame_in_cache(self.play_abs_position) and not self.end_reached:
                 # ... update cache
-                self.__extract_next_frame()
+                if len(self.frame_buffer) > 0 and self.play_abs_position < self.frame_buffer.offset:
+                    # playing backwards
+                    if not self.__extract_previous_frame():
+                        self.end_reached = True
+                else:
+                    self.__extract_next_frame()
 
             # get frame
             self.last_frame_img, self.last_frame_idx = self.__get_cached_frame(self.play_abs_position)
 
             if self.frame_changed_callback is not None:
-                if len(self.cache_frames) > 0:
-                    self.frame_changed_callback(int(self.cache_frames[self.cache_pos]), self.cache_times[self.cache_pos])
+                if len(self.frame_buffer) > 0:
+                    self.frame_changed_callback(self.frame_buffer.frame(self.cache_pos),
+                                                self.frame_buffer.time(self.cache_pos))
 
         frame = self.apply_frame_zoom()
 
         return frame, self.last_frame_idx
 
     def __frame_in_cache(self, abs_time):
-        if len(self.cache_times) == 0:
-            return False
-
-        return self.cache_offset <= abs_time <= self.cache_times[-1]
+        return self.frame_buffer.contains_time(abs_time)
 
     def __get_cached_frame(self, abs_time):
         if self.end_reached:
-            if len(self.cache_images) > 0:
-                return self.cache_images[-1], self.cache_frames[-1]
+            # last frame (or first frame if playing backwards)
+            pos = 0 if self.play_reverse else -1
+            if len(self.frame_buffer) > 0:
+                self.cache_pos = pos % len(self.frame_buffer)
+                return self.frame_buffer.image(pos), self.frame_buffer.frame(pos)
             else:
                 return self.black_frame, self.total_frames
 
-        # assume forward movement only
-        while self.cache_times[self.cache_pos] < abs_time:
-            self.cache_pos += 1
+        self.cache_pos = self.frame_buffer.find_time(abs_time)
 
-        return self.cache_images[self.cache_pos], self.cache_frames[self.cache_pos]
+        return self.frame_buffer.image(self.cache_pos), self.frame_buffer.frame(self.cache_pos)
+
+    def __read_frame(self):
+        # frame at the current offset of the reader (re-used if it was rendered before)
+        cache_key = (self.cache_owner, self.reader.read_mode, self.reader.offset)
+        cached = self.frame_cache.get(cache_key)
+        if cached is not None:
+            return self.reader.skip(), cached[0]
+
+        flag, frame = self.reader.read()
+        if flag:
+            self.frame_cache.put(cache_key, frame)
+
+        return flag, frame
 
     def __extract_next_frame(self):
         # get the next frame ...
         pre_time = time.time()
-        flag, next_frame = self.reader.read()
+        self.reader.offset = self.window_first + len(self.frame_buffer)
+        flag, next_frame = self.__read_frame()
         post_time = time.time()
         # print(post_time - pre_time)
 
@@ -229,26 +267,44 @@ class ST3D_VideoPlayer(BaseVideoPlayer):
 
         if next_frame is not None:
             # update cache ...
-
             last_time = self.reader.get_current_time()
             frame_number = self.reader.get_current_frame_index()
 
-            self.cache_times.append(last_time)
-            self.cache_images.append(next_frame)
-            self.cache_frames.append(frame_number)
-
-            while len(self.cache_times) > ST3D_VideoPlayer.FrameCache:
-                self.cache_offset = self.cache_times[0]
+            if self.frame_buffer.is_full():
+                self.frame_buffer.pop_front()
+                self.window_first += 1
                 if self.cache_pos > 0:
                     self.cache_pos -= 1
-                del self.cache_times[0]
-                del self.cache_images[0]
-                del self.cache_frames[0]
+
+            self.frame_buffer.append(next_frame, last_time, frame_number)
         else:
             frame_number = self.total_frames
 
         return next_frame, frame_number
 
+    def __extract_previous_frame(self):
+        # renders the frame right before the window, returns False if the window starts at the first frame
+        if self.window_first == 0:
+            return False
+
+        self.reader.offset = self.window_first - 1
+        flag, prev_frame = self.__read_frame()
+        if not flag:
+            return False
+
+        # the frame is displayed from the time of its own previous frame
+        if self.window_first >= 2:
+            start_time = self.st3D.frame_times[self.window_first - 2]
+        else:
+            start_time = 0.0
+
+        self.frame_buffer.prepend(prev_frame, start_time, self.reader.get_current_time(),
+                                  self.reader.get_current_frame_index())
+        self.window_first -= 1
+        self.cache_pos = min(self.cache_pos + 1, len(self.frame_buffer) - 1)
+
+        return True
+
     def set_position_frame(self, new_abs_frame, notify_listeners):
         # check that frame is within video boundaries ... or force it to be otherwise ...
         if new_abs_frame >= self.total_frames:
@@ -258,80 +314,67 @@ class ST3D_VideoPlayer(BaseVideoPlayer):
             new_abs_frame = 0
 
         # first, check if the frame is still in the cache ...
-        if len(self.cache_frames) > 0 and (self.cache_frames[0] <= new_abs_frame <= self.cache_frames[-1]):
-            # already on cache, just move the time to the right frame
-
-            start_cache_pos = 0
-            end_cache_pos = len(self.cache_frames)
-
-            while start_cache_pos < end_cache_pos:
-                mid_cache_pos = int((start_cache_pos + end_cache_pos) / 2)
-
-                if new_abs_frame < self.cache_frames[mid_cache_pos]:
-                    # move to the left ...
-                    end_cache_pos = mid_cache_pos - 1
-                else:
-                    # check ....
-                    if self.cache_frames[mid_cache_pos] == new_abs_frame or mid_cache_pos == start_cache_pos:
-                        # found exactly or approximately
-                        break
-                    else:
-                        # move to the right ...
-                        start_cache_pos = mid_cache_pos
-
-            offset = start_cache_pos
+        if self.frame_buffer.contains_frame(new_abs_frame):
+            # already on cache, just move the time to the right frame (last frame at or before the given one)
+            self.cache_pos = self.frame_buffer.find_frame(new_abs_frame)
+            if self.cache_pos > 0 and self.frame_buffer.frame(self.cache_pos) > new_abs_frame:
+                self.cache_pos -= 1
 
-            self.cache_pos = offset
-            self.play_abs_position = self.cache_times[self.cache_pos]
-            self.last_frame_img = self.cache_images[self.cache_pos]
-            self.last_frame_idx = self.cache_frames[self.cache_pos]
+            self.play_abs_position = self.frame_buffer.time(self.cache_pos)
         else:
-            # reset cache
-            self.cache_frames = []
-            self.cache_images = []
-            self.cache_times = []
-            self.cache_pos = 0
-
             # find desired position ....
             self.reader.set_current_frame_index(new_abs_frame)
 
-            # update video location and cache start
-            self.play_abs_position = self.reader.get_current_time()
-            self.cache_offset = self.play_abs_position
+            if (len(self.frame_buffer) > 0 and
+                self.window_first - ST3D_VideoPlayer.StepBackFrames <= self.reader.offset < self.window_first):
+                # a few frames before the cache, extend it backwards
+                target_offset = self.reader.offset
+                while self.window_first > target_offset:
+                    self.__extract_previous_frame()
 
-            #print("here")
+                self.cache_pos = 0
+                self.play_abs_position = self.frame_buffer.time(0)
+            else:
+                # reset cache, update video location and cache start
+                self.play_abs_position = self.reader.get_current_time()
+                self.frame_buffer.clear(self.play_abs_position)
+                self.window_first = self.reader.offset
+                self.cache_pos = 0
 
-            # read next frame
-            self.last_frame_img, self.last_frame_idx = self.__extract_next_frame()
+                # read next frame
+                self.__extract_next_frame()
 
-            #print("done")
+        if len(self.frame_buffer) > 0:
+            self.last_frame_img = self.frame_buffer.image(self.cache_pos)
+            self.last_frame_idx = self.frame_buffer.frame(self.cache_pos)
+        else:
+            self.last_frame_img, self.last_frame_idx = self.black_frame, self.total_frames
 
         if self.frame_changed_callback is not None and notify_listeners:
             self.frame_changed_callback(int(new_abs_frame), self.play_abs_position)
 
         self.last_time = time.time()
 
+    def __reload_frames(self):
+        # reset cache ...
+        self.frame_buffer.clear()
+        # re-read current frame ...
+        if self.last_frame_idx is not None:
+            self.set_position_frame(self.last_frame_idx, True)
+        else:
+            self.set_position_frame(self.reader.last_frame_idx, True)
+
     def set_binary_mode(self):
         # change mode ...
         self.reader.read_mode = ST3D_SequentialReader.ReadBinary
-        # reset cache ...
-        self.cache_frames = []
-        # re-read next frame ...
-        self.set_position_frame(self.reader.last_frame_idx, True)
+        self.__reload_frames()
 
     def set_reconstructed_mode(self):
         # change mode ...
         self.reader.read_mode = ST3D_SequentialReader.ReadReconstructed
-        # reset cache ...
-        self.cache_frames = []
-        # re-read next frame ...
-        self.set_position_frame(self.reader.last_frame_idx, True)
+        self.__reload_frames()
 
     def set_stable_cc_mode(self):
         # change mode ...
         self.reader.read_mode = ST3D_SequentialReader.ReadStable
-        # reset cache ...
-        self.cache_frames = []
-        # re-read next frame ...
-        self.set_position_frame(self.reader.last_frame_idx, True)
-
+        self.__reload_frames()
@@ -13,6 +13,7 @@ class BaseVideoPlayer:
         self.total_length = None
 
         self.play_speed = 1.0
+        self.play_reverse = False
         self.play_abs_position = 0.0
         self.playing = False
         self.end_reached = False
@@ -34,6 +35,11 @@ class BaseVideoPlayer:
         self.playing = True
         self.end_reached = False
 
+    def set_play_reverse(self, reverse):
+        self.play_reverse = reverse
+        # the end (or the start) of the video is no longer reached on the new direction
+        self.end_reached = False
+
     def pause(self):
         self.playing = False
 
@@ -0,0 +1,161 @@
+
+import threading
+import itertools
+from collections import OrderedDict
+
+import cv2
+
+
+class FrameCache:
+    # LRU cache of decoded video frames limited by memory (bytes) instead of number of frames.
+    # A single instance (FrameCache.Shared()) is used by all video players, each player stores
+    # its frames under its own owner id. Optionally, the least recently used part of the cache
+    # keeps its frames JPEG-compressed in memory (cold frames), and only the most recent frames
+    # (up to hot_bytes) are kept un-compressed. The cache can be used from several threads.
+    DefaultBudget = 2 * 1024 * 1024 * 1024
+    ColdJPEGQuality = 95
+
+    __shared = None
+    __owner_ids = itertools.count()
+
+    def __init__(self, max_bytes=None, compress_cold=False, hot_bytes=None):
+        self.max_bytes = FrameCache.DefaultBudget if max_bytes is None else max_bytes
+        self.compress_cold = compress_cold
+        # un-compressed part of the cache (only used if cold frames are compressed)
+        self.hot_bytes = self.max_bytes // 2 if hot_bytes is None else hot_bytes
+
+        self.lock = threading.Lock()
+
+        # key -> (image, info, n_bytes), from least to most recently used
+        self.hot = OrderedDict()
+        # key -> (encoded image, info, n_bytes)
+        self.cold = OrderedDict()
+        self.hot_total = 0
+        self.cold_total = 0
+
+        self.hits = 0
+        self.cold_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def Shared():
+        if FrameCache.__shared is None:
+            FrameCache.__shared = FrameCache()
+
+        return FrameCache.__shared
+
+    @staticmethod
+    def NewOwnerId():
+        # each user of the cache stores its frames using keys of the form (owner id, frame key)
+        return next(FrameCache.__owner_ids)
+
+    def total_bytes(self):
+        return self.hot_total + self.cold_total
+
+    def __len__(self):
+        return len(self.hot) + len(self.cold)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.hot or key in self.cold
+
+    def get(self, key, default=None):
+        # returns (image, info) or default
+        with self.lock:
+            if key in self.hot:
+                self.hits += 1
+                self.hot.move_to_end(key)
+                image, info, _ = self.hot[key]
+                return image, info
+
+            if key in self.cold:
+                self.hits += 1
+                self.cold_hits += 1
+                encoded, info, n_bytes = self.cold.pop(key)
+                self.cold_total -= n_bytes
+
+                image = cv2.imdecode(encoded, cv2.IMREAD_UNCHANGED)
+                self.__add_hot(key, image, info)
+                return image, info
+
+            self.misses += 1
+            return default
+
+    def put(self, key, image, info=None):
+        if image.nbytes > self.max_bytes:
+            # cannot be cached
+            return
+
+        with self.lock:
+            self.__remove(key)
+            self.__add_hot(key, image, info)
+
+    def discard(self, key):
+        with self.lock:
+            self.__remove(key)
+
+    def clear(self, owner_id=None):
+        # removes all frames (or only the frames of the given owner)
+        with self.lock:
+            if owner_id is None:
+                keys = list(self.hot.keys()) + list(self.cold.keys())
+            else:
+                keys = [key for key in itertools.chain(self.hot.keys(), self.cold.keys()) if key[0] == owner_id]
+
+            for key in keys:
+                self.__remove(key)
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "cold_hits": self.cold_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests > 0 else 0.0,
+                "evictions": self.evictions,
+                "frames": len(self.hot) + len(self.cold),
+                "cold_frames": len(self.cold),
+                "bytes": self.hot_total + self.cold_total,
+                "max_bytes": self.max_bytes,
+            }
+
+    def __repr__(self):
+        stats = self.stats()
+        return "FrameCache<{0:d} frames, {1:.1f} / {2:.1f} MB, hit rate {3:.2%}>".format(
+            stats["frames"], stats["bytes"] / 1048576.0, stats["max_bytes"] / 1048576.0, stats["hit_rate"])
+
+    # ===================================================
+    #   Internal (lock must be held)
+    # ===================================================
+    def __remove(self, key):
+        if key in self.hot:
+            self.hot_total -= self.hot.pop(key)[2]
+        elif key in self.cold:
+            self.cold_total -= self.cold.pop(key)[2]
+
+    def __add_hot(self, key, image, info):
+        self.hot[key] = (image, info, image.nbytes)
+        self.hot_total += image.nbytes
+
+        if self.compress_cold:
+            # compress the least recently used frames that do not fit on the un-compressed part
+            while self.hot_total > self.hot_bytes and len(self.hot) > 1:
+                cold_key, (cold_image, cold_info, n_bytes) = self.hot.popitem(last=False)
+                self.hot_total -= n_bytes
+
+                flag, encoded = cv2.imencode(".jpg", cold_image, [cv2.IMWRITE_JPEG_QUALITY, FrameCache.ColdJPEGQuality])
+                if flag:
+                    self.cold[cold_key] = (encoded, cold_info, encoded.nbytes)
+                    self.cold_total += encoded.nbytes
+                else:
+                    self.evictions += 1
+
+        # evict least recently used frames (cold frames are always older than hot frames)
+        while self.hot_total + self.cold_total > self.max_bytes:
+            if len(self.cold) > 0:
+                self.cold_total -= self.cold.popitem(last=False)[1][2]
+            else:
+                self.hot_total -= self.hot.popitem(last=False)[1][2]
+            self.evictions += 1
@@ -0,0 +1,102 @@
+
+import os
+import json
+
+import numpy as np
+
+
+class FrameExportIndex:
+    # Metadata of the images of a frame export, stored by columns (sorted by frame index) on a single
+    # .npz file. The values shared by all images (size, channels and image extension) are stored once.
+    # Exports made before this index existed only have index.json (a dictionary of dictionaries keyed
+    # by frame index), which is still supported for reading.
+    Filename = "index.npz"
+    JSONFilename = "index.json"
+    Version = 1
+
+    def __init__(self, frame_idx, abs_time, video_idx, video_time, width, height, channels, extension,
+                 raw_index=None):
+        self.frame_idx = frame_idx
+        self.abs_time = abs_time
+        self.video_idx = video_idx
+        self.video_time = video_time
+        # (raw exports only) record of each image on the raw frames file
+        self.raw_index = raw_index
+
+        self.width = width
+        self.height = height
+        # (0 = unknown)
+        self.channels = channels
+        self.extension = extension
+
+        # file the index was loaded from
+        self.filename = None
+
+    def __len__(self):
+        return self.frame_idx.shape[0]
+
+    @staticmethod
+    def FromMetadata(all_metadata):
+        # from a dictionary (frame index -> metadata of the image) as built by the FrameExporter
+        frame_keys = sorted(all_metadata.keys(), key=lambda x: int(x))
+        rows = [all_metadata[key] for key in frame_keys]
+
+        frame_idx = np.array([row["frame_idx"] for row in rows], dtype=np.int64)
+        abs_time = np.array([row["abs_time"] for row in rows], dtype=np.float64)
+        video_idx = np.array([row["video_idx"] for row in rows], dtype=np.int32)
+        video_time = np.array([row["video_time"] for row in rows], dtype=np.float64)
+
+        if len(rows) > 0 and "raw_index" in rows[0]:
+            raw_index = np.array([row["raw_index"] for row in rows], dtype=np.int64)
+        else:
+            raw_index = None
+
+        first = rows[0] if len(rows) > 0 else {}
+        return FrameExportIndex(frame_idx, abs_time, video_idx, video_time, first.get("width", 0),
+                                first.get("height", 0), first.get("channels", 0), first.get("extension", ""),
+                                raw_index)
+
+    @staticmethod
+    def FromJSON(filename):
+        with open(filename, "r") as in_file:
+            index = FrameExportIndex.FromMetadata(json.load(in_file))
+
+        index.filename = filename
+        return index
+
+    def save(self, filename):
+        columns = {
+            "frame_idx": self.frame_idx,
+            "abs_time": self.abs_time,
+            "video_idx": self.video_idx,
+            "video_time": self.video_time,
+        }
+        if self.raw_index is not None:
+            columns["raw_index"] = self.raw_index
+
+        with open(filename, "wb") as out_file:
+            np.savez(out_file, version=FrameExportIndex.Version, width=self.width, height=self.height,
+                     channels=self.channels, extension=self.extension, **columns)
+
+    @staticmethod
+    def Load(filename):
+        with np.load(filename) as data:
+            if int(data["version"]) != FrameExportIndex.Version:
+                raise Exception("FrameExportIndex: Unsupported index version <" + filename + ">")
+
+            raw_index = data["raw_index"] if "raw_index" in data.files else None
+            index = FrameExportIndex(data["frame_idx"], data["abs_time"], data["video_idx"], data["video_time"],
+                                     int(data["width"]), int(data["height"]), int(data["channels"]),
+                                     str(data["extension"]), raw_index)
+
+        index.filename = filename
+        return index
+
+    @staticmethod
+    def FromExportDir(export_dir):
+        # binary index if present, otherwise the index.json of older exports
+        filename = "{0:s}/{1:s}".format(export_dir, FrameExportIndex.Filename)
+        if os.path.exists(filename):
+            return FrameExportIndex.Load(filename)
+
+        return FrameExportIndex.FromJSON("{0:s}/{1:s}".format(export_dir, FrameExportIndex.JSONFilename))
@@ -0,0 +1,112 @@
+
+import numpy as np
+
+
+class FrameRingBuffer:
+    # Fixed-capacity circular buffer of decoded frames. Each slot keeps the image, the time at
+    # the end of the frame (as reported by OpenCV after reading it) and the absolute frame index.
+    # Frames can be added at both ends (next frames at the end, previous frames at the front), and
+    # the frame on the opposite end is evicted in constant time once the buffer is full. Positions
+    # used by the methods below are logical (0 = oldest frame).
+    def __init__(self, capacity):
+        self.capacity = capacity
+
+        self.images = [None] * capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.frames = np.zeros(capacity, dtype=np.int64)
+
+        self.start = 0
+        self.count = 0
+        # time at which the oldest frame starts
+        self.offset = 0.0
+
+    def __len__(self):
+        return self.count
+
+    def is_full(self):
+        return self.count == self.capacity
+
+    def clear(self, offset=0.0):
+        for pos in range(self.count):
+            self.images[(self.start + pos) % self.capacity] = None
+
+        self.start = 0
+        self.count = 0
+        self.offset = offset
+
+    def __slot(self, pos):
+        if pos < 0:
+            pos += self.count
+
+        return (self.start + pos) % self.capacity
+
+    def pop_front(self):
+        # the next frame starts where the evicted one ended
+        self.offset = self.times[self.start]
+        self.images[self.start] = None
+
+        self.start = (self.start + 1) % self.capacity
+        self.count -= 1
+
+    def pop_back(self):
+        self.images[self.__slot(-1)] = None
+        self.count -= 1
+
+    def prepend(self, image, start_time, end_time, frame_idx):
+        # the frame must end where the current first frame starts
+        if self.count == self.capacity:
+            self.pop_back()
+
+        self.start = (self.start - 1) % self.capacity
+        self.images[self.start] = image
+        self.times[self.start] = end_time
+        self.frames[self.start] = frame_idx
+        self.offset = start_time
+
+        self.count += 1
+
+    def append(self, image, end_time, frame_idx):
+        if self.count == self.capacity:
+            self.pop_front()
+
+        slot = (self.start + self.count) % self.capacity
+        self.images[slot] = image
+        self.times[slot] = end_time
+        self.frames[slot] = frame_idx
+
+        self.count += 1
+
+    def image(self, pos):
+        return self.images[self.__slot(pos)]
+
+    def time(self, pos):
+        return float(self.times[self.__slot(pos)])
+
+    def frame(self, pos):
+        return int(self.frames[self.__slot(pos)])
+
+    def contains_time(self, abs_time):
+        return self.count > 0 and self.offset <= abs_time <= self.time(-1)
+
+    def contains_frame(self, frame_idx):
+        return self.count > 0 and self.frame(0) <= frame_idx <= self.frame(-1)
+
+    def __search(self, values, value):
+        # first logical position with values[pos] >= value (values are sorted on logical order)
+        low = 0
+        high = self.count
+        while low < high:
+            mid = (low + high) // 2
+            if values[(self.start + mid) % self.capacity] < value:
+                low = mid + 1
+            else:
+                high = mid
+
+        return low
+
+    def find_time(self, abs_time):
+        # position of the frame being displayed at the given time
+        return min(self.__search(self.times, abs_time), self.count - 1)
+
+    def find_frame(self, frame_idx):
+        return min(self.__search(self.frames, frame_idx), self.count - 1)
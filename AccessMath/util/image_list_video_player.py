@@ -1,26 +1,24 @@
 import time
-from collections import OrderedDict
+import bisect
+import threading
+import concurrent.futures
+
 import cv2
 import numpy as np
 
 from AccessMath.preprocessing.video_processor.image_list_processor import ImageListGenerator
 
 from .base_video_player import BaseVideoPlayer
-
-class ImageListCache(OrderedDict):
-    def __init__(self, max_size=500):
-        self.max_size = max_size
-        super(ImageListCache, self).__init__()
-
-    def __setitem__(self, key, value, **kwargs):
-        if len(self) == self.max_size:
-            self.popitem(last=False)
-        super(ImageListCache, self).__setitem__(key, value)
-        self.move_to_end(key)
+from .frame_cache import FrameCache
 
 
 class ImageListVideoPlayer(ImageListGenerator, BaseVideoPlayer):
-    FrameCache = 500
+    # images expected to be shown soon are loaded ahead on a pool of threads (into the frame cache)
+    PrefetchWorkers = 4
+    PrefetchSeconds = 2.0 # playback time (at the current speed and direction) loaded ahead of the play head
+    PrefetchMaxImages = 24 # max. images loaded ahead, evenly spread over PrefetchSeconds at high speeds
+    PrefetchScrubImages = 4 # images loaded on each side of the play head while paused
+
     def __init__(self, folder, forced_resolution=None, file_extension='.jpg'):
         # super(ImageListVideoPlayer, self).__init__(folder, extension=file_extension, preload=False)
         ImageListGenerator.__init__(self, folder, extension=file_extension, preload=False)
@@ -34,25 +32,35 @@ class ImageListVideoPlayer(ImageListGenerator, BaseVideoPlayer):
         self.current_time = None
         self.last_time = time.time()
 
-        self.sorted_keys = sorted(self.metadata.keys(), key=lambda x: int(x))
-        self.virtual_len = self.metadata[self.sorted_keys[-1]]['frame_idx']
-        self.actual_len = len(self.metadata) - 1
-        self.virtual_frame_to_image_map = {self.metadata[key]['frame_idx'] : k for k, key in enumerate(self.sorted_keys)}
-        self.virtual_time_to_image_map = {self.metadata[key]['abs_time'] : k for k, key in enumerate(self.sorted_keys)}
-        self.virtual_time_to_virtual_frame = {self.metadata[key]['abs_time'] : self.metadata[key]['frame_idx'] for key in self.sorted_keys}
-        self.frame_idxs = np.asarray(list(self.virtual_frame_to_image_map.keys())[1:])
-        self.frame_idxs.sort()
-        self.frame_times = np.asarray(list(self.virtual_time_to_image_map.keys())[1:])
-        self.frame_times.sort()
-
-        self.cache = ImageListCache(self.FrameCache)
+        # sorted index of (virtual) frame and time of each point, the first point is the start of the video
+        # and the rest are the images (image k is point k + 1)
+        self.point_frames = self.columns['frame_idx']
+        self.point_times = self.columns['abs_time']
+        self.virtual_len = int(self.point_frames[-1])
+        self.actual_len = self.point_frames.shape[0] - 1
+        self.frame_idxs = self.point_frames[1:]
+        self.frame_times = self.point_times[1:]
+        # (same values as lists, single lookups are faster on lists using bisect)
+        self.point_frames_list = self.point_frames.tolist()
+        self.point_times_list = self.point_times.tolist()
+        self.frame_idxs_list = self.point_frames_list[1:]
+        self.frame_times_list = self.point_times_list[1:]
+
+        # loaded images are kept on the cache shared by all players (key: nearest virtual time)
+        self.frame_cache = FrameCache.Shared()
+        self.cache_owner = FrameCache.NewOwnerId()
+
+        # image index -> loading (future) of images being prefetched
+        self.prefetch_pool = concurrent.futures.ThreadPoolExecutor(max_workers=ImageListVideoPlayer.PrefetchWorkers,
+                                                                   thread_name_prefix="ImageListVideoPlayer-prefetch")
+        self.prefetch_pending = {}
+        self.prefetch_lock = threading.Lock()
+        self.prefetch_state = None
 
         self.height, self.width = self.get_image_dims()
 
         self.total_frames = self.virtual_len
-        self.total_length = self.metadata[self.sorted_keys[-1]]['abs_time']
-        # print(self.sorted_keys)
-        # print(self.virtual_frame_to_image_map)
+        self.total_length = self.point_times_list[-1]
         # print(self.frame_idxs)
 
     @staticmethod
@@ -72,72 +80,205 @@ class ImageListVideoPlayer(ImageListGenerator, BaseVideoPlayer):
         h, w, c = im.shape
         return h, w
 
+    @staticmethod
+    def nearest_position(sorted_list, value):
+        # position of the nearest element (the first one on ties)
+        pos = bisect.bisect_left(sorted_list, value)
+        if pos == 0:
+            return 0
+        if pos == len(sorted_list):
+            return pos - 1
+
+        return pos - 1 if value - sorted_list[pos - 1] <= sorted_list[pos] - value else pos
+
+    @staticmethod
+    def nearest_positions(values, sorted_values):
+        # (vectorized) nearest_position for an array of values
+        pos = np.searchsorted(sorted_values, values, side='left')
+        prev_pos = np.maximum(pos - 1, 0)
+        pos = np.minimum(pos, sorted_values.shape[0] - 1)
+
+        use_prev = (values - sorted_values[prev_pos]) <= (sorted_values[pos] - values)
+        return np.where(use_prev, prev_pos, pos)
+
+    def find_nearest_image_by_frame(self, virtual_frame):
+        return ImageListVideoPlayer.nearest_position(self.frame_idxs_list, virtual_frame)
+
+    def find_nearest_image_by_time(self, virtual_time):
+        return ImageListVideoPlayer.nearest_position(self.frame_times_list, virtual_time)
+
+    def find_nearest_images_by_frames(self, virtual_frames):
+        return ImageListVideoPlayer.nearest_positions(np.asarray(virtual_frames), self.frame_idxs)
+
+    def find_nearest_images_by_times(self, virtual_times):
+        return ImageListVideoPlayer.nearest_positions(np.asarray(virtual_times), self.frame_times)
+
     def find_nearest_virtual_frame(self, virtual_frame):
-        return self.frame_idxs[np.argmin(np.abs(self.frame_idxs - virtual_frame))]
+        return self.frame_idxs_list[self.find_nearest_image_by_frame(virtual_frame)]
 
     def find_nearest_virtual_time(self, virtual_time):
-        return self.frame_times[np.argmin(np.abs(self.frame_times - virtual_time))]
+        return self.frame_times_list[self.find_nearest_image_by_time(virtual_time)]
 
     def find_virtual_time_by_frame(self, virtual_frame):
-        nearest_virtual_idx = self.find_nearest_virtual_frame(virtual_frame)
-        nearest_virtual_time = self.metadata[str(nearest_virtual_idx)]['abs_time']
-        if virtual_frame < nearest_virtual_idx and virtual_frame >= 0:
-            neighbour_virtual_idx = self.frame_idxs[np.argmin(np.abs(self.frame_idxs - virtual_frame)) - 1]
-            neighbour_virtual_time = self.metadata[str(neighbour_virtual_idx)]['abs_time']
-            virtual_time = self.interpolate_time(neighbour_virtual_time, nearest_virtual_time,
-                                                 neighbour_virtual_idx, nearest_virtual_idx, virtual_frame)
-        elif virtual_frame > nearest_virtual_idx and virtual_frame <= self.total_frames:
-            neighbour_virtual_idx = self.frame_idxs[np.argmin(np.abs(self.frame_idxs - virtual_frame)) + 1]
-            neighbour_virtual_time = self.metadata[str(neighbour_virtual_idx)]['abs_time']
-            virtual_time = self.interpolate_time(nearest_virtual_time, neighbour_virtual_time,
-                                                 nearest_virtual_idx, neighbour_virtual_idx, virtual_frame)
-        else:
-            virtual_time = nearest_virtual_time
-        return virtual_time
+        # the time is interpolated between the closest points, frames out of the video get the time of the
+        # nearest image
+        if virtual_frame < 0:
+            return self.frame_times_list[0]
+        if virtual_frame > self.total_frames:
+            return self.frame_times_list[-1]
+
+        segment = min(bisect.bisect_right(self.point_frames_list, virtual_frame) - 1, len(self.point_frames_list) - 2)
+        f1, f2 = self.point_frames_list[segment], self.point_frames_list[segment + 1]
+        t1, t2 = self.point_times_list[segment], self.point_times_list[segment + 1]
+        if virtual_frame == f2:
+            return t2
+
+        return self.interpolate_time(t1, t2, f1, f2, virtual_frame)
 
     def find_virtual_frame_by_time(self, virtual_time):
-        nearest_virtual_time = self.find_nearest_virtual_time(virtual_time)
-        nearest_virtual_frame = self.virtual_time_to_virtual_frame[nearest_virtual_time]
-        if virtual_time < nearest_virtual_time and virtual_time > 0.:
-            neighbour_virtual_time =  self.frame_times[np.argmin(np.abs(self.frame_times - virtual_time)) - 1]
-            neighbour_virtual_frame =  self.virtual_time_to_virtual_frame[neighbour_virtual_time]
-            virtual_frame = self.interpolate_frame(neighbour_virtual_frame, nearest_virtual_frame,
-                                                 neighbour_virtual_time, nearest_virtual_time, virtual_time)
-        elif virtual_time > nearest_virtual_time and virtual_time < self.total_length:
-            neighbour_virtual_time = self.frame_times[np.argmin(np.abs(self.frame_times - virtual_time)) + 1]
-            neighbour_virtual_frame = self.virtual_time_to_virtual_frame[neighbour_virtual_time]
-            virtual_frame = self.interpolate_frame(nearest_virtual_frame, neighbour_virtual_frame,
-                                                 nearest_virtual_time,neighbour_virtual_time, virtual_time)
-        else:
-            virtual_frame = nearest_virtual_frame
-        return virtual_frame
+        # the frame is interpolated between the closest points, times out of the video get the frame of the
+        # nearest image
+        if virtual_time <= 0.0:
+            return self.frame_idxs_list[0]
+        if virtual_time >= self.total_length:
+            return self.frame_idxs_list[-1]
+
+        segment = min(bisect.bisect_right(self.point_times_list, virtual_time) - 1, len(self.point_times_list) - 2)
+        f1, f2 = self.point_frames_list[segment], self.point_frames_list[segment + 1]
+        t1, t2 = self.point_times_list[segment], self.point_times_list[segment + 1]
+        if virtual_time == t2:
+            return f2
+
+        return self.interpolate_frame(f1, f2, t1, t2, virtual_time)
+
+    def find_virtual_times_by_frames(self, virtual_frames):
+        # (vectorized) find_virtual_time_by_frame for an array of frames
+        frames = np.asarray(virtual_frames, dtype=np.float64)
+        segment = np.clip(np.searchsorted(self.point_frames, frames, side='right') - 1, 0, self.point_frames.shape[0] - 2)
+        f1, f2 = self.point_frames[segment], self.point_frames[segment + 1]
+        t1, t2 = self.point_times[segment], self.point_times[segment + 1]
+
+        times = np.where(frames == f2, t2, ImageListVideoPlayer.interpolate_time(t1, t2, f1, f2, frames))
+        times = np.where(frames < 0, self.frame_times[0], times)
+        times = np.where(frames > self.total_frames, self.frame_times[-1], times)
+
+        return times
+
+    def find_virtual_frames_by_times(self, virtual_times):
+        # (vectorized) find_virtual_frame_by_time for an array of times
+        times = np.asarray(virtual_times, dtype=np.float64)
+        segment = np.clip(np.searchsorted(self.point_times, times, side='right') - 1, 0, self.point_times.shape[0] - 2)
+        f1, f2 = self.point_frames[segment], self.point_frames[segment + 1]
+        t1, t2 = self.point_times[segment], self.point_times[segment + 1]
+
+        frames = np.where(times == t2, f2, ((f2 - f1) * (times - t1) / (t2 - t1) + f1).astype(np.int64))
+        frames = np.where(times <= 0.0, self.frame_idxs[0], frames)
+        frames = np.where(times >= self.total_length, self.frame_idxs[-1], frames)
+
+        return frames
 
     def __len__(self):
         return self.virtual_len
 
     def __getitem__(self, item):
-        nearest_virtual_frame = self.find_nearest_virtual_frame(item)
-        image_idx = self.virtual_frame_to_image_map[nearest_virtual_frame] - 1
+        image_idx = self.find_nearest_image_by_frame(item)
         im = super(ImageListVideoPlayer, self).__getitem__(image_idx)
         if self.forced_width is not None:
             im = cv2.resize(im, (self.forced_width, self.forced_height), interpolation=cv2.INTER_AREA)
         return im
 
-    def set_position_frame(self, frame, notify_listeners):
-        virtual_time = self.find_virtual_time_by_frame(frame)
-        nearest_virtual_time = self.find_nearest_virtual_time(virtual_time)
+    def close(self):
+        self.prefetch_pool.shutdown(wait=True, cancel_futures=True)
+        self.frame_cache.clear(self.cache_owner)
+
+    def __image_key(self, image_idx):
+        # (images are cached by their virtual time)
+        return self.cache_owner, self.frame_times_list[image_idx]
+
+    def __load_image(self, image_idx):
+        im = super(ImageListVideoPlayer, self).__getitem__(image_idx)
+        if self.forced_width is not None:
+            im = cv2.resize(im, (self.forced_width, self.forced_height), interpolation=cv2.INTER_AREA)
+
+        self.frame_cache.put(self.__image_key(image_idx), im)
+        return im
 
-        # check cache
-        if nearest_virtual_time in self.cache:
-            self.last_frame_img = self.cache[nearest_virtual_time]
-            self.last_frame_idx = frame
+    def __prefetch_image(self, image_idx):
+        # (runs on the prefetch pool)
+        try:
+            if self.__image_key(image_idx) not in self.frame_cache:
+                self.__load_image(image_idx)
+        finally:
+            with self.prefetch_lock:
+                del self.prefetch_pending[image_idx]
+
+    def __get_image(self, image_idx):
+        # from the cache, waits for the image if it is being prefetched, or loads it otherwise
+        cached = self.frame_cache.get(self.__image_key(image_idx))
+        if cached is not None:
+            return cached[0]
+
+        with self.prefetch_lock:
+            future = self.prefetch_pending.get(image_idx)
+
+        if future is not None:
+            try:
+                future.result()
+            except Exception:
+                # (cancelled or failed) loaded again below
+                pass
+
+            cached = self.frame_cache.get(self.__image_key(image_idx))
+            if cached is not None:
+                return cached[0]
+
+        return self.__load_image(image_idx)
+
+    def __prefetch_around(self, image_idx):
+        # requests the images expected after the given one (on the play direction at the current speed), or
+        # the images on both sides if paused (scrubbing). Previous requests that are no longer expected and
+        # have not started are cancelled.
+        state = (image_idx, self.playing, self.play_reverse, self.play_speed)
+        if state == self.prefetch_state:
+            return
+        self.prefetch_state = state
+
+        last_image = len(self.frame_times_list) - 1
+        if self.playing:
+            horizon = ImageListVideoPlayer.PrefetchSeconds * self.play_speed * 1000.0
+            if self.play_reverse:
+                end_idx = self.find_nearest_image_by_time(self.frame_times_list[image_idx] - horizon)
+                step = -max(1, (image_idx - end_idx) // ImageListVideoPlayer.PrefetchMaxImages)
+            else:
+                end_idx = self.find_nearest_image_by_time(self.frame_times_list[image_idx] + horizon)
+                step = max(1, (end_idx - image_idx) // ImageListVideoPlayer.PrefetchMaxImages)
+
+            expected = list(range(image_idx + step, end_idx + step, step))
         else:
-            im = self[frame]
-            self.cache[nearest_virtual_time] = im
-            self.last_frame_img = im
-            self.last_frame_idx = frame
+            expected = []
+            for offset in range(1, ImageListVideoPlayer.PrefetchScrubImages + 1):
+                expected += [image_idx + offset, image_idx - offset]
+
+        expected = [idx for idx in expected if 0 <= idx <= last_image]
+
+        with self.prefetch_lock:
+            expected_set = set(expected)
+            for idx, future in list(self.prefetch_pending.items()):
+                if idx not in expected_set and future.cancel():
+                    del self.prefetch_pending[idx]
+
+            for idx in expected:
+                if idx not in self.prefetch_pending and self.__image_key(idx) not in self.frame_cache:
+                    self.prefetch_pending[idx] = self.prefetch_pool.submit(self.__prefetch_image, idx)
+
+    def set_position_frame(self, frame, notify_listeners):
+        virtual_time = self.find_virtual_time_by_frame(frame)
+        image_idx = self.find_nearest_image_by_time(virtual_time)
 
+        self.last_frame_img = self.__get_image(image_idx)
+        self.last_frame_idx = frame
         self.play_abs_position = virtual_time
+        self.__prefetch_around(image_idx)
 
         if self.frame_changed_callback is not None and notify_listeners:
             self.frame_changed_callback(int(frame), self.play_abs_position)
@@ -154,17 +295,15 @@ class ImageListVideoPlayer(ImageListGenerator, BaseVideoPlayer):
         if self.playing:
             # update last frame ...
             # use milliseconds (just like opencv does)
-            self.play_abs_position += delta * 1000.0
-            nearest_virtual_time = self.find_nearest_virtual_time(self.play_abs_position)
-            # get frame from cache if present if not update cache
-            if nearest_virtual_time in self.cache:
-                self.last_frame_img = self.cache[nearest_virtual_time]
+            if self.play_reverse:
+                self.play_abs_position = max(0.0, self.play_abs_position - delta * 1000.0)
             else:
-                image_idx = self.virtual_time_to_image_map[nearest_virtual_time] - 1
-                im = super(ImageListVideoPlayer, self).__getitem__(image_idx)
-                self.cache[nearest_virtual_time] = im
-                self.last_frame_img = im
+                self.play_abs_position += delta * 1000.0
+            image_idx = self.find_nearest_image_by_time(self.play_abs_position)
+            # from cache (or prefetched) if present, loaded otherwise
+            self.last_frame_img = self.__get_image(image_idx)
             self.last_frame_idx = self.find_virtual_frame_by_time(self.play_abs_position)
+            self.__prefetch_around(image_idx)
 
             if self.frame_changed_callback is not None:
                 self.frame_changed_callback(self.last_frame_idx, self.play_abs_position)
@@ -1,12 +1,25 @@
 
 import time
+import atexit
+import weakref
+import threading
+
 import cv2
 import numpy as np
 
 from .base_video_player import BaseVideoPlayer
+from .frame_cache import FrameCache
+from .frame_ring_buffer import FrameRingBuffer
+from .video_seek_index import VideoSeekIndex
 
 class OpenCVVideoPlayer(BaseVideoPlayer):
-    FrameCache = 500 # around 3 GB (500, un-compressed)
+    PlaybackWindow = 512 * 1024 * 1024 # bytes of decoded frames kept around the play head
+    MinWindowFrames = 16
+    PrefetchFrames = 120 # max. frames decoded ahead of (and behind) the play head
+    BackfillBlock = 48 # max. frames decoded per step when filling the window behind the play head
+
+    # players with a running decoder thread (stopped before the interpreter exits)
+    LivePlayers = weakref.WeakSet()
 
     def __init__(self, video_files, forced_resolution=None):
         # super(BaseVideoPlayer, self).__init__()
@@ -34,12 +47,8 @@ class OpenCVVideoPlayer(BaseVideoPlayer):
         self.video_offsets = [0.0]
         self.frame_offsets = [0]
         self.video_frames = []
-
-        self.cache_images = []
-        self.cache_times = []
-        self.cache_frames = []
-        self.cache_offset = 0.0
-        self.cache_pos = 0
+        # key-frame positions of each video (None until built, or if not available for the file)
+        self.seek_indices = [None] * len(self.video_files)
 
         # get some basic properties
         # total length, frames
@@ -97,6 +106,60 @@ class OpenCVVideoPlayer(BaseVideoPlayer):
 
         self.black_frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
 
+        # decoded frames (oldest to newest) and position of the play head on them
+        window_frames = OpenCVVideoPlayer.PlaybackWindow // self.black_frame.nbytes
+        self.frame_buffer = FrameRingBuffer(max(OpenCVVideoPlayer.MinWindowFrames, window_frames))
+        self.cache_pos = 0
+        # frames kept decoded on each side of the play head (the window is centred on it)
+        self.window_target = min(OpenCVVideoPlayer.PrefetchFrames, (self.frame_buffer.capacity - 1) // 2)
+
+        # every decoded frame is also kept on the cache shared by all players (key: frame index)
+        self.frame_cache = FrameCache.Shared()
+        self.cache_owner = FrameCache.NewOwnerId()
+
+        # frames are decoded around the play head by a background thread
+        self.decoder_condition = threading.Condition()
+        self.decoder_seek_frame = None
+        self.decoder_generation = 0
+        self.decoder_finished = False
+        self.decoder_stopped = False
+        # absolute index of the next frame that the open capture will return
+        self.decoder_next_frame = None
+        self.decoder_backfill_failed = False
+        self.decoder_thread = threading.Thread(target=self.__decoder_run, name="OpenCVVideoPlayer-decoder",
+                                               daemon=True)
+        self.decoder_thread.start()
+
+        # seek indices are loaded (or built, a scan of all the packets of the video) by another thread,
+        # seeks use the plain OpenCV seek until the index of the video is ready
+        self.index_stop = threading.Event()
+        self.index_thread = threading.Thread(target=self.__index_run, name="OpenCVVideoPlayer-index", daemon=True)
+        self.index_thread.start()
+        OpenCVVideoPlayer.LivePlayers.add(self)
+
+    def __index_run(self):
+        for video_idx, video_file in enumerate(self.video_files):
+            if self.index_stop.is_set():
+                return
+
+            self.seek_indices[video_idx] = VideoSeekIndex.FromVideoFile(video_file, stop_event=self.index_stop)
+
+    def close(self):
+        with self.decoder_condition:
+            self.decoder_stopped = True
+            self.decoder_condition.notify_all()
+
+        self.index_stop.set()
+        self.index_thread.join()
+        self.decoder_thread.join()
+        OpenCVVideoPlayer.LivePlayers.discard(self)
+
+        self.frame_cache.clear(self.cache_owner)
+
+    @staticmethod
+    def CloseAll():
+        for player in list(OpenCVVideoPlayer.LivePlayers):
+            player.close()
 
     def set_position_time(self, new_abs_position):
         # check if cache has to be cleaned (new position not in cache)
@@ -109,124 +172,258 @@ class OpenCVVideoPlayer(BaseVideoPlayer):
         if new_abs_frame < 0:
             new_abs_frame = 0
 
-        # first, check if the frame is still in the cache ...
-        if len(self.cache_frames) > 0 and (self.cache_frames[0] <= new_abs_frame <= self.cache_frames[-1]):
-            # already on cache, just move the time to the right frame
-            offset = new_abs_frame - self.cache_frames[0]
-            # adjust
-            if offset > 0:
-                self.play_abs_position = self.cache_times[offset - 1]
+        cached = None
+        with self.decoder_condition:
+            # first, check if the frame is still in the cache ...
+            if self.frame_buffer.contains_frame(new_abs_frame):
+                # already on cache, just move the time to the right frame
+                self.cache_pos = self.frame_buffer.find_frame(new_abs_frame)
+                if self.cache_pos > 0:
+                    self.play_abs_position = self.frame_buffer.time(self.cache_pos - 1)
+                else:
+                    # first element on cache ...
+                    self.play_abs_position = self.frame_buffer.offset
             else:
-                # first element on cache ...
-                self.play_abs_position = self.cache_offset
-
-            self.cache_pos = offset
-            self.last_frame_img = self.cache_images[self.cache_pos]
-            self.last_frame_idx = self.cache_frames[self.cache_pos]
-        else:
-            # reset cache
-            self.cache_frames = []
-            self.cache_images = []
-            self.cache_times = []
-            self.cache_pos = 0
+                # reset cache and ask the decoder to jump to the new position
+                self.frame_buffer.clear()
+                self.cache_pos = 0
+                self.decoder_seek_frame = new_abs_frame
+                self.decoder_generation += 1
+                self.decoder_finished = False
+                self.decoder_backfill_failed = False
+                self.decoder_condition.notify_all()
+
+                cached = self.frame_cache.get((self.cache_owner, new_abs_frame))
+                if cached is None:
+                    # wait for the first frame at the new position
+                    self.decoder_condition.wait_for(lambda: (self.decoder_seek_frame is None and
+                                                             (len(self.frame_buffer) > 0 or self.decoder_finished)))
+
+                    # update video location (cache start)
+                    self.play_abs_position = self.frame_buffer.offset
+
+            if cached is not None:
+                # decoded before, the frame is displayed while the decoder moves to the new position
+                self.last_frame_img, (self.play_abs_position, _) = cached
+                self.last_frame_idx = new_abs_frame
+            elif len(self.frame_buffer) > 0:
+                self.last_frame_img = self.frame_buffer.image(self.cache_pos)
+                self.last_frame_idx = self.frame_buffer.frame(self.cache_pos)
+            else:
+                self.last_frame_img, self.last_frame_idx = self.black_frame, self.total_frames
 
-            # find desired video
-            opened_video = self.play_video if self.current_capture is not None else -1
-            self.play_video = 0
+            # the decoder can re-use slots behind the play head
+            self.decoder_condition.notify_all()
 
-            while new_abs_frame > self.frame_offsets[self.play_video + 1]:
-                self.play_video += 1
+        if self.frame_changed_callback is not None and notify_listeners:
+            self.frame_changed_callback(int(new_abs_frame), self.play_abs_position)
 
-            #print("Jumping to video offset " + str(self.play_video))
-            # open the video at desired frame
-            offset = new_abs_frame - self.frame_offsets[self.play_video]
-            if opened_video != self.play_video:
-                self.current_capture = cv2.VideoCapture(self.video_files[self.play_video])
+        self.last_time = time.time()
 
+    # ===================================================
+    #   Decoder thread (the only user of the video captures)
+    # ===================================================
+    def __open_capture(self, video_idx):
+        self.play_video = video_idx
+        self.current_capture = cv2.VideoCapture(self.video_files[video_idx])
+
+    def __decoder_seek(self, new_abs_frame):
+        # find desired video
+        opened_video = self.play_video if self.current_capture is not None else -1
+        target_video = 0
+        while new_abs_frame > self.frame_offsets[target_video + 1]:
+            target_video += 1
+
+        # open the video at desired frame
+        offset = new_abs_frame - self.frame_offsets[target_video]
+        if opened_video != target_video:
+            self.__open_capture(target_video)
+
+        seek_index = self.seek_indices[target_video]
+        if seek_index is None:
+            # (index not available yet) plain seek, exact or not depending on the codec
             self.current_capture.set(cv2.CAP_PROP_POS_FRAMES, offset)
-            # update video location and cache start
-            self.play_abs_position = self.current_capture.get(cv2.CAP_PROP_POS_MSEC) + self.video_offsets[self.play_video]
-            self.cache_offset = self.play_abs_position
-            # print(self.play_abs_position)
-
-            #print("here")
+        else:
+            # jump to the closest key-frame before the frame and decode forward (exact on any codec), unless
+            # the capture is already between that key-frame and the frame
+            keyframe = seek_index.keyframe_before(offset)
+            start_frame = int(self.current_capture.get(cv2.CAP_PROP_POS_FRAMES))
+            if opened_video != target_video or not (keyframe <= start_frame <= offset):
+                self.current_capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+                start_frame = keyframe
 
-            # read next frame
-            self.last_frame_img, self.last_frame_idx = self.__extract_next_frame()
+            for _ in range(offset - start_frame):
+                self.current_capture.grab()
 
-        if self.frame_changed_callback is not None and notify_listeners:
-            self.frame_changed_callback(int(new_abs_frame), self.play_abs_position)
+        self.decoder_next_frame = new_abs_frame
 
-        self.last_time = time.time()
+        return self.current_capture.get(cv2.CAP_PROP_POS_MSEC) + self.video_offsets[self.play_video]
 
-    def __extract_next_frame(self):
+    def __decoder_read(self):
         if self.current_capture is None:
-            self.play_video = 0
-            self.current_capture = cv2.VideoCapture(self.video_files[self.play_video])
-            self.play_abs_position = 0.0
+            self.__open_capture(0)
 
         # get the next frame ...
-        flag = False
+        flag, next_frame = self.current_capture.read()
         while not flag:
-            flag, next_frame = self.current_capture.read()
-            if self.forced_width is not None and flag:
-                next_frame = cv2.resize(next_frame, (self.forced_width, self.forced_height))
+            # failed to get frame from current capture... try opening next ...
+            if self.play_video + 1 < len(self.video_files):
+                self.__open_capture(self.play_video + 1)
+                flag, next_frame = self.current_capture.read()
+            else:
+                return None, None, None
+
+        if self.forced_width is not None:
+            next_frame = cv2.resize(next_frame, (self.forced_width, self.forced_height))
+
+        end_time = self.current_capture.get(cv2.CAP_PROP_POS_MSEC) + self.video_offsets[self.play_video]
+        frame_number = int(self.current_capture.get(cv2.CAP_PROP_POS_FRAMES)) - 1 + self.frame_offsets[self.play_video]
+        self.decoder_next_frame = frame_number + 1
+
+        return next_frame, end_time, frame_number
+
+    def __decoder_backfill(self, first_frame, n_frames):
+        # decodes the frames right before the first frame on the window
+        start_frame = max(0, first_frame - n_frames)
+        start_time = self.__decoder_seek(start_frame)
+
+        frames = []
+        for expected_frame in range(start_frame, first_frame):
+            next_frame, end_time, frame_number = self.__decoder_read()
+            if next_frame is None or frame_number != expected_frame:
+                # inexact seek, the frames cannot be placed on the window
+                return None, None
+
+            frames.append((next_frame, end_time, frame_number))
+
+        return start_time, frames
+
+    def __decoder_needs_ahead(self):
+        return not self.decoder_finished and len(self.frame_buffer) - 1 - self.cache_pos < self.window_target
+
+    def __decoder_needs_behind(self):
+        return (not self.decoder_backfill_failed and len(self.frame_buffer) > 0 and self.frame_buffer.frame(0) > 0 and
+                self.cache_pos < self.window_target)
+
+    def __decoder_exhausted(self):
+        # no more frames can be decoded on the direction of playback
+        if self.play_reverse and len(self.frame_buffer) > 0:
+            return self.frame_buffer.frame(0) == 0 or self.decoder_backfill_failed
+
+        return self.decoder_finished
+
+    def __decoder_run(self):
+        while True:
+            with self.decoder_condition:
+                self.decoder_condition.wait_for(lambda: (self.decoder_stopped or self.decoder_seek_frame is not None or
+                                                         self.__decoder_needs_ahead() or self.__decoder_needs_behind()))
+                if self.decoder_stopped:
+                    if self.current_capture is not None:
+                        self.current_capture.release()
+                    return
+
+                seek_frame = self.decoder_seek_frame
+                generation = self.decoder_generation
+
+                # frames on the direction of playback are decoded first
+                backfill = self.__decoder_needs_behind() and (self.play_reverse or not self.__decoder_needs_ahead())
+                if backfill:
+                    first_frame = self.frame_buffer.frame(0)
+                    n_frames = min(OpenCVVideoPlayer.BackfillBlock, self.window_target - self.cache_pos)
+                elif len(self.frame_buffer) > 0:
+                    next_abs_frame = self.frame_buffer.frame(-1) + 1
+                else:
+                    next_abs_frame = None
+
+            if seek_frame is not None:
+                start_time = self.__decoder_seek(seek_frame)
+
+                with self.decoder_condition:
+                    if generation == self.decoder_generation:
+                        self.frame_buffer.clear(start_time)
+                        self.decoder_seek_frame = None
+                        self.decoder_condition.notify_all()
+
+                continue
 
-            if not flag:
-                # failed to get frame from current capture... try opening next ...
-                self.play_video += 1
+            if backfill:
+                self.__decoder_add_previous(generation, first_frame, *self.__decoder_backfill(first_frame, n_frames))
+                continue
 
-                if self.play_video < len(self.video_files):
-                    # open next
-                    self.current_capture = cv2.VideoCapture(self.video_files[self.play_video])
+            # decoding happens without holding the lock
+            if next_abs_frame is not None and next_abs_frame != self.decoder_next_frame:
+                # the capture was moved to fill the window behind the play head
+                self.__decoder_seek(next_abs_frame)
+            next_frame, end_time, frame_number = self.__decoder_read()
 
-                    flag, next_frame = self.current_capture.read()
-                    if self.forced_width is not None and flag:
-                        next_frame = cv2.resize(next_frame, (self.forced_width, self.forced_height))
+            with self.decoder_condition:
+                if generation != self.decoder_generation:
+                    # a seek was requested while decoding, this frame is no longer needed
+                    continue
+
+                if next_frame is None:
+                    self.decoder_finished = True
                 else:
-                    self.end_reached = True
-                    next_frame = None
-                    break
+                    if self.frame_buffer.is_full():
+                        # O(1) eviction of the oldest frame
+                        self.frame_buffer.pop_front()
+                        self.cache_pos -= 1
 
-        if next_frame is not None:
-            # update cache ...
-            last_time = self.current_capture.get(cv2.CAP_PROP_POS_MSEC) + self.video_offsets[self.play_video]
-            frame_number = int(self.current_capture.get(cv2.CAP_PROP_POS_FRAMES)) - 1 + self.frame_offsets[self.play_video]
+                    start_time = self.frame_buffer.time(-1) if len(self.frame_buffer) > 0 else self.frame_buffer.offset
+                    self.frame_buffer.append(next_frame, end_time, frame_number)
 
-            self.cache_times.append(last_time)
-            self.cache_images.append(next_frame)
-            self.cache_frames.append(frame_number)
+                self.decoder_condition.notify_all()
 
-            while len(self.cache_times) > OpenCVVideoPlayer.FrameCache:
-                self.cache_offset = self.cache_times[0]
-                if self.cache_pos > 0:
-                    self.cache_pos -= 1
-                del self.cache_times[0]
-                del self.cache_images[0]
-                del self.cache_frames[0]
-        else:
-            frame_number = self.total_frames
+            if next_frame is not None:
+                self.frame_cache.put((self.cache_owner, frame_number), next_frame, (start_time, end_time))
 
-        return next_frame, frame_number
+    def __decoder_add_previous(self, generation, first_frame, start_time, frames):
+        with self.decoder_condition:
+            if generation != self.decoder_generation:
+                return
 
-    def __frame_in_cache(self, abs_time):
-        if len(self.cache_times) == 0:
-            return False
+            if frames is None:
+                # do not try again until the next seek
+                self.decoder_backfill_failed = True
+                return
+
+            # from the closest to the play head, while there is room (or frames far ahead can be evicted)
+            added = []
+            for idx in range(len(frames) - 1, -1, -1):
+                if self.frame_buffer.is_full():
+                    if len(self.frame_buffer) - 1 - self.cache_pos <= self.window_target:
+                        break
+
+                    self.frame_buffer.pop_back()
+                    self.decoder_finished = False
 
-        return self.cache_offset <= abs_time <= self.cache_times[-1]
+                image, end_time, frame_number = frames[idx]
+                frame_start = frames[idx - 1][1] if idx > 0 else start_time
+                self.frame_buffer.prepend(image, frame_start, end_time, frame_number)
+                self.cache_pos += 1
+                added.append((frame_number, image, (frame_start, end_time)))
+
+            self.decoder_condition.notify_all()
+
+        for frame_number, image, times in added:
+            self.frame_cache.put((self.cache_owner, frame_number), image, times)
+
+    def __frame_in_cache(self, abs_time):
+        return self.frame_buffer.contains_time(abs_time)
 
     def __get_cached_frame(self, abs_time):
         if self.end_reached:
-            if len(self.cache_images) > 0:
-                return self.cache_images[-1], self.cache_frames[-1]
+            # last frame (or first frame if playing backwards)
+            pos = 0 if self.play_reverse else -1
+            if len(self.frame_buffer) > 0:
+                self.cache_pos = pos % len(self.frame_buffer)
+                return self.frame_buffer.image(pos), self.frame_buffer.frame(pos)
             else:
                 return self.black_frame, self.total_frames
 
-        # assume forward movement only
-        while self.cache_times[self.cache_pos] < abs_time:
-            self.cache_pos += 1
+        self.cache_pos = self.frame_buffer.find_time(abs_time)
 
-        return self.cache_images[self.cache_pos], self.cache_frames[self.cache_pos]
+        return self.frame_buffer.image(self.cache_pos), self.frame_buffer.frame(self.cache_pos)
 
     def get_frame(self):
         self.current_time = time.time()
@@ -238,20 +435,41 @@ class OpenCVVideoPlayer(BaseVideoPlayer):
         if self.playing:
             # update last frame ...
             # use milliseconds (just like opencv does)
-            self.play_abs_position += delta * 1000.0
+            if self.play_reverse:
+                self.play_abs_position -= delta * 1000.0
+            else:
+                self.play_abs_position += delta * 1000.0
+
+            with self.decoder_condition:
+                # while desired frame not in cache .... (the decoder is usually ahead)
+                while not self.__frame_in_cache(self.play_abs_position) and not self.end_reached:
+                    if self.decoder_seek_frame is None and self.__decoder_exhausted():
+                        # end of the video reached (or its start, if playing backwards)
+                        self.end_reached = True
+                        break
 
-            # while desired frame not in cache ....
-            while not self.__frame_in_cache(self.play_abs_position) and not self.end_reached:
-                # ... update cache
-                self.__extract_next_frame()
+                    if len(self.frame_buffer) > 0:
+                        # all frames on the cache have been passed, their slots can be re-used
+                        self.cache_pos = 0 if self.play_reverse else len(self.frame_buffer) - 1
+                        self.decoder_condition.notify_all()
 
-            # get frame
-            self.last_frame_img, self.last_frame_idx = self.__get_cached_frame(self.play_abs_position)
-            # print((self.play_abs_position, self.last_frame_idx))
+                    self.decoder_condition.wait()
 
-            if self.frame_changed_callback is not None:
-                if len(self.cache_frames) > 0:
-                    self.frame_changed_callback(int(self.cache_frames[self.cache_pos]), self.cache_times[self.cache_pos])
+                # get frame
+                self.last_frame_img, self.last_frame_idx = self.__get_cached_frame(self.play_abs_position)
+                # print((self.play_abs_position, self.last_frame_idx))
+
+                # the decoder can re-use slots behind the play head
+                self.decoder_condition.notify_all()
+
+                if len(self.frame_buffer) > 0:
+                    current_frame = self.frame_buffer.frame(self.cache_pos)
+                    current_time = self.frame_buffer.time(self.cache_pos)
+                else:
+                    current_frame = None
+
+            if self.frame_changed_callback is not None and current_frame is not None:
+                self.frame_changed_callback(current_frame, current_time)
         else:
             pass
             # print("Not playing")
@@ -273,3 +491,6 @@ class OpenCVVideoPlayer(BaseVideoPlayer):
             self.video_offsets.append(self.video_offsets[-1] + self.video_lengths[idx])
             self.frame_offsets.append(self.frame_offsets[-1] + self.video_frames[idx])
 
+
+# decoder threads must not be running native code while the interpreter shuts down
+atexit.register(OpenCVVideoPlayer.CloseAll)
@@ -0,0 +1,129 @@
+
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedFrameRing:
+    # Fixed number of frame slots on shared memory, used to pass frames to other processes without
+    # pickling them. A frame is written (copied) once into a free slot (publish), and the slot index is
+    # sent instead of the frame. Any process that has the ring (it can be passed as argument of a new
+    # process) gets a zero-copy view of the slot. Each slot has a reference count (also on shared memory):
+    # publish sets the initial references, users of the slot add (retain) or remove (release) references,
+    # and the slot can be written again once nobody references it. Publishing blocks while all slots are in
+    # use, which also limits how far ahead of its consumers the producer can go.
+    DefaultSlots = 8
+
+    def __init__(self, n_slots, frame_shape, dtype=np.uint8):
+        self.n_slots = n_slots
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.slot_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+
+        # frames, followed by the reference count of each slot
+        self.memory = shared_memory.SharedMemory(create=True, size=self.slot_bytes * n_slots + 4 * n_slots)
+        # the memory is removed by the process that created it (forked processes get a copy of this object)
+        self.owner_pid = os.getpid()
+        self.condition = multiprocessing.Condition()
+
+        self.__attach_arrays()
+        self.refs[:] = 0
+
+    def __attach_arrays(self):
+        self.frames = np.ndarray((self.n_slots,) + self.frame_shape, dtype=self.dtype, buffer=self.memory.buf)
+        self.refs = np.ndarray((self.n_slots,), dtype=np.int32, buffer=self.memory.buf,
+                               offset=self.slot_bytes * self.n_slots)
+        # (only on the process that published them) frames copied to each slot
+        self.sources = [None] * self.n_slots
+
+    @staticmethod
+    def ForWorker(video_worker, width, height, channels=3):
+        # ring for the frames given to a worker that can use shared frames (see ProcessVideoWorker),
+        # None if the worker does not use them
+        if not getattr(video_worker, "SharedFrames", False):
+            return None
+
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        ring = SharedFrameRing(SharedFrameRing.DefaultSlots, shape)
+        video_worker.set_frame_ring(ring)
+
+        return ring
+
+    def __getstate__(self):
+        return {"n_slots": self.n_slots, "frame_shape": self.frame_shape, "dtype": self.dtype.str,
+                "name": self.memory.name, "condition": self.condition}
+
+    def __setstate__(self, state):
+        self.n_slots = state["n_slots"]
+        self.frame_shape = state["frame_shape"]
+        self.dtype = np.dtype(state["dtype"])
+        self.slot_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+
+        self.memory = shared_memory.SharedMemory(name=state["name"])
+        self.owner_pid = None
+        self.condition = state["condition"]
+
+        self.__attach_arrays()
+
+    def fits(self, frame):
+        return frame.shape == self.frame_shape and frame.dtype == self.dtype
+
+    def publish(self, frame, refs=1):
+        # copies the frame to a free slot (waits for one) with the given references, returns the slot
+        if not self.fits(frame):
+            raise Exception("SharedFrameRing: Frame of shape " + str(frame.shape) + " does not fit on slots of shape " +
+                            str(self.frame_shape))
+
+        with self.condition:
+            while True:
+                free = np.flatnonzero(self.refs == 0)
+                if free.shape[0] > 0:
+                    slot = int(free[0])
+                    break
+
+                self.condition.wait()
+
+            self.refs[slot] = refs
+
+        # the slot is not used by anyone else
+        self.frames[slot] = frame
+        self.sources[slot] = frame
+
+        return slot
+
+    def retain(self, frame):
+        # adds a reference to the slot where the given frame was published by this process (None if not found)
+        with self.condition:
+            for slot in range(self.n_slots):
+                if self.sources[slot] is frame and self.refs[slot] > 0:
+                    self.refs[slot] += 1
+                    return slot
+
+        return None
+
+    def view(self, slot):
+        return self.frames[slot]
+
+    def release(self, slot):
+        with self.condition:
+            self.refs[slot] -= 1
+            if self.refs[slot] <= 0:
+                self.refs[slot] = 0
+                self.sources[slot] = None
+                self.condition.notify_all()
+
+    def close(self):
+        # views of the slots must not be used after closing
+        self.frames = None
+        self.refs = None
+        self.sources = None
+        try:
+            self.memory.close()
+        except BufferError:
+            # views still referenced somewhere, the memory is released with them
+            pass
+
+        if self.owner_pid == os.getpid():
+            self.memory.unlink()
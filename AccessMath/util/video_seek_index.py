@@ -0,0 +1,134 @@
+
+import os
+import hashlib
+
+import cv2
+import numpy as np
+
+
+class VideoSeekIndex:
+    # Positions of the key-frames (I-frames), time stamps and number of frames of a video file.
+    # The index is built once by reading the packets of the video without decoding them, and it
+    # is stored next to the video file (or on a given directory, so the video directory is not
+    # written). Seeking to a key-frame is fast and exact on any codec, so frames in between can be
+    # reached by decoding forward from the closest key-frame.
+    Extension = ".seek.npz"
+    Version = 1
+
+    def __init__(self, video_file, frame_times, keyframes):
+        self.video_file = video_file
+        # time stamp of each frame (ms), in read order
+        self.frame_times = frame_times
+        # sorted frame indices of the key-frames
+        self.keyframes = keyframes
+
+    def total_frames(self):
+        return self.frame_times.shape[0]
+
+    def keyframe_before(self, frame_idx):
+        # closest key-frame at or before the given frame (frame 0 is always used as key-frame)
+        pos = np.searchsorted(self.keyframes, frame_idx, side='right') - 1
+        if pos < 0:
+            return 0
+
+        return int(self.keyframes[pos])
+
+    @staticmethod
+    def IndexFilename(video_file, index_dir=None):
+        if index_dir is None:
+            return video_file + VideoSeekIndex.Extension
+
+        # (videos of different directories can have the same name) named after the video and its full path
+        path_hash = hashlib.md5(os.path.abspath(video_file).encode("utf-8")).hexdigest()[:12]
+        return "{0:s}/{1:s}.{2:s}{3:s}".format(index_dir, os.path.basename(video_file), path_hash,
+                                               VideoSeekIndex.Extension)
+
+    @staticmethod
+    def SourceInfo(video_file):
+        return os.path.getsize(video_file), os.path.getmtime(video_file)
+
+    @staticmethod
+    def Build(video_file, stop_event=None):
+        # (stop_event: threading.Event that cancels the scan of the packets, returns None)
+        capture = cv2.VideoCapture(video_file)
+        if not capture.isOpened():
+            return None
+
+        # read raw (encoded) packets, requires the FFMPEG back-end
+        if not hasattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME") or not capture.set(cv2.CAP_PROP_FORMAT, -1):
+            capture.release()
+            return None
+
+        frame_times = []
+        keyframes = []
+        while capture.grab():
+            if stop_event is not None and stop_event.is_set():
+                capture.release()
+                return None
+
+            if capture.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) > 0:
+                keyframes.append(len(frame_times))
+            frame_times.append(capture.get(cv2.CAP_PROP_POS_MSEC))
+
+        capture.release()
+
+        if len(frame_times) == 0:
+            return None
+
+        return VideoSeekIndex(video_file, np.array(frame_times, dtype=np.float64), np.array(keyframes, dtype=np.int64))
+
+    def save(self, filename):
+        source_size, source_mtime = VideoSeekIndex.SourceInfo(self.video_file)
+
+        with open(filename, "wb") as out_file:
+            np.savez(out_file, version=VideoSeekIndex.Version, source_size=source_size, source_mtime=source_mtime,
+                     frame_times=self.frame_times, keyframes=self.keyframes)
+
+    @staticmethod
+    def Load(filename, video_file):
+        # returns None if the index is not valid for the current version of the video file
+        source_size, source_mtime = VideoSeekIndex.SourceInfo(video_file)
+
+        with np.load(filename) as data:
+            if (int(data["version"]) != VideoSeekIndex.Version or int(data["source_size"]) != source_size or
+                float(data["source_mtime"]) != source_mtime):
+                return None
+
+            return VideoSeekIndex(video_file, data["frame_times"], data["keyframes"])
+
+    @staticmethod
+    def FromVideoFile(video_file, verbose=False, stop_event=None, index_dir=None, save=True):
+        # loads the index stored next to the video (or on index_dir), or builds (and stores, if save) it
+        index_filename = VideoSeekIndex.IndexFilename(video_file, index_dir)
+        if os.path.exists(index_filename):
+            try:
+                index = VideoSeekIndex.Load(index_filename, video_file)
+            except Exception as e:
+                print("Invalid seek index <" + index_filename + ">: " + str(e))
+                index = None
+
+            if index is not None:
+                return index
+
+        index = VideoSeekIndex.Build(video_file, stop_event)
+        if index is None:
+            if verbose:
+                print("Seek index not available for: " + video_file)
+            return None
+
+        if not save:
+            return index
+
+        try:
+            if index_dir is not None:
+                os.makedirs(index_dir, exist_ok=True)
+            index.save(index_filename)
+        except OSError as e:
+            # the index is still used for this session
+            print("Could not save seek index <" + index_filename + ">: " + str(e))
+
+        if verbose:
+            print("Seek index created for {0:s} ({1:d} frames, {2:d} key-frames)".format(
+                video_file, index.total_frames(), index.keyframes.shape[0]))
+
+        return index
@@ -0,0 +1,77 @@
+import os
+import sys
+
+from AccessMath.annotation.video_object_exporter import VideoObjectExporter
+from AccessMath.preprocessing.user_interface.console_ui_process import ConsoleUIProcess
+
+
+def get_annotation_files(process):
+    if "a" in process.params:
+        # annotation files given directly
+        annotation_files = process.params["a"]
+        if not isinstance(annotation_files, list):
+            annotation_files = [annotation_files]
+
+        return annotation_files
+
+    # otherwise, use the annotation files of the selected lectures on the database
+    output_dir = process.configuration.get_str("OUTPUT_PATH")
+    annotations_prefix = output_dir + "/" + process.database.output_annotations + "/" + process.database.name + "_"
+
+    annotation_files = []
+    for lecture in process.database.lectures:
+        _, _, skip = process.get_lecture_params(lecture)
+        if skip:
+            continue
+
+        annotation_filename = annotations_prefix + lecture.title.lower() + ".xml"
+        if os.path.exists(annotation_filename):
+            annotation_files.append(annotation_filename)
+        else:
+            print("Annotation file not found: " + annotation_filename)
+
+    return annotation_files
+
+
+def main():
+    # usage check
+    if len(sys.argv) < 2:
+        print("Usage: python gt_export_objects.py config [options]")
+        print("Where")
+        print("\tconfig\t= AccessMath Configuration File")
+        print("")
+        print("Options")
+        print("\t-l [lecture]\t: Process only the specified lecture(s)")
+        print("\t-d [dataset_name(s)]\t: Process only the specified dataset(s)")
+        print("\t-a [annotation file(s)]\t: Export the given annotation file(s) instead of database lectures")
+        print("\t-objects [pattern(s)]\t: Export only the objects matching the given pattern(s) (e.g. \"board_*\")")
+        print("\t-format [csv|npz|parquet]\t: Output format (default: csv)")
+        print("\t-out [directory]\t: Output directory (default: next to each annotation file)")
+        print("\t-workers [n]\t: Number of processes (default: number of CPUs)")
+        return
+
+    process = ConsoleUIProcess.FromConfigPath(sys.argv[1], sys.argv[2:], None, None)
+    if not process.initialize():
+        return
+
+    object_patterns = process.params.get("objects")
+    if object_patterns is not None and not isinstance(object_patterns, list):
+        object_patterns = [object_patterns]
+
+    export_format = process.params.get("format", "csv")
+    output_dir = process.params.get("out")
+    workers = int(process.params["workers"]) if "workers" in process.params else None
+
+    annotation_files = get_annotation_files(process)
+    if len(annotation_files) == 0:
+        print("No annotation files to export")
+        return
+
+    exporter = VideoObjectExporter(export_format, output_dir, workers, object_patterns)
+    exporter.export(annotation_files)
+
+    print("Finished")
+
+
+if __name__ == "__main__":
+    main()
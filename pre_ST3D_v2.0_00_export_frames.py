@@ -27,7 +27,11 @@ def get_worker(process):
     
     export_dir = frame_export_dir + "/" + process.current_lecture.title + "/JPEGImages"
     
-    frame_exporter = FrameExporter(export_dir, img_extension=frame_export_format, img_quality=frame_export_quality)
+    # images are saved by writer threads while the next frames are decoded (default: one per core)
+    frame_export_writers = process.configuration.get("OUTPUT_FRAME_EXPORT_WRITERS")
+
+    frame_exporter = FrameExporter(export_dir, img_extension=frame_export_format, img_quality=frame_export_quality,
+                                   writers=frame_export_writers)
     return frame_exporter
 
 def main():
@@ -40,7 +44,11 @@ def main():
         return
     
     fps = process.configuration.get_float("FRAME_EXPORT_FPS")
-    process.start_video_processing(fps, get_worker, None, 0, True, True)
+    # number of lectures exported concurrently
+    workers = process.configuration.get_int("FRAME_EXPORT_WORKERS", 1)
+    # number of processes decoding each video
+    decode_workers = process.configuration.get_int("FRAME_EXPORT_DECODE_WORKERS", 1)
+    process.start_video_processing(fps, get_worker, None, 0, True, True, workers, decode_workers)
 
     print("Finished")
 